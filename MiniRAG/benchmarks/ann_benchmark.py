@@ -0,0 +1,155 @@
+"""Recall/latency benchmark for the IVF index of the local vector storages.
+
+Indexes synthetic clustered vectors, then compares exact search with IVF
+search at several nprobe settings. ``--storage nano`` runs it on the
+default NanoVectorDBStorage instead of NumpyVectorDBStorage. With the numpy
+storage, ``--quantization int8`` or ``--prefilter-dim N`` shortlist on int8
+codes or on the first N dimensions:
+
+    python benchmarks/ann_benchmark.py --rows 200000 --dim 384
+    python benchmarks/ann_benchmark.py --storage nano --rows 200000 --dim 384
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from minirag.kg.nano_vector_db_impl import NanoVectorDBStorage  # noqa: E402
+from minirag.kg.numpy_vector_impl import NumpyVectorDBStorage  # noqa: E402
+from minirag.utils import EmbeddingFunc  # noqa: E402
+
+
+def make_vectors(
+    rows: int,
+    dim: int,
+    clusters: int,
+    noise: float,
+    matryoshka: bool = False,
+    seed: int = 0,
+) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, rows)
+    vectors = centers[labels] + noise * rng.standard_normal((rows, dim)).astype(
+        np.float32
+    )
+    if matryoshka:
+        # Matryoshka-trained models concentrate information in leading dims
+        vectors *= 1 / np.sqrt(1 + np.arange(dim, dtype=np.float32) / 16)
+    return vectors
+
+
+async def run(args):
+    vectors = make_vectors(
+        args.rows + args.queries,
+        args.dim,
+        args.clusters,
+        args.noise,
+        matryoshka=args.prefilter_dim is not None,
+    )
+    data_vectors, query_vectors = vectors[: args.rows], vectors[args.rows :]
+
+    async def embed(texts):
+        # contents are "d<row>" for data and "q<row>" for queries
+        return np.stack(
+            [
+                data_vectors[int(t[1:])] if t[0] == "d" else query_vectors[int(t[1:])]
+                for t in texts
+            ]
+        )
+
+    storage_kwargs = {
+        "cosine_better_than_threshold": -1.0,
+        "ann_index": "ivf",
+        "ann_min_rows": 0,
+    }
+    if args.storage == "numpy":
+        storage_cls = NumpyVectorDBStorage
+        storage_kwargs.update(
+            quantization=args.quantization,
+            prefilter_dim=args.prefilter_dim,
+            rerank_factor=args.rerank_factor,
+        )
+    else:
+        storage_cls = NanoVectorDBStorage
+    with tempfile.TemporaryDirectory() as working_dir:
+        global_config = {
+            "working_dir": working_dir,
+            "embedding_batch_num": 4096,
+            "vector_db_storage_cls_kwargs": storage_kwargs,
+        }
+        storage = storage_cls(
+            namespace="bench",
+            global_config=global_config,
+            embedding_func=EmbeddingFunc(args.dim, 8192, embed),
+        )
+        start = time.perf_counter()
+        for begin in range(0, args.rows, 50000):
+            await storage.upsert(
+                {
+                    f"id-{i}": {"content": f"d{i}"}
+                    for i in range(begin, min(begin + 50000, args.rows))
+                }
+            )
+        print(f"upsert: {args.rows / (time.perf_counter() - start):.0f} rows/s")
+        start = time.perf_counter()
+        await storage.index_done_callback()
+        print(f"ivf training: {time.perf_counter() - start:.2f}s")
+
+        ivf = storage._ivf
+        storage._ivf = None
+        coarse = getattr(storage, "_coarse", None)
+        storage._coarse = None
+        exact, exact_ms = await search_all(storage, args)
+        print(f"exact      {exact_ms:8.3f} ms/query  recall@{args.top_k} 1.000")
+        if coarse is not None:
+            storage._coarse = coarse
+            found, ms = await search_all(storage, args)
+            print(
+                f"coarse     {ms:8.3f} ms/query  "
+                f"recall@{args.top_k} {recall(found, exact):.3f}"
+            )
+        storage._ivf = ivf
+        for nprobe in args.nprobe:
+            storage.ann_nprobe = nprobe
+            found, ms = await search_all(storage, args)
+            print(
+                f"ivf np={nprobe:<4d}{ms:8.3f} ms/query  "
+                f"recall@{args.top_k} {recall(found, exact):.3f}"
+            )
+
+
+def recall(found: list[list[str]], exact: list[list[str]]) -> float:
+    return float(np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, exact)]))
+
+
+async def search_all(storage, args):
+    results, start = [], time.perf_counter()
+    for i in range(args.queries):
+        hits = await storage.query(f"q{i}", top_k=args.top_k)
+        results.append([h["id"] for h in hits])
+    return results, (time.perf_counter() - start) * 1000 / args.queries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--storage", choices=["numpy", "nano"], default="numpy")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=50)
+    # noise relative to the cluster spread; higher is harder for IVF
+    parser.add_argument("--noise", type=float, default=3.0)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32, 64])
+    parser.add_argument("--quantization", choices=["int8"], default=None)
+    parser.add_argument("--prefilter-dim", type=int, default=None)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,145 @@
+"""Upsert throughput benchmark for PGVectorStorage.
+
+Writes synthetic chunk rows to LIGHTRAG_DOC_CHUNKS the old way (one
+round-trip per row, text vectors), with executemany (text vectors) and
+with binary COPY into a staging table, then times vector queries with
+text and binary vector parameters. Start a local Postgres with pgvector
+first:
+
+    docker run -d -p 5432:5432 -e POSTGRES_PASSWORD=postgres pgvector/pgvector:pg16
+    python benchmarks/pg_upsert_benchmark.py --rows 20000 --dim 768
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from minirag.kg.postgres_impl import (  # noqa: E402
+    SQL_TEMPLATES,
+    PGVectorStorage,
+    PostgreSQLDB,
+)
+from minirag.utils import EmbeddingFunc  # noqa: E402
+
+
+def make_rows(storage: PGVectorStorage, rows: int, dim: int, seed: int) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((rows, dim)).astype(np.float32)
+    return [
+        storage._upsert_chunks(
+            {
+                "__id__": f"chunk-{seed}-{i}",
+                "tokens": 1200,
+                "chunk_order_index": i,
+                "full_doc_id": f"doc-{i // 100}",
+                "content": f"synthetic chunk {i} " * 40,
+                "__vector__": vectors[i],
+            }
+        )[1]
+        for i in range(rows)
+    ]
+
+
+async def time_upsert(name: str, write, rows: list[dict], batch: int):
+    start = time.perf_counter()
+    for i in range(0, len(rows), batch):
+        await write(rows[i : i + batch])
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24}{len(rows) / elapsed:10.0f} rows/s")
+
+
+async def time_queries(name: str, storage: PGVectorStorage, queries: int):
+    start = time.perf_counter()
+    for i in range(queries):
+        await storage.query(f"q{i}", top_k=10)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24}{elapsed * 1000 / queries:10.2f} ms/query")
+
+
+async def run(args):
+    config = {
+        "host": args.host,
+        "port": args.port,
+        "user": args.user,
+        "password": args.password,
+        "database": args.database,
+        "workspace": "upsert_benchmark",
+    }
+    db = PostgreSQLDB(config)
+    await db.initdb()
+    await db.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    # switches the pool to the binary codec now that the extension exists
+    await db.check_tables()
+    if not db.vector_codec:
+        raise SystemExit("pgvector binary codec could not be registered")
+    # same database without the binary codec, for the text baselines
+    text_db = PostgreSQLDB({**config, "binary_vectors": False})
+    await text_db.initdb()
+
+    rng = np.random.default_rng(1)
+
+    async def embed(texts):
+        return rng.standard_normal((len(texts), args.dim)).astype(np.float32)
+
+    def make_storage(storage_db: PostgreSQLDB) -> PGVectorStorage:
+        return PGVectorStorage(
+            namespace="chunks",
+            global_config={"embedding_batch_num": 32},
+            embedding_func=EmbeddingFunc(args.dim, 8192, embed),
+            db=storage_db,
+        )
+
+    text_storage, binary_storage = make_storage(text_db), make_storage(db)
+    clear_sql = "DELETE FROM LIGHTRAG_DOC_CHUNKS WHERE workspace=$1"
+    await db.execute(clear_sql, {"workspace": db.workspace})
+    try:
+        rows = make_rows(text_storage, args.rows, args.dim, seed=0)
+
+        async def per_row(batch):
+            for row in batch:
+                await text_db.execute(SQL_TEMPLATES["upsert_chunk"], row)
+
+        await time_upsert("row by row (text)", per_row, rows[: args.row_limit], 1)
+        rows = make_rows(text_storage, args.rows, args.dim, seed=1)
+        await time_upsert(
+            "executemany (text)",
+            lambda batch: text_db.executemany(SQL_TEMPLATES["upsert_chunk"], batch),
+            rows,
+            args.batch,
+        )
+        rows = make_rows(binary_storage, args.rows, args.dim, seed=2)
+        await time_upsert(
+            "copy (binary)",
+            lambda batch: db.copy_upsert("LIGHTRAG_DOC_CHUNKS", batch),
+            rows,
+            args.batch,
+        )
+        await time_queries("query (text)", text_storage, args.queries)
+        await time_queries("query (binary)", binary_storage, args.queries)
+    finally:
+        await db.execute(clear_sql, {"workspace": db.workspace})
+        await text_db.pool.close()
+        await db.pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5432)
+    parser.add_argument("--user", default="postgres")
+    parser.add_argument("--password", default="postgres")
+    parser.add_argument("--database", default="postgres")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    # rows per upsert call, like one embedding_func batch set of a document
+    parser.add_argument("--batch", type=int, default=1000)
+    # the row-by-row baseline is slow; only time this many rows of it
+    parser.add_argument("--row-limit", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=100)
+    asyncio.run(run(parser.parse_args()))
@@ -30,7 +30,11 @@ from typing import List, Dict, Any, Optional, Union
 from minirag import MiniRAG, QueryParam
 from minirag.api import __api_version__
 
-from minirag.utils import EmbeddingFunc
+from minirag.utils import (
+    EmbeddingFunc,
+    encode_string_by_tiktoken,
+    warm_tiktoken_encoders,
+)
 from enum import Enum
 from pathlib import Path
 import shutil
@@ -53,18 +57,8 @@ load_dotenv()
 
 
 def estimate_tokens(text: str) -> int:
-    """Estimate the number of tokens in text
-    Chinese characters: approximately 1.5 tokens per character
-    English characters: approximately 0.25 tokens per character
-    """
-    # Use regex to match Chinese and non-Chinese characters separately
-    chinese_chars = len(re.findall(r"[\u4e00-\u9fff]", text))
-    non_chinese_chars = len(re.findall(r"[^\u4e00-\u9fff]", text))
-
-    # Calculate estimated token count
-    tokens = chinese_chars * 1.5 + non_chinese_chars * 0.25
-
-    return int(tokens)
+    """Count the tokens in text with the shared tiktoken encoder registry"""
+    return len(encode_string_by_tiktoken(text))
 
 
 class OllamaServerInfos:
@@ -664,10 +658,15 @@ class QueryRequest(BaseModel):
     mode: SearchMode = SearchMode.light
     stream: bool = False
     only_need_context: bool = False
+    structured_context: bool = False
+    profile: bool = False
+    deadline_ms: Optional[int] = None
 
 
 class QueryResponse(BaseModel):
-    response: str
+    response: Union[str, Dict[str, Any]]
+    profile: Optional[Dict[str, Any]] = None
+    degraded: Optional[bool] = None
 
 
 class InsertTextRequest(BaseModel):
@@ -707,6 +706,9 @@ def get_api_key_dependency(api_key: Optional[str]):
 
 
 def create_app(args):
+    # Load the tokenizer used for usage accounting before the first request
+    warm_tiktoken_encoders("gpt-4o")
+
     # Verify that bindings are correctly setup
     if args.llm_binding not in [
         "lollms",
@@ -1116,6 +1118,9 @@ def create_app(args):
                 - mode (ModeEnum): Optional. Specifies the mode of retrieval augmentation.
                 - stream (bool): Optional. Determines if the response should be streamed.
                 - only_need_context (bool): Optional. If true, returns only the context without further processing.
+                - structured_context (bool): Optional. With only_need_context, returns entity/relation/chunk rows instead of text.
+                - profile (bool): Optional. If true, per-stage timings are returned alongside the response.
+                - deadline_ms (int): Optional. Latency budget; graph retrieval falls back to naive retrieval when it runs over.
 
         Returns:
             QueryResponse: A Pydantic model containing the result of the query processing.
@@ -1133,25 +1138,39 @@ def create_app(args):
                     mode=request.mode,
                     stream=request.stream,
                     only_need_context=request.only_need_context,
+                    structured_context=request.structured_context,
                     top_k=args.top_k,
+                    profile=request.profile,
+                    deadline_ms=request.deadline_ms,
                 ),
             )
 
-            # If response is a string (e.g. cache hit), return directly
-            if isinstance(response, str):
-                return QueryResponse(response=response)
+            profile = degraded = None
+            if request.profile or request.deadline_ms is not None:
+                profile, degraded = response.get("profile"), response.get("degraded")
+                response = response["response"]
+
+            # If response is a string (e.g. cache hit) or structured context, return directly
+            if isinstance(response, (str, dict)):
+                return QueryResponse(
+                    response=response, profile=profile, degraded=degraded
+                )
 
             # If it's an async generator, decide whether to stream based on stream parameter
             if request.stream:
                 result = ""
                 async for chunk in response:
                     result += chunk
-                return QueryResponse(response=result)
+                return QueryResponse(
+                    response=result, profile=profile, degraded=degraded
+                )
             else:
                 result = ""
                 async for chunk in response:
                     result += chunk
-                return QueryResponse(response=result)
+                return QueryResponse(
+                    response=result, profile=profile, degraded=degraded
+                )
         except Exception as e:
             trace_exception(e)
             raise HTTPException(status_code=500, detail=str(e))
@@ -1176,12 +1195,18 @@ def create_app(args):
                     stream=True,
                     only_need_context=request.only_need_context,
                     top_k=args.top_k,
+                    deadline_ms=request.deadline_ms,
                 ),
             )
+            degraded = None
+            if request.deadline_ms is not None:
+                response, degraded = response["response"], response["degraded"]
 
             from fastapi.responses import StreamingResponse
 
             async def stream_generator():
+                if degraded is not None:
+                    yield f"{json.dumps({'degraded': degraded})}\n"
                 if isinstance(response, str):
                     # If it's a string, send it all at once
                     yield f"{json.dumps({'response': response})}\n"
@@ -1650,6 +1675,7 @@ def create_app(args):
                         "Access-Control-Allow-Origin": "*",
                         "Access-Control-Allow-Methods": "POST, OPTIONS",
                         "Access-Control-Allow-Headers": "Content-Type",
+                        "X-Accel-Buffering": "no",  # Disable Nginx buffering
                     },
                 )
             else:
@@ -1823,6 +1849,7 @@ def create_app(args):
                         "Access-Control-Allow-Origin": "*",
                         "Access-Control-Allow-Methods": "POST, OPTIONS",
                         "Access-Control-Allow-Headers": "Content-Type",
+                        "X-Accel-Buffering": "no",  # Disable Nginx buffering
                     },
                 )
             else:
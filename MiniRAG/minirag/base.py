@@ -1,9 +1,11 @@
+import asyncio
 from abc import abstractmethod
 from dataclasses import dataclass, field
 from enum import Enum
 from typing import Any, TypedDict, Optional, Union, Literal, Generic, TypeVar
 import os
 import numpy as np
+from .prompt import GRAPH_FIELD_SEP
 from .utils import EmbeddingFunc
 
 TextChunkSchema = TypedDict(
@@ -14,10 +16,51 @@ TextChunkSchema = TypedDict(
 T = TypeVar("T")
 
 
+def split_graph_field(value: str) -> list[str]:
+    """Split a GRAPH_FIELD_SEP-joined node/edge field, dropping empty parts."""
+    parts = (part.strip() for part in value.split(GRAPH_FIELD_SEP))
+    return [part for part in parts if part]
+
+
+# Metadata filter for BaseVectorStorage.query/query_many: {meta_field: value}
+# or {meta_field: [accepted values]}; a row must match every field.
+VectorFilter = dict[str, Any]
+
+
+def filter_values(value: Any) -> list:
+    """Accepted values of one VectorFilter field"""
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return list(value)
+    return [value]
+
+
+def check_filter_fields(filter: Optional[VectorFilter], fields, namespace: str):
+    """Raise ValueError if filter uses fields the storage cannot evaluate"""
+    unknown = set(filter or ()) - set(fields)
+    if unknown:
+        raise ValueError(
+            f"Cannot filter {namespace} on {sorted(unknown)}, "
+            f"filterable fields are {sorted(fields)}"
+        )
+
+
+def matches_filter(meta: dict, filter: Optional[VectorFilter]) -> bool:
+    """Evaluate a VectorFilter against a row's meta fields"""
+    if not filter:
+        return True
+    return all(
+        field_name in meta and meta[field_name] in filter_values(value)
+        for field_name, value in filter.items()
+    )
+
+
 @dataclass
 class QueryParam:
     mode: Literal["light", "naive", "mini"] = "mini"
     only_need_context: bool = False
+    # With only_need_context, return {"entities", "relations", "chunks"} rows
+    # (with their scores/ranks) instead of the CSV prompt text.
+    structured_context: bool = False
     only_need_prompt: bool = False
     response_type: str = "Multiple Paragraphs"
     stream: bool = False
@@ -43,6 +86,17 @@ class QueryParam:
     history_turns: int = (
         3  # Number of complete conversation turns (user-assistant pairs) to consider
     )
+    # Record per-stage timings and item counts; aquery then returns
+    # {"response": ..., "profile": {...}} instead of the bare response.
+    profile: bool = False
+    # Number of chunks kept after cross-encoder reranking; only used when
+    # MiniRAG.rerank_func is set.
+    rerank_top_n: int = 5
+    # Latency budget for the whole query in milliseconds. Graph retrieval in
+    # "mini" and "light" mode gets MiniRAG.deadline_graph_share of it and is
+    # cancelled in favour of naive chunk retrieval when it runs over; aquery
+    # then returns {"response": ..., "degraded": bool}.
+    deadline_ms: Optional[int] = None
 
 
 @dataclass
@@ -64,7 +118,32 @@ class BaseVectorStorage(StorageNameSpace):
     embedding_func: EmbeddingFunc
     meta_fields: set = field(default_factory=set)
 
-    async def query(self, query: str, top_k: int) -> list[dict]:
+    async def query(
+        self, query: str, top_k: int, filter: Optional[VectorFilter] = None
+    ) -> list[dict]:
+        """Return the top_k closest rows, restricted to rows matching filter.
+
+        The filter is applied before the top-k cut, so up to top_k matching
+        rows are returned however selective it is.
+        """
+        raise NotImplementedError
+
+    async def query_many(
+        self, queries: list[str], top_k: int, filter: Optional[VectorFilter] = None
+    ) -> list[list[dict]]:
+        """query() for several queries; backends override this to batch them"""
+        return list(
+            await asyncio.gather(
+                *[self.query(query, top_k, filter=filter) for query in queries]
+            )
+        )
+
+    async def delete(self, ids: list[str]):
+        raise NotImplementedError
+
+    async def delete_entities_cascade(self, entity_names: list[str]):
+        """Delete every relation vector whose src_id or tgt_id is one of
+        entity_names, in a single pass over the storage"""
         raise NotImplementedError
 
     async def upsert(self, data: dict[str, dict]):
@@ -74,6 +153,24 @@ class BaseVectorStorage(StorageNameSpace):
         raise NotImplementedError
 
 
+@dataclass
+class BaseLexicalStorage(StorageNameSpace):
+    async def query(self, query: str, top_k: int) -> list[dict]:
+        """Return up to top_k {"id", "score"} matches, best first"""
+        raise NotImplementedError
+
+    async def upsert(self, data: dict[str, dict]):
+        """Index the 'content' field of each value, use key as id"""
+        raise NotImplementedError
+
+    async def delete(self, ids: list[str]):
+        raise NotImplementedError
+
+    async def is_empty(self) -> bool:
+        """True when nothing is indexed, e.g. lexical search was just enabled"""
+        raise NotImplementedError
+
+
 @dataclass
 class BaseKVStorage(Generic[T], StorageNameSpace):
     embedding_func: EmbeddingFunc
@@ -133,6 +230,22 @@ class BaseGraphStorage(StorageNameSpace):
     ) -> Union[list[tuple[str, str]], None]:
         raise NotImplementedError
 
+    async def get_node_chunk_ids(self, node_id: str) -> list[str]:
+        """Chunk ids recorded in a node's source_id, in stored order."""
+        node = await self.get_node(node_id)
+        if node is None or "source_id" not in node:
+            return []
+        return split_graph_field(node["source_id"])
+
+    async def get_edge_chunk_ids(
+        self, source_node_id: str, target_node_id: str
+    ) -> list[str]:
+        """Chunk ids recorded in an edge's source_id, in stored order."""
+        edge = await self.get_edge(source_node_id, target_node_id)
+        if edge is None or "source_id" not in edge:
+            return []
+        return split_graph_field(edge["source_id"])
+
     async def upsert_node(self, node_id: str, node_data: dict[str, str]):
         raise NotImplementedError
 
@@ -0,0 +1,178 @@
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+
+from minirag.utils import (
+    logger,
+    load_json,
+    write_json,
+)
+
+from minirag.base import (
+    BaseLexicalStorage,
+)
+
+# Hiragana/katakana, CJK ideographs (incl. extension A and compatibility) and Hangul
+_CJK_CHARS = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_CJK_RUN = re.compile(f"[{_CJK_CHARS}]+")
+_TOKEN = re.compile(f"[{_CJK_CHARS}]+|[^\\W{_CJK_CHARS}]+")
+
+
+def bm25_tokenize(text: str) -> list[str]:
+    """Lower-cased word tokens; CJK runs, which have no spaces, become character bigrams."""
+    tokens = []
+    for run in _TOKEN.findall(text.lower()):
+        if len(run) > 1 and _CJK_RUN.fullmatch(run):
+            tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+@dataclass
+class JsonBM25Storage(BaseLexicalStorage):
+    """BM25 index persisted as a JSON snapshot plus an append-only log.
+
+    ``bm25_{namespace}.json`` holds {id: {term: tf}}; ``index_done_callback``
+    appends the term frequencies of ids changed since the last save (None
+    for deleted ids) to ``bm25_{namespace}.log.jsonl`` and rewrites the
+    snapshot only once the log grows past ``log_fold_ratio`` of it (and
+    ``log_fold_min_bytes``). The inverted index is rebuilt on load.
+    """
+
+    k1: float = 1.5
+    b: float = 0.75
+    log_fold_ratio: float = 0.5
+    log_fold_min_bytes: int = 4 * 2**20
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self._file_name = os.path.join(working_dir, f"bm25_{self.namespace}.json")
+        self._log_file_name = os.path.join(
+            working_dir, f"bm25_{self.namespace}.log.jsonl"
+        )
+        self._data: dict[str, dict[str, int]] = load_json(self._file_name) or {}
+        self._replay_log()
+        # ids upserted or deleted since the last save
+        self._dirty: set[str] = set()
+        self._postings: dict[str, dict[str, int]] = {}
+        self._doc_lens: dict[str, int] = {}
+        self._total_len = 0
+        for id_, term_freqs in self._data.items():
+            self._add_to_index(id_, term_freqs)
+        logger.info(f"Load BM25 {self.namespace} with {len(self._data)} data")
+
+    def _replay_log(self):
+        if not os.path.exists(self._log_file_name):
+            return
+        with open(self._log_file_name, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # torn write at the tail of the log
+                    logger.warning(
+                        f"Skipping corrupt log entry in {self._log_file_name}"
+                    )
+                    continue
+                if entry["tf"] is None:
+                    self._data.pop(entry["id"], None)
+                else:
+                    self._data[entry["id"]] = entry["tf"]
+
+    def _append_log(self, lines: list[str]):
+        with open(self._log_file_name, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_snapshot(self):
+        tmp_file_name = self._file_name + ".tmp"
+        write_json(self._data, tmp_file_name)
+        os.replace(tmp_file_name, self._file_name)
+        # replaying the log over the new snapshot is harmless, so a crash
+        # before this removal loses nothing
+        os.remove(self._log_file_name)
+
+    async def is_empty(self) -> bool:
+        return not self._data
+
+    def _add_to_index(self, id_: str, term_freqs: dict[str, int]):
+        for term, tf in term_freqs.items():
+            self._postings.setdefault(term, {})[id_] = tf
+        doc_len = sum(term_freqs.values())
+        self._doc_lens[id_] = doc_len
+        self._total_len += doc_len
+
+    def _remove_from_index(self, id_: str):
+        for term in self._data[id_]:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(id_, None)
+            if not postings:
+                del self._postings[term]
+        self._total_len -= self._doc_lens.pop(id_, 0)
+
+    async def index_done_callback(self):
+        if self._dirty:
+            self._append_log(
+                [
+                    json.dumps(
+                        {"id": id_, "tf": self._data.get(id_)}, ensure_ascii=False
+                    )
+                    + "\n"
+                    for id_ in self._dirty
+                ]
+            )
+            self._dirty = set()
+        if not os.path.exists(self._log_file_name):
+            return
+        snapshot_size = (
+            os.path.getsize(self._file_name) if os.path.exists(self._file_name) else 0
+        )
+        if os.path.getsize(self._log_file_name) >= max(
+            self.log_fold_min_bytes, self.log_fold_ratio * snapshot_size
+        ):
+            self._write_snapshot()
+
+    async def upsert(self, data: dict[str, dict]):
+        for id_, value in data.items():
+            if id_ in self._data:
+                self._remove_from_index(id_)
+            term_freqs = dict(Counter(bm25_tokenize(value["content"])))
+            self._data[id_] = term_freqs
+            self._add_to_index(id_, term_freqs)
+            self._dirty.add(id_)
+        return data
+
+    async def delete(self, ids: list[str]):
+        for id_ in ids:
+            if id_ in self._data:
+                self._remove_from_index(id_)
+                del self._data[id_]
+                self._dirty.add(id_)
+
+    async def query(self, query: str, top_k: int) -> list[dict]:
+        num_docs = len(self._doc_lens)
+        if not num_docs:
+            return []
+        avg_len = self._total_len / num_docs or 1.0
+        scores: dict[str, float] = {}
+        for term in set(bm25_tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+            for id_, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._doc_lens[id_] / avg_len)
+                scores[id_] = scores.get(id_, 0.0) + idf * tf * (self.k1 + 1) / (
+                    tf + norm
+                )
+        best = heapq.nlargest(top_k, scores.items(), key=lambda x: x[1])
+        return [{"id": id_, "score": score} for id_, score in best]
@@ -1,15 +1,22 @@
 import os
-import asyncio
 from dataclasses import dataclass
 from typing import Union
-import numpy as np
 from chromadb import HttpClient
 from chromadb.config import Settings
-from minirag.base import BaseVectorStorage
-from minirag.utils import logger
+from minirag.base import (
+    BaseVectorStorage,
+    VectorFilter,
+    check_filter_fields,
+    filter_values,
+)
+from minirag.utils import ClientThreadPools, embed_in_batches, logger
 from minirag.utils import merge_tuples
 import copy
 
+# HttpClient blocks; its calls run in dedicated threads, with bulk upserts
+# on their own pool so queries keep their latency during ingestion
+_client_pools = ClientThreadPools("chroma")
+
 
 @dataclass
 class ChromaVectorDBStorage(BaseVectorStorage):
@@ -87,6 +94,8 @@ class ChromaVectorDBStorage(BaseVectorStorage):
             self._max_batch_size = self.global_config.get(
                 "embedding_batch_num", collection_settings.get("hnsw:batch_size", 32)
             )
+            # rows per upsert request, up to the server's limit
+            self._upsert_batch_size = self._client.get_max_batch_size()
         except Exception as e:
             logger.error(f"ChromaDB initialization failed: {str(e)}")
             raise
@@ -105,71 +114,101 @@ class ChromaVectorDBStorage(BaseVectorStorage):
                 for item in data.values()
             ]
 
-            # Process in batches
-            batches = [
-                documents[i : i + self._max_batch_size]
-                for i in range(0, len(documents), self._max_batch_size)
-            ]
-
-            embedding_tasks = [self.embedding_func(batch) for batch in batches]
-            embeddings_list = []
-
-            # Pre-allocate embeddings_list with known size
-            embeddings_list = [None] * len(embedding_tasks)
-
-            # Use asyncio.gather instead of as_completed if order doesn't matter
-            embeddings_results = await asyncio.gather(*embedding_tasks)
-            embeddings_list = list(embeddings_results)
-
-            embeddings = np.concatenate(embeddings_list)
-
-            # Upsert in batches
-            for i in range(0, len(ids), self._max_batch_size):
-                batch_slice = slice(i, i + self._max_batch_size)
-
-                self._collection.upsert(
-                    ids=ids[batch_slice],
-                    embeddings=embeddings[batch_slice].tolist(),
-                    documents=documents[batch_slice],
-                    metadatas=metadatas[batch_slice],
-                )
+            embeddings = await embed_in_batches(
+                self.embedding_func, documents, self._max_batch_size, self.global_config
+            )
 
+            await _client_pools.write(
+                self._bulk_upsert, ids, embeddings, documents, metadatas
+            )
             return ids
 
         except Exception as e:
             logger.error(f"Error during ChromaDB upsert: {str(e)}")
             raise
 
-    async def query(self, query: str, top_k=5) -> Union[dict, list[dict]]:
-        try:
-            embedding = await self.embedding_func([query])
+    def _bulk_upsert(self, ids, embeddings, documents, metadatas):
+        for i in range(0, len(ids), self._upsert_batch_size):
+            batch_slice = slice(i, i + self._upsert_batch_size)
 
-            results = self._collection.query(
-                query_embeddings=embedding.tolist(),
-                n_results=top_k * 2,  # Request more results to allow for filtering
+            self._collection.upsert(
+                ids=ids[batch_slice],
+                embeddings=embeddings[batch_slice].tolist(),
+                documents=documents[batch_slice],
+                metadatas=metadatas[batch_slice],
+            )
+
+    def _where(self, filter: VectorFilter) -> Union[dict, None]:
+        """ChromaDB metadata where clause for a filter"""
+        check_filter_fields(filter, self.meta_fields, self.namespace)
+        conditions = [
+            {field_name: {"$in": filter_values(value)}}
+            for field_name, value in (filter or {}).items()
+        ]
+        if len(conditions) > 1:
+            return {"$and": conditions}
+        return conditions[0] if conditions else None
+
+    async def query(
+        self, query: str, top_k=5, filter: VectorFilter = None
+    ) -> Union[dict, list[dict]]:
+        return (await self.query_many([query], top_k, filter=filter))[0]
+
+    async def query_many(
+        self, queries: list[str], top_k=5, filter: VectorFilter = None
+    ) -> list[list[dict]]:
+        try:
+            embeddings = await self.embedding_func(queries)
+
+            # the where clause is applied inside the HNSW search, so top_k
+            # matching rows come back without over-fetching
+            results = await _client_pools.read(
+                self._collection.query,
+                query_embeddings=embeddings.tolist(),
+                n_results=top_k,
+                where=self._where(filter),
                 include=["metadatas", "distances", "documents"],
             )
 
-            # Filter results by cosine similarity threshold and take top k
-            # We request 2x results initially to have enough after filtering
-            # ChromaDB returns cosine similarity (1 = identical, 0 = orthogonal)
-            # We convert to distance (0 = identical, 1 = orthogonal) via (1 - similarity)
-            # Only keep results with distance below threshold, then take top k
+            # ChromaDB returns cosine distance (0 = identical, 1 = orthogonal)
+            # We convert to similarity via (1 - distance) and only keep
+            # results above the threshold
             return [
-                {
-                    "id": results["ids"][0][i],
-                    "distance": 1 - results["distances"][0][i],
-                    "content": results["documents"][0][i],
-                    **results["metadatas"][0][i],
-                }
-                for i in range(len(results["ids"][0]))
-                if (1 - results["distances"][0][i]) >= self.cosine_better_than_threshold
-            ][:top_k]
+                [
+                    {
+                        "id": ids[i],
+                        "distance": 1 - distances[i],
+                        "content": documents[i],
+                        **metadatas[i],
+                    }
+                    for i in range(len(ids))
+                    if (1 - distances[i]) >= self.cosine_better_than_threshold
+                ]
+                for ids, distances, documents, metadatas in zip(
+                    results["ids"],
+                    results["distances"],
+                    results["documents"],
+                    results["metadatas"],
+                )
+            ]
 
         except Exception as e:
             logger.error(f"Error during ChromaDB query: {str(e)}")
             raise
 
+    async def delete(self, ids: list[str]):
+        if ids:
+            await _client_pools.write(self._collection.delete, ids=list(ids))
+
+    async def delete_entities_cascade(self, entity_names: list[str]):
+        if not {"src_id", "tgt_id"} <= self.meta_fields:
+            return
+        names = list(entity_names)
+        await _client_pools.write(
+            self._collection.delete,
+            where={"$or": [{"src_id": {"$in": names}}, {"tgt_id": {"$in": names}}]},
+        )
+
     async def index_done_callback(self):
         # ChromaDB handles persistence automatically
         pass
@@ -136,6 +136,18 @@ class JsonDocStatusStorage(DocStatusStorage):
     async def get_by_id(self, id: str):
         return self._data.get(id)
 
+    async def get_by_ids(self, ids: list[str], fields=None):
+        if fields:
+            return [
+                (
+                    {k: v for k, v in self._data[id].items() if k in fields}
+                    if self._data.get(id, None)
+                    else None
+                )
+                for id in ids
+            ]
+        return [self._data.get(id, None) for id in ids]
+
     async def get(self, doc_id: str) -> Union[DocProcessingStatus, None]:
         """Get document status by ID"""
         return self._data.get(doc_id)
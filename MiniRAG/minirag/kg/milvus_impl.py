@@ -1,10 +1,13 @@
-import asyncio
+import json
 import os
-from tqdm.asyncio import tqdm as tqdm_async
 from dataclasses import dataclass
-import numpy as np
-from minirag.utils import logger
-from ..base import BaseVectorStorage
+from minirag.utils import embed_in_batches, logger
+from ..base import (
+    BaseVectorStorage,
+    VectorFilter,
+    check_filter_fields,
+    filter_values,
+)
 
 import pipmaster as pm
 
@@ -56,39 +59,53 @@ class MilvusVectorDBStorge(BaseVectorStorage):
             for k, v in data.items()
         ]
         contents = [v["content"] for v in data.values()]
-        batches = [
-            contents[i : i + self._max_batch_size]
-            for i in range(0, len(contents), self._max_batch_size)
-        ]
-
-        async def wrapped_task(batch):
-            result = await self.embedding_func(batch)
-            pbar.update(1)
-            return result
-
-        embedding_tasks = [wrapped_task(batch) for batch in batches]
-        pbar = tqdm_async(
-            total=len(embedding_tasks), desc="Generating embeddings", unit="batch"
+        embeddings = await embed_in_batches(
+            self.embedding_func, contents, self._max_batch_size, self.global_config
         )
-        embeddings_list = await asyncio.gather(*embedding_tasks)
-
-        embeddings = np.concatenate(embeddings_list)
         for i, d in enumerate(list_data):
             d["vector"] = embeddings[i]
         results = self._client.upsert(collection_name=self.namespace, data=list_data)
         return results
 
-    async def query(self, query, top_k=5):
-        embedding = await self.embedding_func([query])
+    def _filter_expr(self, filter: VectorFilter) -> str:
+        """Milvus boolean expression for a filter"""
+        check_filter_fields(filter, self.meta_fields, self.namespace)
+        return " and ".join(
+            f"{field_name} in {json.dumps(filter_values(value), ensure_ascii=False)}"
+            for field_name, value in (filter or {}).items()
+        )
+
+    async def delete(self, ids: list[str]):
+        if ids:
+            self._client.delete(collection_name=self.namespace, ids=list(ids))
+
+    async def delete_entities_cascade(self, entity_names: list[str]):
+        if not {"src_id", "tgt_id"} <= self.meta_fields:
+            return
+        names = json.dumps(list(entity_names), ensure_ascii=False)
+        self._client.delete(
+            collection_name=self.namespace,
+            filter=f"src_id in {names} or tgt_id in {names}",
+        )
+
+    async def query(self, query, top_k=5, filter: VectorFilter = None):
+        return (await self.query_many([query], top_k, filter=filter))[0]
+
+    async def query_many(self, queries, top_k=5, filter: VectorFilter = None):
+        embeddings = await self.embedding_func(queries)
+        # Milvus searches all query vectors in one request
         results = self._client.search(
             collection_name=self.namespace,
-            data=embedding,
+            data=embeddings,
+            filter=self._filter_expr(filter),
             limit=top_k,
             output_fields=list(self.meta_fields),
             search_params={"metric_type": "COSINE", "params": {"radius": 0.2}},
         )
-        print(results)
         return [
-            {**dp["entity"], "id": dp["id"], "distance": dp["distance"]}
-            for dp in results[0]
+            [
+                {**dp["entity"], "id": dp["id"], "distance": dp["distance"]}
+                for dp in hits
+            ]
+            for hits in results
         ]
@@ -34,13 +34,15 @@ class MongoKVStorage(BaseKVStorage):
 
     async def get_by_ids(self, ids, fields=None):
         if fields is None:
-            return list(self._data.find({"_id": {"$in": ids}}))
-        return list(
-            self._data.find(
+            cursor = self._data.find({"_id": {"$in": ids}})
+        else:
+            cursor = self._data.find(
                 {"_id": {"$in": ids}},
                 {field: 1 for field in fields},
             )
-        )
+        # $in returns documents in storage order; align them with the input ids
+        found = {doc["_id"]: doc for doc in cursor}
+        return [found.get(id) for id in ids]
 
     async def filter_keys(self, data: list[str]) -> set[str]:
         existing_ids = [
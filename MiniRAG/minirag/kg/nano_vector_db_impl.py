@@ -49,8 +49,10 @@ Usage:
 """
 
 import asyncio
+import json
 import os
-from tqdm.asyncio import tqdm as tqdm_async
+import shutil
+from collections import defaultdict
 from dataclasses import dataclass
 import numpy as np
 import pipmaster as pm
@@ -59,21 +61,48 @@ if not pm.is_installed("nano-vectordb"):
     pm.install("nano-vectordb")
 
 from nano_vectordb import NanoVectorDB
+from nano_vectordb.dbs import array_to_buffer_string, buffer_string_to_array
 import time
 
 from minirag.utils import (
     logger,
     compute_mdhash_id,
+    embed_in_batches,
+    normalize_rows,
 )
 
 from minirag.base import (
     BaseVectorStorage,
+    VectorFilter,
+    check_filter_fields,
+    matches_filter,
 )
+from minirag.kg.numpy_vector_impl import IVFIndex
 
 
 @dataclass
 class NanoVectorDBStorage(BaseVectorStorage):
+    """nano-vectordb storage persisted as a JSON snapshot plus a write-ahead log.
+
+    Upserts and deletes are appended to ``vdb_{namespace}.wal.jsonl`` and
+    fsynced once per batch. ``index_done_callback`` folds the log into the
+    ``vdb_{namespace}.json`` snapshot in a background thread once it grows
+    past ``wal_fold_ratio`` of the snapshot size (and ``wal_fold_min_bytes``),
+    and loading replays whatever has not been folded yet.
+
+    ``ann_index="ivf"`` adds the IVF index of ``NumpyVectorDBStorage`` with
+    the same settings. Its lists follow every upsert and delete, and it is
+    saved in the snapshot's ``additional_data``. Filtered queries and
+    namespaces below ``ann_min_rows`` vectors are searched exactly.
+    """
+
     cosine_better_than_threshold: float = float(os.getenv("COSINE_THRESHOLD", "0.2"))
+    wal_fold_ratio: float = 0.5
+    wal_fold_min_bytes: int = 4 * 2**20
+    ann_index: str = None
+    ann_min_rows: int = 10000
+    ann_nlist: int = None
+    ann_nprobe: int = 16
 
     def __post_init__(self):
         # Use global config value if specified, otherwise use default
@@ -81,14 +110,152 @@ class NanoVectorDBStorage(BaseVectorStorage):
         self.cosine_better_than_threshold = config.get(
             "cosine_better_than_threshold", self.cosine_better_than_threshold
         )
+        self.wal_fold_ratio = config.get("wal_fold_ratio", self.wal_fold_ratio)
+        self.wal_fold_min_bytes = config.get(
+            "wal_fold_min_bytes", self.wal_fold_min_bytes
+        )
+        for name in ("ann_index", "ann_min_rows", "ann_nlist", "ann_nprobe"):
+            setattr(self, name, config.get(name, getattr(self, name)))
+        if self.ann_index not in (None, "ivf"):
+            raise ValueError(f"Unknown ann_index {self.ann_index!r}, expected 'ivf'")
 
         self._client_file_name = os.path.join(
             self.global_config["working_dir"], f"vdb_{self.namespace}.json"
         )
+        self._wal_file_name = os.path.join(
+            self.global_config["working_dir"], f"vdb_{self.namespace}.wal.jsonl"
+        )
+        # log being folded into the snapshot; replayed before the live log
+        self._folding_file_name = self._wal_file_name + ".folding"
+        self._fold_task = None
         self._max_batch_size = self.global_config["embedding_batch_num"]
         self._client = NanoVectorDB(
             self.embedding_func.embedding_dim, storage_file=self._client_file_name
         )
+        # set while the IVF index trains: rows updated meanwhile, and whether
+        # deletes moved rows
+        self._ivf_training = None
+        # a trained index is saved with the next snapshot
+        self._ivf_unsaved = False
+        self._ivf = self._load_ivf()
+        replayed = self._replay_wal(self._folding_file_name) + self._replay_wal(
+            self._wal_file_name
+        )
+        if replayed:
+            logger.info(f"Replayed {replayed} log entries into {self.namespace}")
+        # relationship storages: entity name -> ids of the relations touching
+        # it, and relation id -> its endpoints to keep the index up to date
+        self._endpoint_index = None
+        self._relation_endpoints = {}
+        if {"src_id", "tgt_id"} <= self.meta_fields:
+            self._endpoint_index = defaultdict(set)
+            for dp in self.client_storage["data"]:
+                self._index_endpoints(dp)
+
+    def _replay_wal(self, file_name: str) -> int:
+        if not os.path.exists(file_name):
+            return 0
+        entries, pending = 0, []
+        with open(file_name, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # torn write at the tail of the log
+                    logger.warning(f"Skipping corrupt log entry in {file_name}")
+                    continue
+                entries += 1
+                if entry["op"] == "upsert":
+                    entry["data"]["__vector__"] = buffer_string_to_array(
+                        entry["vector"]
+                    )
+                    pending.append(entry["data"])
+                    continue
+                # nano-vectordb upserts are O(store), so apply runs of them at once
+                if pending:
+                    self._client_upsert(pending)
+                    pending = []
+                self._client_delete(entry["ids"])
+        if pending:
+            self._client_upsert(pending)
+        return entries
+
+    def _load_ivf(self) -> "IVFIndex | None":
+        saved = self._client.get_additional_data().pop("ivf", None)
+        if saved is None or self.ann_index != "ivf":
+            return None
+        centroids = buffer_string_to_array(saved["centroids"]).reshape(
+            -1, self.embedding_func.embedding_dim
+        )
+        assignments = buffer_string_to_array(saved["assignments"], dtype=np.int32)
+        if len(assignments) != len(self._client):
+            logger.warning(f"Discarding stale IVF index of {self.namespace}")
+            return None
+        return IVFIndex(centroids, assignments.copy())
+
+    def _client_upsert(self, datas: list[dict]) -> dict:
+        """nano-vectordb upsert that keeps the IVF assignments row-aligned"""
+        n_before = len(self._client)
+        report = self._client.upsert(datas=datas)
+        if self._ivf is None and self._ivf_training is None:
+            return report
+        # updated vectors keep their row, new ones are appended
+        updated_ids = set(report["update"])
+        rows = (
+            [
+                i
+                for i, dp in enumerate(self.client_storage["data"])
+                if dp["__id__"] in updated_ids
+            ]
+            if updated_ids
+            else []
+        )
+        if self._ivf_training is not None:
+            self._ivf_training["updated"].update(rows)
+        if self._ivf is not None:
+            matrix = self.client_storage["matrix"]
+            if rows:
+                self._ivf.update(rows, self._ivf.assign(matrix[rows]))
+            if len(matrix) > n_before:
+                self._ivf.add(self._ivf.assign(matrix[n_before:]))
+        return report
+
+    def _client_delete(self, ids: list[str]):
+        """nano-vectordb delete that drops the deleted rows from the IVF index"""
+        rows = []
+        if self._ivf is not None or self._ivf_training is not None:
+            id_set = set(ids)
+            rows = [
+                i
+                for i, dp in enumerate(self.client_storage["data"])
+                if dp["__id__"] in id_set
+            ]
+        self._client.delete(ids)
+        if rows and self._ivf is not None:
+            self._ivf.remove(rows)
+        if rows and self._ivf_training is not None:
+            self._ivf_training["deleted"] = True
+
+    def _append_wal(self, lines: list[str]):
+        with open(self._wal_file_name, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _index_endpoints(self, dp: dict):
+        self._unindex_endpoints(dp["__id__"])
+        endpoints = (dp.get("src_id"), dp.get("tgt_id"))
+        self._relation_endpoints[dp["__id__"]] = endpoints
+        for entity_name in endpoints:
+            self._endpoint_index[entity_name].add(dp["__id__"])
+
+    def _unindex_endpoints(self, id_: str):
+        for entity_name in self._relation_endpoints.pop(id_, ()):
+            ids = self._endpoint_index.get(entity_name)
+            if ids is not None:
+                ids.discard(id_)
+                if not ids:
+                    del self._endpoint_index[entity_name]
 
     async def upsert(self, data: dict[str, dict]):
         logger.info(f"Inserting {len(data)} vectors to {self.namespace}")
@@ -106,27 +273,32 @@ class NanoVectorDBStorage(BaseVectorStorage):
             for k, v in data.items()
         ]
         contents = [v["content"] for v in data.values()]
-        batches = [
-            contents[i : i + self._max_batch_size]
-            for i in range(0, len(contents), self._max_batch_size)
-        ]
-
-        async def wrapped_task(batch):
-            result = await self.embedding_func(batch)
-            pbar.update(1)
-            return result
-
-        embedding_tasks = [wrapped_task(batch) for batch in batches]
-        pbar = tqdm_async(
-            total=len(embedding_tasks), desc="Generating embeddings", unit="batch"
+        embeddings = await embed_in_batches(
+            self.embedding_func, contents, self._max_batch_size, self.global_config
         )
-        embeddings_list = await asyncio.gather(*embedding_tasks)
-
-        embeddings = np.concatenate(embeddings_list)
         if len(embeddings) == len(list_data):
             for i, d in enumerate(list_data):
                 d["__vector__"] = embeddings[i]
-            results = self._client.upsert(datas=list_data)
+            self._append_wal(
+                [
+                    json.dumps(
+                        {
+                            "op": "upsert",
+                            "data": {k: v for k, v in d.items() if k != "__vector__"},
+                            "vector": array_to_buffer_string(
+                                np.asarray(embeddings[i], dtype=np.float32)
+                            ),
+                        },
+                        ensure_ascii=False,
+                    )
+                    + "\n"
+                    for i, d in enumerate(list_data)
+                ]
+            )
+            if self._endpoint_index is not None:
+                for dp in list_data:
+                    self._index_endpoints(dp)
+            results = self._client_upsert(list_data)
             return results
         else:
             # sometimes the embedding is not returned correctly. just log it.
@@ -134,17 +306,45 @@ class NanoVectorDBStorage(BaseVectorStorage):
                 f"embedding is not 1-1 with data, {len(embeddings)} != {len(list_data)}"
             )
 
-    async def query(self, query: str, top_k=5):
-        embedding = await self.embedding_func([query])
-        embedding = embedding[0]
+    async def query(self, query: str, top_k=5, filter: VectorFilter = None):
+        return (await self.query_many([query], top_k, filter=filter))[0]
+
+    async def query_many(
+        self, queries: list[str], top_k=5, filter: VectorFilter = None
+    ) -> list[list[dict]]:
+        embeddings = await self.embedding_func(queries)
         logger.info(
-            f"Query: {query}, top_k: {top_k}, cosine_better_than_threshold: {self.cosine_better_than_threshold}"
-        )
-        results = self._client.query(
-            query=embedding,
-            top_k=top_k,
-            better_than_threshold=self.cosine_better_than_threshold,
+            f"Query: {queries[0] if len(queries) == 1 else queries}, top_k: {top_k}, "
+            f"filter: {filter}, cosine_better_than_threshold: {self.cosine_better_than_threshold}"
         )
+        filter_lambda = None
+        if filter:
+            check_filter_fields(filter, self.meta_fields, self.namespace)
+            # nano-vectordb drops non-matching rows before taking the top_k
+            filter_lambda = lambda dp: matches_filter(dp, filter)  # noqa: E731
+            if not any(map(filter_lambda, self.client_storage["data"])):
+                # nano-vectordb cannot index its matrix with an empty selection
+                return [[] for _ in queries]
+        return [
+            self._query_embedding(embedding, top_k, filter_lambda)
+            for embedding in embeddings
+        ]
+
+    def _query_embedding(self, embedding: np.ndarray, top_k: int, filter_lambda):
+        results = None
+        if (
+            filter_lambda is None
+            and self._ivf is not None
+            and len(self._client) > self.ann_min_rows
+        ):
+            results = self._ivf_query(embedding, top_k)
+        if results is None:
+            results = self._client.query(
+                query=embedding,
+                top_k=top_k,
+                better_than_threshold=self.cosine_better_than_threshold,
+                filter_lambda=filter_lambda,
+            )
         results = [
             {
                 **dp,
@@ -156,6 +356,24 @@ class NanoVectorDBStorage(BaseVectorStorage):
         ]
         return results
 
+    def _ivf_query(self, embedding: np.ndarray, top_k: int):
+        """nano-vectordb style results from the probed IVF lists, or None
+        when they hold fewer than top_k vectors"""
+        query = normalize_rows(np.asarray(embedding, dtype=np.float32)[None])[0]
+        rows = self._ivf.candidates(query, self.ann_nprobe)
+        if len(rows) < top_k:
+            return None
+        scores = self.client_storage["matrix"][rows] @ query
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        data = self.client_storage["data"]
+        results = []
+        for i in best:
+            if scores[i] < self.cosine_better_than_threshold:
+                break
+            results.append({**data[rows[i]], "__metrics__": scores[i]})
+        return results
+
     @property
     def client_storage(self):
         return getattr(self._client, "_NanoVectorDB__storage")
@@ -167,7 +385,12 @@ class NanoVectorDBStorage(BaseVectorStorage):
             ids: List of vector IDs to be deleted
         """
         try:
-            self._client.delete(ids)
+            entry = json.dumps({"op": "delete", "ids": list(ids)}, ensure_ascii=False)
+            self._append_wal([entry + "\n"])
+            if self._endpoint_index is not None:
+                for id_ in ids:
+                    self._unindex_endpoints(id_)
+            self._client_delete(ids)
             logger.info(
                 f"Successfully deleted {len(ids)} vectors from {self.namespace}"
             )
@@ -190,24 +413,137 @@ class NanoVectorDBStorage(BaseVectorStorage):
             logger.error(f"Error deleting entity {entity_name}: {e}")
 
     async def delete_entity_relation(self, entity_name: str):
-        try:
-            relations = [
-                dp
-                for dp in self.client_storage["data"]
-                if dp["src_id"] == entity_name or dp["tgt_id"] == entity_name
-            ]
-            logger.debug(f"Found {len(relations)} relations for entity {entity_name}")
-            ids_to_delete = [relation["__id__"] for relation in relations]
+        await self.delete_entities_cascade([entity_name])
 
+    async def delete_entities_cascade(self, entity_names: list[str]):
+        if self._endpoint_index is None:
+            logger.debug(f"{self.namespace} does not store relations")
+            return
+        try:
+            ids_to_delete = set()
+            for entity_name in entity_names:
+                ids_to_delete |= self._endpoint_index.get(entity_name, set())
+            logger.debug(
+                f"Found {len(ids_to_delete)} relations for {len(entity_names)} entities"
+            )
             if ids_to_delete:
-                await self.delete(ids_to_delete)
-                logger.debug(
-                    f"Deleted {len(ids_to_delete)} relations for {entity_name}"
-                )
-            else:
-                logger.debug(f"No relations found for entity {entity_name}")
+                await self.delete(list(ids_to_delete))
         except Exception as e:
-            logger.error(f"Error deleting relations for {entity_name}: {e}")
+            logger.error(f"Error deleting relations for {entity_names}: {e}")
+
+    async def _maybe_train_ivf(self):
+        if self.ann_index != "ivf" or self._ivf_training is not None:
+            return
+        n_rows = len(self._client)
+        if n_rows < self.ann_min_rows:
+            return
+        nlist = self.ann_nlist or int(4 * np.sqrt(n_rows))
+        # retrain when the namespace has outgrown its lists
+        if self._ivf is not None and len(self._ivf.centroids) >= nlist // 2:
+            return
+        matrix = self.client_storage["matrix"]
+        self._ivf_training = {"updated": set(), "deleted": False}
+        start = time.perf_counter()
+        try:
+            # train off the event loop; new rows are assigned afterwards
+            ivf = await asyncio.to_thread(
+                IVFIndex.train, matrix, np.arange(len(matrix)), nlist
+            )
+        finally:
+            training, self._ivf_training = self._ivf_training, None
+        if training["deleted"]:
+            logger.info(
+                f"Rows of {self.namespace} moved while training its IVF index, "
+                "retrying on the next save"
+            )
+            return
+        matrix = self.client_storage["matrix"]
+        if training["updated"]:
+            rows = np.fromiter(training["updated"], dtype=np.int64)
+            ivf.update(rows, ivf.assign(matrix[rows]))
+        if len(ivf.assignments) < len(matrix):
+            ivf.add(ivf.assign(matrix[len(ivf.assignments) :]))
+        self._ivf = ivf
+        self._ivf_unsaved = True
+        logger.info(
+            f"Trained IVF index for {self.namespace}: {len(ivf.centroids)} lists "
+            f"over {n_rows} vectors in {time.perf_counter() - start:.2f}s"
+        )
 
     async def index_done_callback(self):
-        self._client.save()
+        await self._maybe_train_ivf()
+        # every change is already in the log; only fold it once it is large
+        # or a new IVF index has to be saved
+        if self._fold_task is not None and not self._fold_task.done():
+            return
+        wal_size = (
+            os.path.getsize(self._wal_file_name)
+            if os.path.exists(self._wal_file_name)
+            else 0
+        )
+        snapshot_size = (
+            os.path.getsize(self._client_file_name)
+            if os.path.exists(self._client_file_name)
+            else 0
+        )
+        fold_bytes = max(self.wal_fold_min_bytes, self.wal_fold_ratio * snapshot_size)
+        if not self._ivf_unsaved and (not wal_size or wal_size < fold_bytes):
+            return
+        # entries logged from here on go to a fresh log, so the snapshot
+        # below covers exactly the folding log
+        if os.path.exists(self._folding_file_name):
+            # an earlier fold did not finish; fold both logs this time
+            if wal_size:
+                with open(self._folding_file_name, "ab") as dst, open(
+                    self._wal_file_name, "rb"
+                ) as src:
+                    shutil.copyfileobj(src, dst)
+                os.remove(self._wal_file_name)
+        elif os.path.exists(self._wal_file_name):
+            os.replace(self._wal_file_name, self._folding_file_name)
+        else:
+            # nothing logged, the snapshot only gains the IVF index
+            open(self._folding_file_name, "wb").close()
+        storage = self.client_storage
+        # nano-vectordb updates matrix rows in place, so copy it
+        snapshot = {
+            **storage,
+            "data": list(storage["data"]),
+            "matrix": storage["matrix"].copy(),
+        }
+        if self._ivf is not None:
+            snapshot["additional_data"] = {
+                **storage.get("additional_data", {}),
+                "ivf": {
+                    "centroids": array_to_buffer_string(self._ivf.centroids),
+                    "assignments": array_to_buffer_string(self._ivf.assignments),
+                },
+            }
+            self._ivf_unsaved = False
+        self._fold_task = asyncio.create_task(self._fold(snapshot))
+
+    async def _fold(self, snapshot: dict):
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._write_snapshot, snapshot)
+        except Exception as e:
+            # the folding log is kept and replayed, nothing is lost
+            logger.error(f"Error folding log of {self.namespace}: {e}")
+            return
+        os.remove(self._folding_file_name)
+        logger.info(
+            f"Folded log of {self.namespace} into a snapshot of "
+            f"{len(snapshot['data'])} vectors in {time.perf_counter() - start:.2f}s"
+        )
+
+    def _write_snapshot(self, snapshot: dict):
+        tmp_file_name = self._client_file_name + ".tmp"
+        with open(tmp_file_name, "w", encoding="utf-8") as f:
+            json.dump(
+                {**snapshot, "matrix": array_to_buffer_string(snapshot["matrix"])},
+                f,
+                ensure_ascii=False,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file_name, self._client_file_name)
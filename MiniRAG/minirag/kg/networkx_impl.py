@@ -50,6 +50,7 @@ Usage:
 import asyncio
 import html
 import os
+from array import array
 from dataclasses import dataclass
 from typing import Any, Union, cast
 import networkx as nx
@@ -62,7 +63,9 @@ from minirag.utils import (
 
 from minirag.base import (
     BaseGraphStorage,
+    split_graph_field,
 )
+from minirag.prompt import GRAPH_FIELD_SEP
 
 from minirag.utils import merge_tuples
 
@@ -142,9 +145,69 @@ class NetworkXStorage(BaseGraphStorage):
         self._node_embed_algorithms = {
             "node2vec": self._node2vec_embed,
         }
+        # Interned chunk ids: each distinct id string is stored once and nodes /
+        # edges keep compact integer arrays into the table instead of their
+        # source_id strings, which are only rebuilt when persisting. get_node
+        # and get_edge leave source_id out; read it with get_*_chunk_ids.
+        self._chunk_id_table: list[str] = []
+        self._chunk_id_lookup: dict[str, int] = {}
+        self._node_chunk_index: dict[str, array] = {}
+        self._edge_chunk_index: dict[tuple[str, str], array] = {}
+        self._strip_source_ids()
+
+    @staticmethod
+    def _edge_key(source_node_id: str, target_node_id: str) -> tuple[str, str]:
+        if source_node_id > target_node_id:
+            return target_node_id, source_node_id
+        return source_node_id, target_node_id
+
+    def _intern_chunk_ids(self, source_id: str) -> array:
+        indices = array("I")
+        for chunk_id in split_graph_field(source_id):
+            index = self._chunk_id_lookup.get(chunk_id)
+            if index is None:
+                index = len(self._chunk_id_table)
+                self._chunk_id_table.append(chunk_id)
+                self._chunk_id_lookup[chunk_id] = index
+            indices.append(index)
+        return indices
+
+    def _join_chunk_ids(self, indices: array) -> str:
+        return GRAPH_FIELD_SEP.join(self._chunk_id_table[i] for i in indices)
+
+    def _strip_source_ids(self):
+        """Move every source_id attribute of the graph into the chunk index"""
+        for node_id, data in self._graph.nodes(data=True):
+            if "source_id" in data:
+                self._node_chunk_index[node_id] = self._intern_chunk_ids(
+                    data.pop("source_id")
+                )
+        for source, target, data in self._graph.edges(data=True):
+            if "source_id" in data:
+                self._edge_chunk_index[self._edge_key(source, target)] = (
+                    self._intern_chunk_ids(data.pop("source_id"))
+                )
+
+    def _restore_source_ids(self):
+        for node_id, indices in self._node_chunk_index.items():
+            self._graph.nodes[node_id]["source_id"] = self._join_chunk_ids(indices)
+        for (source, target), indices in self._edge_chunk_index.items():
+            self._graph.edges[source, target]["source_id"] = self._join_chunk_ids(
+                indices
+            )
+
+    def _forget_node_chunk_ids(self, node_id: str):
+        self._node_chunk_index.pop(node_id, None)
+        for source, target in self._graph.edges(node_id):
+            self._edge_chunk_index.pop(self._edge_key(source, target), None)
 
     async def index_done_callback(self):
-        NetworkXStorage.write_nx_graph(self._graph, self._graphml_xml_file)
+        # the file keeps plain source_id strings; they exist only while writing
+        self._restore_source_ids()
+        try:
+            NetworkXStorage.write_nx_graph(self._graph, self._graphml_xml_file)
+        finally:
+            self._strip_source_ids()
         
     async def get_types(self):
         types = set()
@@ -218,12 +281,33 @@ class NetworkXStorage(BaseGraphStorage):
             return list(self._graph.edges(source_node_id))
         return None
 
+    async def get_node_chunk_ids(self, node_id: str) -> list[str]:
+        indices = self._node_chunk_index.get(node_id, ())
+        return [self._chunk_id_table[i] for i in indices]
+
+    async def get_edge_chunk_ids(
+        self, source_node_id: str, target_node_id: str
+    ) -> list[str]:
+        key = self._edge_key(source_node_id, target_node_id)
+        indices = self._edge_chunk_index.get(key, ())
+        return [self._chunk_id_table[i] for i in indices]
+
     async def upsert_node(self, node_id: str, node_data: dict[str, str]):
+        node_data = dict(node_data)
+        if "source_id" in node_data:
+            self._node_chunk_index[node_id] = self._intern_chunk_ids(
+                node_data.pop("source_id")
+            )
         self._graph.add_node(node_id, **node_data)
 
     async def upsert_edge(
         self, source_node_id: str, target_node_id: str, edge_data: dict[str, str]
     ):
+        edge_data = dict(edge_data)
+        if "source_id" in edge_data:
+            self._edge_chunk_index[self._edge_key(source_node_id, target_node_id)] = (
+                self._intern_chunk_ids(edge_data.pop("source_id"))
+            )
         self._graph.add_edge(source_node_id, target_node_id, **edge_data)
 
     async def delete_node(self, node_id: str):
@@ -233,6 +317,7 @@ class NetworkXStorage(BaseGraphStorage):
         :param node_id: The node_id to delete
         """
         if self._graph.has_node(node_id):
+            self._forget_node_chunk_ids(node_id)
             self._graph.remove_node(node_id)
             logger.info(f"Node {node_id} deleted from the graph.")
         else:
@@ -263,6 +348,7 @@ class NetworkXStorage(BaseGraphStorage):
         """
         for node in nodes:
             if self._graph.has_node(node):
+                self._forget_node_chunk_ids(node)
                 self._graph.remove_node(node)
 
     def remove_edges(self, edges: list[tuple[str, str]]):
@@ -273,4 +359,5 @@ class NetworkXStorage(BaseGraphStorage):
         """
         for source, target in edges:
             if self._graph.has_edge(source, target):
+                self._edge_chunk_index.pop(self._edge_key(source, target), None)
                 self._graph.remove_edge(source, target)
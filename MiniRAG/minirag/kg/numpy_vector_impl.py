@@ -0,0 +1,798 @@
+import asyncio
+import io
+import json
+import os
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from minirag.utils import (
+    logger,
+    compute_mdhash_id,
+    embed_in_batches,
+    normalize_rows,
+    quantize_embedding,
+)
+
+from minirag.base import (
+    BaseVectorStorage,
+    VectorFilter,
+    check_filter_fields,
+    filter_values,
+)
+
+
+def _append_npy_rows(file_name: str, rows: np.ndarray) -> bool:
+    """Append rows to a 2D .npy file in place.
+
+    Writes the new rows after the existing data and rewrites the header with
+    the new shape. numpy pads .npy headers so the row count can grow without
+    moving the data; returns False (nothing written) if the header would not
+    fit, in which case the caller has to rewrite the file.
+    """
+    fmt = np.lib.format
+    with open(file_name, "r+b") as f:
+        version = fmt.read_magic(f)
+        if version == (1, 0):
+            read_header, write_header = (
+                fmt.read_array_header_1_0,
+                fmt.write_array_header_1_0,
+            )
+        else:
+            read_header, write_header = (
+                fmt.read_array_header_2_0,
+                fmt.write_array_header_2_0,
+            )
+        shape, fortran_order, dtype = read_header(f)
+        data_offset = f.tell()
+        header = {
+            "descr": fmt.dtype_to_descr(dtype),
+            "fortran_order": fortran_order,
+            "shape": (shape[0] + len(rows), shape[1]),
+        }
+        buffer = io.BytesIO()
+        write_header(buffer, header)
+        if buffer.tell() != data_offset:
+            return False
+        f.seek(data_offset + shape[0] * shape[1] * dtype.itemsize)
+        f.write(np.ascontiguousarray(rows, dtype=dtype).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+        # only grow the header once the rows are on disk
+        f.seek(0)
+        f.write(buffer.getvalue())
+        f.flush()
+        os.fsync(f.fileno())
+    return True
+
+
+def _fsync_dir(dir_name: str):
+    """Make renames in a directory durable (not possible on Windows)"""
+    if os.name == "nt":
+        return
+    fd = os.open(dir_name, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _save_npy(file_name: str, matrix: np.ndarray, rows: np.ndarray = None):
+    """Write a .npy file through a temporary file so open memmaps stay valid.
+
+    With ``rows``, writes ``matrix[rows]`` slice by slice instead of
+    materializing it. The data is fsynced before the rename.
+    """
+    tmp_file_name = file_name + ".tmp"
+    with open(tmp_file_name, "wb") as f:
+        if rows is None:
+            np.save(f, np.ascontiguousarray(matrix))
+        else:
+            fmt = np.lib.format
+            fmt.write_array_header_1_0(
+                f,
+                {
+                    "descr": fmt.dtype_to_descr(matrix.dtype),
+                    "fortran_order": False,
+                    "shape": (len(rows), matrix.shape[1]),
+                },
+            )
+            for start in range(0, len(rows), 65536):
+                f.write(
+                    np.ascontiguousarray(matrix[rows[start : start + 65536]]).tobytes()
+                )
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file_name, file_name)
+    _fsync_dir(os.path.dirname(os.path.abspath(file_name)))
+
+
+def _matmul_chunked(matrix: np.ndarray, other: np.ndarray):
+    """Yield (start, matrix[start:end] @ other) so large memmaps are read in slices"""
+    chunk_rows = max(1024, (1 << 24) // max(1, matrix.shape[1]))
+    for start in range(0, matrix.shape[0], chunk_rows):
+        yield start, np.asarray(matrix[start : start + chunk_rows]) @ other
+
+
+class IVFIndex:
+    """Inverted-file ANN index over the rows of a normalized vector matrix.
+
+    Rows are assigned to the nearest of ``nlist`` spherical k-means
+    centroids; a query scores only the rows of its ``nprobe`` closest
+    lists. Rows added after the lists were built are kept in a small
+    pending tail that is scanned with them and merged once it grows.
+    """
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.assignments = np.asarray(assignments, dtype=np.int32).reshape(-1)
+        self._build_lists()
+
+    @classmethod
+    def train(
+        cls,
+        matrix: np.ndarray,
+        rows: np.ndarray,
+        nlist: int,
+        iterations: int = 8,
+        sample_size: int = 32768,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        rng = np.random.default_rng(seed)
+        nlist = max(1, min(nlist, len(rows)))
+        if len(rows) > sample_size:
+            rows = np.sort(rng.choice(rows, sample_size, replace=False))
+        sample = np.asarray(matrix[rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(labels, kind="stable")
+            used = np.unique(labels)
+            starts = np.searchsorted(labels[order], used)
+            # empty lists keep their previous centroid
+            sums = centroids.copy()
+            sums[used] = np.add.reduceat(sample[order], starts)
+            centroids = normalize_rows(sums)
+        index = cls(centroids, np.zeros(0, dtype=np.int32))
+        index.add(index.assign(matrix))
+        return index
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Nearest centroid of each row"""
+        labels = np.empty(vectors.shape[0], dtype=np.int32)
+        for start, scores in _matmul_chunked(vectors, self.centroids.T):
+            labels[start : start + len(scores)] = np.argmax(scores, axis=1)
+        return labels
+
+    def update(self, rows: np.ndarray, assignments: np.ndarray):
+        """Reassign rows whose vectors changed in place"""
+        rows = np.asarray(rows, dtype=np.int64)
+        moved = rows[self.assignments[rows] != assignments]
+        self.assignments[rows] = assignments
+        if np.any(moved < self._listed_rows):
+            self._build_lists()
+
+    def remove(self, rows: np.ndarray):
+        """Drop deleted rows; the rows after them move up"""
+        self.assignments = np.delete(self.assignments, rows)
+        self._build_lists()
+
+    def add(self, assignments: np.ndarray):
+        """Append the assignments of newly added rows"""
+        self.assignments = np.concatenate([self.assignments, assignments])
+        if len(self.assignments) - self._listed_rows > max(
+            1024, self._listed_rows // 8
+        ):
+            self._build_lists()
+
+    def _build_lists(self):
+        order = np.argsort(self.assignments, kind="stable").astype(np.int64)
+        bounds = np.searchsorted(
+            self.assignments[order], np.arange(len(self.centroids) + 1)
+        )
+        self._lists = [order[bounds[i] : bounds[i + 1]] for i in range(len(bounds) - 1)]
+        self._listed_rows = len(self.assignments)
+
+    def candidates(self, query_vector: np.ndarray, nprobe: int) -> np.ndarray:
+        """Rows in the nprobe lists closest to the query"""
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ query_vector), nprobe - 1)[:nprobe]
+        pending = self._listed_rows + np.flatnonzero(
+            np.isin(self.assignments[self._listed_rows :], probes)
+        )
+        return np.concatenate([self._lists[p] for p in probes] + [pending])
+
+
+@dataclass
+class NumpyVectorDBStorage(BaseVectorStorage):
+    """Vector storage backed by a memory-mapped float32 .npy matrix.
+
+    ``vdb_{namespace}.npy`` holds the normalized vectors, one per row, and
+    ``vdb_{namespace}.meta.jsonl`` is an append-only log of the row each id
+    lives in plus its meta fields. Upserts append rows, deletes append
+    tombstones, and dead rows are dropped by a compaction that runs from
+    ``index_done_callback`` once they exceed ``compact_dead_ratio``.
+    Compaction writes the matrix of the next generation to
+    ``vdb_{namespace}.gen{N}.npy`` and then swaps in a meta log whose first
+    line names that generation, so a crash leaves one complete generation.
+    Loading maps the matrix instead of reading it, and saves only write the
+    delta. Query filters are evaluated as row bitmaps from an in-memory
+    index of meta field values.
+    """
+
+    cosine_better_than_threshold: float = float(os.getenv("COSINE_THRESHOLD", "0.2"))
+    compact_dead_ratio: float = 0.25
+    # "ivf" enables the approximate index once a namespace has ann_min_rows
+    # live vectors; smaller namespaces are always searched exactly.
+    ann_index: str = None
+    ann_min_rows: int = 10000
+    # number of IVF lists (default 4 * sqrt(rows)) and lists scanned per query
+    ann_nlist: int = None
+    ann_nprobe: int = 16
+    # Coarse copy that queries scan instead of the float32 matrix, rescoring
+    # the best rerank_factor * top_k rows in full precision: "int8" keeps a
+    # uint8 code per vector (one scale per vector), prefilter_dim=N keeps the
+    # first N dimensions of Matryoshka-style embeddings.
+    quantization: str = None
+    prefilter_dim: int = None
+    rerank_factor: int = 4
+
+    def __post_init__(self):
+        config = self.global_config.get("vector_db_storage_cls_kwargs", {})
+        self.cosine_better_than_threshold = config.get(
+            "cosine_better_than_threshold", self.cosine_better_than_threshold
+        )
+        self.compact_dead_ratio = config.get(
+            "compact_dead_ratio", self.compact_dead_ratio
+        )
+        for name in (
+            "ann_index",
+            "ann_min_rows",
+            "ann_nlist",
+            "ann_nprobe",
+            "quantization",
+            "prefilter_dim",
+            "rerank_factor",
+        ):
+            setattr(self, name, config.get(name, getattr(self, name)))
+        if self.ann_index not in (None, "ivf"):
+            raise ValueError(f"Unknown ann_index {self.ann_index!r}, expected 'ivf'")
+        if self.quantization not in (None, "int8"):
+            raise ValueError(
+                f"Unknown quantization {self.quantization!r}, expected 'int8'"
+            )
+        if self.quantization and self.prefilter_dim:
+            raise ValueError("Use either quantization or prefilter_dim, not both")
+        if self.prefilter_dim and not (
+            0 < self.prefilter_dim < self.embedding_func.embedding_dim
+        ):
+            raise ValueError(
+                f"prefilter_dim must be below the embedding dimension "
+                f"{self.embedding_func.embedding_dim}, got {self.prefilter_dim}"
+            )
+        working_dir = self.global_config["working_dir"]
+        self._meta_file_name = os.path.join(
+            working_dir, f"vdb_{self.namespace}.meta.jsonl"
+        )
+        self._centroids_file_name = os.path.join(
+            working_dir, f"vdb_{self.namespace}.ivf_centroids.npy"
+        )
+        self._assignments_file_name = os.path.join(
+            working_dir, f"vdb_{self.namespace}.ivf_assignments.npy"
+        )
+        self._max_batch_size = self.global_config["embedding_batch_num"]
+        self._dim = self.embedding_func.embedding_dim
+        # held by upserts, deletes and compaction, which rewrites the files
+        self._write_lock = asyncio.Lock()
+        self._load()
+        logger.info(
+            f"Load numpy vdb {self.namespace} with {len(self._rows)} vectors "
+            f"({self._matrix.shape[0]} rows)"
+        )
+
+    def _matrix_path(self, generation: int) -> str:
+        # generation 0 keeps the name from before compaction was generational
+        suffix = "" if generation == 0 else f".gen{generation}"
+        return os.path.join(
+            self.global_config["working_dir"], f"vdb_{self.namespace}{suffix}.npy"
+        )
+
+    def _read_generation(self) -> int:
+        with open(self._meta_file_name, encoding="utf-8") as f:
+            first_line = f.readline()
+        if not first_line.strip():
+            return 0
+        return json.loads(first_line).get("generation", 0)
+
+    def _load(self):
+        if not os.path.exists(self._meta_file_name):
+            empty = np.zeros((0, self._dim), dtype=np.float32)
+            self._write_snapshot(empty, None, [], 0)
+        self._generation = self._read_generation()
+        self._matrix_file_name = self._matrix_path(self._generation)
+        # left behind by a compaction that crashed before or after its commit
+        for generation in (self._generation - 1, self._generation + 1):
+            if generation >= 0 and os.path.exists(self._matrix_path(generation)):
+                os.remove(self._matrix_path(generation))
+        self._open_matrix()
+        if self._matrix.shape[1] != self._dim:
+            raise ValueError(
+                f"{self._matrix_file_name} has dimension {self._matrix.shape[1]}, "
+                f"expected {self._dim}"
+            )
+        # id -> row, row -> (id, created_at, meta); rows not in _rows are dead
+        self._rows: dict[str, int] = {}
+        self._records: dict[int, tuple[str, float, dict]] = {}
+        n_rows = self._matrix.shape[0]
+        with open(self._meta_file_name, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if "generation" in entry:
+                    continue
+                if "deleted" in entry:
+                    row = self._rows.pop(entry["deleted"], None)
+                    self._records.pop(row, None)
+                    continue
+                row = entry["row"]
+                if row >= n_rows:
+                    # vectors never made it to disk
+                    continue
+                old_row = self._rows.get(entry["id"])
+                if old_row is not None:
+                    self._records.pop(old_row, None)
+                self._rows[entry["id"]] = row
+                self._records[row] = (entry["id"], entry["created_at"], entry["meta"])
+        self._alive = np.zeros(n_rows, dtype=bool)
+        self._alive[list(self._records)] = True
+        self._build_meta_index()
+        self._ivf = self._load_ivf() if self.ann_index == "ivf" else None
+        self._coarse = self._load_coarse()
+
+    def _build_meta_index(self):
+        # meta field -> value -> live rows holding it
+        self._meta_index: dict[str, dict] = {}
+        for row, (_, _, meta) in self._records.items():
+            self._index_meta(row, meta)
+
+    def _index_meta(self, row: int, meta: dict):
+        for field_name, value in meta.items():
+            try:
+                self._meta_index.setdefault(field_name, {}).setdefault(
+                    value, set()
+                ).add(row)
+            except TypeError:
+                # unhashable values (lists, dicts) cannot be filtered on
+                continue
+
+    def _unindex_meta(self, row: int, meta: dict):
+        for field_name, value in meta.items():
+            try:
+                self._meta_index.get(field_name, {}).get(value, set()).discard(row)
+            except TypeError:
+                continue
+
+    def _filter_mask(self, filter: VectorFilter) -> np.ndarray:
+        """Bitmap of the live rows matching filter"""
+        check_filter_fields(filter, self.meta_fields, self.namespace)
+        mask = self._alive.copy()
+        for field_name, value in filter.items():
+            index = self._meta_index.get(field_name, {})
+            field_mask = np.zeros(len(mask), dtype=bool)
+            for accepted in filter_values(value):
+                rows = index.get(accepted)
+                if rows:
+                    field_mask[list(rows)] = True
+            mask &= field_mask
+        return mask
+
+    def _coarse_layout(self) -> list[tuple[str, int, type]]:
+        """(file name, columns, dtype) of each coarse-copy file; empty if disabled"""
+        base = os.path.join(self.global_config["working_dir"], f"vdb_{self.namespace}")
+        if self.quantization == "int8":
+            return [
+                (f"{base}.int8.npy", self._dim, np.uint8),
+                (f"{base}.int8_ranges.npy", 2, np.float32),
+            ]
+        if self.prefilter_dim:
+            file_name = f"{base}.prefix{self.prefilter_dim}.npy"
+            return [(file_name, self.prefilter_dim, np.float32)]
+        return []
+
+    def _coarse_rows(self, vectors: np.ndarray) -> list[np.ndarray]:
+        if self.quantization == "int8":
+            codes, min_vals, max_vals = quantize_embedding(vectors, axis=-1)
+            return [codes, np.hstack([min_vals, max_vals]).astype(np.float32)]
+        return [normalize_rows(vectors[:, : self.prefilter_dim])]
+
+    def _load_coarse(self) -> "list[np.ndarray] | None":
+        """Open the coarse copy, rebuilding missing or stale rows from the matrix"""
+        layout = self._coarse_layout()
+        if not layout:
+            return None
+        coarse = None
+        n_rows = self._matrix.shape[0]
+        if all(os.path.exists(file_name) for file_name, _, _ in layout):
+            coarse = self._open_coarse()
+            lengths = {len(array) for array in coarse}
+            if (
+                len(lengths) > 1
+                or max(lengths) > n_rows
+                or any(
+                    array.shape[1] != columns
+                    for array, (_, columns, _) in zip(coarse, layout)
+                )
+            ):
+                logger.warning(f"Discarding stale coarse vectors of {self.namespace}")
+                coarse = None
+        if coarse is None:
+            for file_name, columns, dtype in layout:
+                _save_npy(file_name, np.zeros((0, columns), dtype=dtype))
+            coarse = self._open_coarse()
+        if len(coarse[0]) < n_rows:
+            coarse = self._append_coarse(len(coarse[0]))
+        float_bytes = self._matrix.nbytes
+        coarse_bytes = sum(array.nbytes for array in coarse)
+        logger.info(
+            f"Coarse {self.quantization or f'{self.prefilter_dim}-dim'} vectors of "
+            f"{self.namespace} take {coarse_bytes / 2**20:.1f} MiB instead of "
+            f"{float_bytes / 2**20:.1f} MiB float32 "
+            f"({(float_bytes - coarse_bytes) / 2**20:.1f} MiB saved per scan)"
+        )
+        return coarse
+
+    def _open_coarse(self) -> list[np.ndarray]:
+        return [
+            np.load(file_name, mmap_mode="r")
+            for file_name, _, _ in self._coarse_layout()
+        ]
+
+    def _append_coarse(self, start: int) -> list[np.ndarray]:
+        """Append coarse rows for matrix rows from ``start`` on; returns the new copy"""
+        for chunk_start in range(start, self._matrix.shape[0], 65536):
+            vectors = np.asarray(self._matrix[chunk_start : chunk_start + 65536])
+            for (file_name, _, _), rows in zip(
+                self._coarse_layout(), self._coarse_rows(vectors)
+            ):
+                if not _append_npy_rows(file_name, rows):
+                    _save_npy(file_name, np.concatenate([np.load(file_name), rows]))
+        return self._open_coarse()
+
+    def _load_ivf(self) -> "IVFIndex | None":
+        if not (
+            os.path.exists(self._centroids_file_name)
+            and os.path.exists(self._assignments_file_name)
+        ):
+            return None
+        centroids = np.load(self._centroids_file_name)
+        assignments = np.load(self._assignments_file_name).reshape(-1)
+        n_rows = self._matrix.shape[0]
+        if centroids.shape[1] != self._dim or len(assignments) > n_rows:
+            logger.warning(f"Discarding stale IVF index of {self.namespace}")
+            return None
+        ivf = IVFIndex(centroids, assignments)
+        if len(assignments) < n_rows:
+            # rows appended after the last assignment write
+            self._add_to_ivf(ivf, len(assignments))
+        return ivf
+
+    def _save_ivf(self):
+        _save_npy(self._centroids_file_name, self._ivf.centroids)
+        _save_npy(self._assignments_file_name, self._ivf.assignments.reshape(-1, 1))
+
+    def _add_to_ivf(self, ivf: IVFIndex, start: int):
+        assignments = ivf.assign(self._matrix[start:])
+        ivf.add(assignments)
+        column = assignments.reshape(-1, 1)
+        if not _append_npy_rows(self._assignments_file_name, column):
+            _save_npy(self._assignments_file_name, ivf.assignments.reshape(-1, 1))
+
+    async def _train_ivf(self, nlist: int):
+        n_live = len(self._rows)
+        generation = self._generation
+        start = time.perf_counter()
+        # train off the event loop and without the write lock, so upserts
+        # go on meanwhile; the rows they append are assigned below
+        ivf = await asyncio.to_thread(
+            IVFIndex.train, self._matrix, np.flatnonzero(self._alive), nlist
+        )
+        async with self._write_lock:
+            if self._generation != generation:
+                # a compaction renumbered the rows the lists refer to
+                logger.info(
+                    f"Discarding IVF index of {self.namespace} trained before "
+                    f"a compaction, it is retrained on the next save"
+                )
+                return
+            if len(ivf.assignments) < self._matrix.shape[0]:
+                ivf.add(ivf.assign(self._matrix[len(ivf.assignments) :]))
+            self._ivf = ivf
+            self._save_ivf()
+        logger.info(
+            f"Trained IVF index for {self.namespace}: {len(self._ivf.centroids)} lists "
+            f"over {n_live} vectors in {time.perf_counter() - start:.2f}s"
+        )
+
+    def _open_matrix(self):
+        self._matrix = np.load(self._matrix_file_name, mmap_mode="r")
+
+    def _write_snapshot(
+        self,
+        matrix: np.ndarray,
+        rows: "np.ndarray | None",
+        records: list[tuple],
+        generation: int,
+    ):
+        """Write generation ``generation`` holding matrix[rows] and records.
+
+        The matrix goes to the generation's own file first; replacing the
+        meta log is the commit point, so the previous generation stays
+        readable until then.
+        """
+        _save_npy(self._matrix_path(generation), matrix, rows)
+        tmp_meta = self._meta_file_name + ".tmp"
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"generation": generation}) + "\n")
+            for row, (id_, created_at, meta) in enumerate(records):
+                f.write(self._meta_line(id_, row, created_at, meta))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_meta, self._meta_file_name)
+        _fsync_dir(os.path.dirname(os.path.abspath(self._meta_file_name)))
+
+    @staticmethod
+    def _meta_line(id_: str, row: int, created_at: float, meta: dict) -> str:
+        return (
+            json.dumps(
+                {"id": id_, "row": row, "created_at": created_at, "meta": meta},
+                ensure_ascii=False,
+            )
+            + "\n"
+        )
+
+    def _append_meta(self, lines: list[str]):
+        with open(self._meta_file_name, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _append_rows(self, vectors: np.ndarray) -> int:
+        """Append vectors to the matrix file; returns the first new row index"""
+        start = self._matrix.shape[0]
+        if not _append_npy_rows(self._matrix_file_name, vectors):
+            _save_npy(self._matrix_file_name, np.concatenate([self._matrix, vectors]))
+        self._open_matrix()
+        alive = np.zeros(self._matrix.shape[0], dtype=bool)
+        alive[: len(self._alive)] = self._alive
+        self._alive = alive
+        return start
+
+    async def upsert(self, data: dict[str, dict]):
+        logger.info(f"Inserting {len(data)} vectors to {self.namespace}")
+        if not len(data):
+            logger.warning("You insert an empty data to vector DB")
+            return []
+
+        contents = [v["content"] for v in data.values()]
+        embeddings = await embed_in_batches(
+            self.embedding_func, contents, self._max_batch_size, self.global_config
+        )
+        if len(embeddings) != len(data):
+            # sometimes the embedding is not returned correctly. just log it.
+            logger.error(
+                f"embedding is not 1-1 with data, {len(embeddings)} != {len(data)}"
+            )
+            return []
+
+        async with self._write_lock:
+            current_time = time.time()
+            start = self._append_rows(normalize_rows(embeddings))
+            if self._ivf is not None:
+                self._add_to_ivf(self._ivf, start)
+            if self._coarse is not None:
+                self._coarse = self._append_coarse(start)
+            lines = []
+            for row, (id_, value) in enumerate(data.items(), start):
+                meta = {k: v for k, v in value.items() if k in self.meta_fields}
+                old_row = self._rows.get(id_)
+                if old_row is not None:
+                    self._alive[old_row] = False
+                    self._unindex_meta(old_row, self._records.pop(old_row)[2])
+                self._rows[id_] = row
+                self._records[row] = (id_, current_time, meta)
+                self._alive[row] = True
+                self._index_meta(row, meta)
+                lines.append(self._meta_line(id_, row, current_time, meta))
+            self._append_meta(lines)
+        return list(data)
+
+    async def query(self, query: str, top_k=5, filter: VectorFilter = None):
+        return (await self.query_many([query], top_k, filter=filter))[0]
+
+    async def query_many(
+        self, queries: list[str], top_k=5, filter: VectorFilter = None
+    ) -> list[list[dict]]:
+        """Embed all queries in one call and search them against one filter mask"""
+        embeddings = await self.embedding_func(queries)
+        logger.info(
+            f"Query: {queries[0] if len(queries) == 1 else queries}, top_k: {top_k}, "
+            f"filter: {filter}, cosine_better_than_threshold: {self.cosine_better_than_threshold}"
+        )
+        if not self._rows:
+            return [[] for _ in queries]
+        mask = self._filter_mask(filter) if filter else None
+        return [
+            self._results(query_vector, top_k, mask)
+            for query_vector in normalize_rows(embeddings)
+        ]
+
+    def _results(self, query_vector: np.ndarray, top_k: int, mask: np.ndarray):
+        results = []
+        for row, score in zip(*self._search(query_vector, top_k, mask)):
+            if score < self.cosine_better_than_threshold:
+                break
+            id_, created_at, meta = self._records[int(row)]
+            results.append(
+                {**meta, "id": id_, "distance": float(score), "created_at": created_at}
+            )
+        return results
+
+    def _search(self, query_vector: np.ndarray, top_k: int, mask: np.ndarray = None):
+        """Best live rows (within mask, if given) and their scores, best first"""
+        # candidate rows: the probed IVF lists, or None for all live rows
+        rows = None
+        allowed = self._alive if mask is None else mask
+        n_allowed = len(self._rows) if mask is None else int(mask.sum())
+        # a selective filter leaves few enough rows to scan them exactly
+        if self._ivf is not None and n_allowed > self.ann_min_rows:
+            candidates = self._ivf.candidates(query_vector, self.ann_nprobe)
+            candidates = np.sort(candidates[allowed[candidates]])
+            if len(candidates) >= top_k:
+                rows = candidates
+        if rows is None and mask is not None:
+            rows = np.flatnonzero(mask)
+        n_candidates = len(self._rows) if rows is None else len(rows)
+        top_k = min(top_k, n_candidates)
+        if top_k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if self._coarse is None:
+            scores = self._scores(self._matrix, rows, query_vector)
+        else:
+            scores = self._coarse_scores(rows, query_vector)
+        if rows is None:
+            scores[~self._alive] = -np.inf
+        if self._coarse is None:
+            return self._top_k(rows, scores, top_k)
+        shortlist, _ = self._top_k(
+            rows, scores, min(n_candidates, top_k * self.rerank_factor)
+        )
+        shortlist = np.sort(shortlist)
+        return self._top_k(shortlist, self._matrix[shortlist] @ query_vector, top_k)
+
+    def _scores(self, matrix: np.ndarray, rows: np.ndarray, query_vector: np.ndarray):
+        if rows is not None:
+            return np.asarray(matrix[rows]) @ query_vector
+        scores = np.empty(matrix.shape[0], dtype=np.float32)
+        for start, chunk_scores in _matmul_chunked(matrix, query_vector):
+            scores[start : start + len(chunk_scores)] = chunk_scores
+        return scores
+
+    def _coarse_scores(self, rows: np.ndarray, query_vector: np.ndarray):
+        """Approximate scores from the coarse copy, used to pick the shortlist"""
+        if self.quantization == "int8":
+            # dot products with the dequantized vectors, computed on the codes
+            codes, ranges = self._coarse
+            ranges = ranges if rows is None else ranges[rows]
+            dots = self._scores(codes, rows, query_vector)
+            scale = (ranges[:, 1] - ranges[:, 0]) / 255
+            return (scale * dots + ranges[:, 0] * query_vector.sum()).astype(np.float32)
+        prefix_query = normalize_rows(query_vector[None, : self.prefilter_dim])[0]
+        return self._scores(self._coarse[0], rows, prefix_query)
+
+    @staticmethod
+    def _top_k(rows: np.ndarray, scores: np.ndarray, top_k: int):
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return (best if rows is None else rows[best]), scores[best]
+
+    async def delete(self, ids: list[str]):
+        """Delete vectors with specified IDs
+
+        Args:
+            ids: List of vector IDs to be deleted
+        """
+        lines = []
+        async with self._write_lock:
+            for id_ in ids:
+                row = self._rows.pop(id_, None)
+                if row is None:
+                    continue
+                self._alive[row] = False
+                self._unindex_meta(row, self._records.pop(row)[2])
+                lines.append(json.dumps({"deleted": id_}, ensure_ascii=False) + "\n")
+            if lines:
+                self._append_meta(lines)
+        logger.info(f"Successfully deleted {len(lines)} vectors from {self.namespace}")
+
+    async def delete_entity(self, entity_name: str):
+        entity_id = compute_mdhash_id(entity_name, prefix="ent-")
+        logger.debug(f"Attempting to delete entity {entity_name} with ID {entity_id}")
+        if entity_id in self._rows:
+            await self.delete([entity_id])
+            logger.debug(f"Successfully deleted entity {entity_name}")
+        else:
+            logger.debug(f"Entity {entity_name} not found in storage")
+
+    async def delete_entity_relation(self, entity_name: str):
+        await self.delete_entities_cascade([entity_name])
+
+    async def delete_entities_cascade(self, entity_names: list[str]):
+        # the meta field index doubles as the endpoint -> relation index
+        rows = set()
+        for field_name in ("src_id", "tgt_id"):
+            index = self._meta_index.get(field_name, {})
+            for entity_name in entity_names:
+                rows |= index.get(entity_name, set())
+        ids_to_delete = [self._records[row][0] for row in rows]
+        logger.debug(
+            f"Found {len(ids_to_delete)} relations for {len(entity_names)} entities"
+        )
+        if ids_to_delete:
+            await self.delete(ids_to_delete)
+
+    def _derived_file_names(self) -> list[str]:
+        return [self._centroids_file_name, self._assignments_file_name] + [
+            file_name for file_name, _, _ in self._coarse_layout()
+        ]
+
+    def _write_compacted(self, matrix: np.ndarray, live_rows: np.ndarray, records):
+        # derived files go first: a crash before the commit rebuilds them
+        # from the old generation, one after it from the new
+        for file_name in self._derived_file_names():
+            if os.path.exists(file_name):
+                os.remove(file_name)
+        self._write_snapshot(matrix, live_rows, records, self._generation + 1)
+
+    async def compact(self):
+        """Rewrite the files without dead rows.
+
+        The files are written in a worker thread, streaming live rows from the
+        memmap. Queries keep reading the old generation until the swap;
+        upserts and deletes wait on the write lock.
+        """
+        async with self._write_lock:
+            live_rows = np.array(sorted(self._records), dtype=np.int64)
+            records = [self._records[row] for row in live_rows]
+            dead = self._matrix.shape[0] - len(live_rows)
+            await asyncio.to_thread(
+                self._write_compacted, self._matrix, live_rows, records
+            )
+            old_matrix_file_name = self._matrix_file_name
+            self._generation += 1
+            self._matrix_file_name = self._matrix_path(self._generation)
+            self._open_matrix()
+            self._rows = {id_: row for row, (id_, _, _) in enumerate(records)}
+            self._records = dict(enumerate(records))
+            self._alive = np.ones(len(records), dtype=bool)
+            self._build_meta_index()
+            # row numbers changed, so the IVF lists are rebuilt from scratch
+            # and queries scan the float32 matrix until the coarse copy is back
+            self._ivf = None
+            self._coarse = None
+            os.remove(old_matrix_file_name)
+            self._coarse = await asyncio.to_thread(self._load_coarse)
+        logger.info(f"Compacted numpy vdb {self.namespace}, dropped {dead} dead rows")
+
+    async def index_done_callback(self):
+        # upserts and deletes are already on disk; only compaction and
+        # (re)training the IVF index are pending
+        n_rows = self._matrix.shape[0]
+        if n_rows and n_rows - len(self._rows) > self.compact_dead_ratio * n_rows:
+            await self.compact()
+        if self.ann_index == "ivf" and len(self._rows) >= self.ann_min_rows:
+            nlist = self.ann_nlist or int(4 * np.sqrt(len(self._rows)))
+            # retrain when the namespace has outgrown its lists
+            if self._ivf is None or len(self._ivf.centroids) < nlist // 2:
+                await self._train_ivf(nlist)
@@ -18,6 +18,9 @@ from ..base import (
     BaseGraphStorage,
     BaseKVStorage,
     BaseVectorStorage,
+    VectorFilter,
+    check_filter_fields,
+    filter_values,
 )
 
 import oracledb
@@ -212,6 +215,8 @@ class OracleKVStorage(BaseKVStorage):
 
     async def get_by_ids(self, ids: list[str], fields=None) -> Union[list[dict], None]:
         """get doc_chunks data based on id"""
+        if not ids:
+            return None
         SQL = SQL_TEMPLATES["get_by_ids_" + self.namespace].format(
             ids=",".join([f"'{id}'" for id in ids])
         )
@@ -229,6 +234,15 @@ class OracleKVStorage(BaseKVStorage):
             for row in res:
                 dict_res[row["mode"]][row["id"]] = row
             res = [{k: v} for k, v in dict_res.items()]
+        elif res:
+            # align rows with the requested ids, None for missing ones
+            rows = {row["id"]: row for row in res}
+            res = [
+                {k: v for k, v in rows[id].items() if fields is None or k in fields}
+                if id in rows
+                else None
+                for id in ids
+            ]
         if res:
             data = res  # [{"data":i} for i in res]
             # print(data)
@@ -355,30 +369,69 @@ class OracleVectorDBStorage(BaseVectorStorage):
         """向向量数据库中插入数据"""
         pass
 
+    async def delete(self, ids: list[str]):
+        # like upsert: entity and relation vectors are columns of the graph
+        # rows, which OracleGraphStorage deletes
+        pass
+
+    async def delete_entities_cascade(self, entity_names: list[str]):
+        if self.namespace != "relationships" or not entity_names:
+            return
+        binds = ",".join(f":name_{i}" for i in range(len(entity_names)))
+        params = {
+            "workspace": self.db.workspace,
+            **{f"name_{i}": name for i, name in enumerate(entity_names)},
+        }
+        await self.db.execute(
+            SQL_TEMPLATES["delete_entity_relations"].format(names=binds), params
+        )
+
     async def index_done_callback(self):
         pass
 
     #################### query method ###############
-    async def query(self, query: str, top_k=5) -> Union[dict, list[dict]]:
+    def _filter_clause(self, filter: VectorFilter):
+        """WHERE conditions and their bind params for a filter"""
+        columns = FILTER_COLUMNS.get(self.namespace, {})
+        check_filter_fields(filter, columns, self.namespace)
+        clause, params = "", {}
+        for i, (field_name, value) in enumerate((filter or {}).items()):
+            binds = []
+            for j, accepted in enumerate(filter_values(value)):
+                params[f"filter_{i}_{j}"] = accepted
+                binds.append(f":filter_{i}_{j}")
+            clause += f" AND {columns[field_name]} IN ({','.join(binds)})"
+        return clause, params
+
+    async def query(
+        self, query: str, top_k=5, filter: VectorFilter = None
+    ) -> Union[dict, list[dict]]:
         """从向量数据库中查询数据"""
-        embeddings = await self.embedding_func([query])
-        embedding = embeddings[0]
+        return (await self.query_many([query], top_k, filter=filter))[0]
+
+    async def query_many(
+        self, queries: list[str], top_k=5, filter: VectorFilter = None
+    ) -> list[list[dict]]:
+        embeddings = await self.embedding_func(queries)
+        filter_clause, filter_params = self._filter_clause(filter)
         # 转换精度
-        dtype = str(embedding.dtype).upper()
-        dimension = embedding.shape[0]
-        embedding_string = "[" + ", ".join(map(str, embedding.tolist())) + "]"
+        SQL = SQL_TEMPLATES[self.namespace].format(
+            dimension=embeddings.shape[1],
+            dtype=str(embeddings.dtype).upper(),
+            filter_clause=filter_clause,
+        )
 
-        SQL = SQL_TEMPLATES[self.namespace].format(dimension=dimension, dtype=dtype)
-        params = {
-            "embedding_string": embedding_string,
-            "workspace": self.db.workspace,
-            "top_k": top_k,
-            "better_than_threshold": self.cosine_better_than_threshold,
-        }
-        # print(SQL)
-        results = await self.db.query(SQL, params=params, multirows=True)
-        # print("vector search result:",results)
-        return results
+        async def query_embedding(embedding):
+            params = {
+                "embedding_string": "[" + ", ".join(map(str, embedding.tolist())) + "]",
+                "workspace": self.db.workspace,
+                "top_k": top_k,
+                "better_than_threshold": self.cosine_better_than_threshold,
+                **filter_params,
+            }
+            return await self.db.query(SQL, params=params, multirows=True)
+
+        return list(await asyncio.gather(*[query_embedding(e) for e in embeddings]))
 
 
 @dataclass
@@ -490,6 +543,12 @@ class OracleGraphStorage(BaseGraphStorage):
             "Node and edge data had been saved into oracle db already, so nothing to do here!"
         )
 
+    async def delete_node(self, node_id: str):
+        """删除节点及其所有边"""
+        params = {"workspace": self.db.workspace, "name": node_id}
+        await self.db.execute(SQL_TEMPLATES["delete_node_edges"], params)
+        await self.db.execute(SQL_TEMPLATES["delete_node"], params)
+
     #################### query method #################
     async def has_node(self, node_id: str) -> bool:
         """根据节点id检查节点是否存在"""
@@ -619,6 +678,13 @@ N_T = {
     "relationships": "LIGHTRAG_GRAPH_EDGES",
 }
 
+# vector query filter fields -> table columns, per namespace
+FILTER_COLUMNS = {
+    "chunks": {"full_doc_id": "full_doc_id", "chunk_order_index": "chunk_order_index"},
+    "entities": {"entity_name": "name", "entity_type": "entity_type"},
+    "relationships": {"src_id": "source_name", "tgt_id": "target_name"},
+}
+
 TABLES = {
     "LIGHTRAG_DOC_FULL": {
         "ddl": """CREATE TABLE LIGHTRAG_DOC_FULL (
@@ -757,15 +823,15 @@ SQL_TEMPLATES = {
     # SQL for VectorStorage
     "entities": """SELECT name as entity_name FROM
         (SELECT id,name,VECTOR_DISTANCE(content_vector,vector(:embedding_string,{dimension},{dtype}),COSINE) as distance
-        FROM LIGHTRAG_GRAPH_NODES WHERE workspace=:workspace)
+        FROM LIGHTRAG_GRAPH_NODES WHERE workspace=:workspace{filter_clause})
         WHERE distance>:better_than_threshold ORDER BY distance ASC FETCH FIRST :top_k ROWS ONLY""",
     "relationships": """SELECT source_name as src_id, target_name as tgt_id FROM
         (SELECT id,source_name,target_name,VECTOR_DISTANCE(content_vector,vector(:embedding_string,{dimension},{dtype}),COSINE) as distance
-        FROM LIGHTRAG_GRAPH_EDGES WHERE workspace=:workspace)
+        FROM LIGHTRAG_GRAPH_EDGES WHERE workspace=:workspace{filter_clause})
         WHERE distance>:better_than_threshold ORDER BY distance ASC FETCH FIRST :top_k ROWS ONLY""",
     "chunks": """SELECT id FROM
         (SELECT id,VECTOR_DISTANCE(content_vector,vector(:embedding_string,{dimension},{dtype}),COSINE) as distance
-        FROM LIGHTRAG_DOC_CHUNKS WHERE workspace=:workspace)
+        FROM LIGHTRAG_DOC_CHUNKS WHERE workspace=:workspace{filter_clause})
         WHERE distance>:better_than_threshold ORDER BY distance ASC FETCH FIRST :top_k ROWS ONLY""",
     # SQL for GraphStorage
     "has_node": """SELECT * FROM GRAPH_TABLE (lightrag_graph
@@ -803,6 +869,13 @@ SQL_TEMPLATES = {
             WHERE e.workspace=:workspace and a.workspace=:workspace and b.workspace=:workspace
             AND a.name=:source_node_id
             COLUMNS (a.name as source_name,b.name as target_name))""",
+    "delete_node": """DELETE FROM LIGHTRAG_GRAPH_NODES
+                    WHERE workspace=:workspace AND name=:name""",
+    "delete_node_edges": """DELETE FROM LIGHTRAG_GRAPH_EDGES
+                    WHERE workspace=:workspace AND (source_name=:name OR target_name=:name)""",
+    "delete_entity_relations": """DELETE FROM LIGHTRAG_GRAPH_EDGES
+                    WHERE workspace=:workspace
+                    AND (source_name IN ({names}) OR target_name IN ({names}))""",
     "merge_node": """MERGE INTO LIGHTRAG_GRAPH_NODES a
                     USING DUAL
                     ON (a.workspace=:workspace and a.name=:name)
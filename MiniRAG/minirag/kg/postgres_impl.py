@@ -2,6 +2,7 @@ import asyncio
 import inspect
 import json
 import os
+import struct
 import time
 from dataclasses import dataclass
 from typing import Union, List, Dict, Set, Any, Tuple
@@ -14,7 +15,6 @@ if not pm.is_installed("asyncpg"):
 
 import asyncpg
 import sys
-from tqdm.asyncio import tqdm as tqdm_async
 from tenacity import (
     retry,
     retry_if_exception_type,
@@ -22,7 +22,7 @@ from tenacity import (
     wait_exponential,
 )
 
-from ..utils import logger
+from ..utils import embed_in_batches, logger
 from ..base import (
     BaseKVStorage,
     BaseVectorStorage,
@@ -30,6 +30,9 @@ from ..base import (
     DocStatus,
     DocProcessingStatus,
     BaseGraphStorage,
+    VectorFilter,
+    check_filter_fields,
+    filter_values,
 )
 
 if sys.platform.startswith("win"):
@@ -38,6 +41,17 @@ if sys.platform.startswith("win"):
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
 
+def _encode_vector(vector) -> bytes:
+    """pgvector binary send format: dim, unused, big-endian float32 values"""
+    vector = np.asarray(vector, dtype=">f4").reshape(-1)
+    return struct.pack(">HH", len(vector), 0) + vector.tobytes()
+
+
+def _decode_vector(data: bytes) -> np.ndarray:
+    dim, _ = struct.unpack_from(">HH", data)
+    return np.frombuffer(data, dtype=">f4", count=dim, offset=4).astype(np.float32)
+
+
 class PostgreSQLDB:
     def __init__(self, config, **kwargs):
         self.pool = None
@@ -49,6 +63,11 @@ class PostgreSQLDB:
         self.workspace = config.get("workspace", "default")
         self.max = 12
         self.increment = 1
+        # send vectors in pgvector's binary format when the extension exists;
+        # "binary_vectors": False keeps the text format
+        self.binary_vectors = config.get("binary_vectors", True)
+        # decided for the whole pool; every connection registers the codec
+        self.vector_codec = False
         logger.info(f"Using the label {self.workspace} for PostgreSQL as identifier")
 
         if self.user is None or self.password is None or self.database is None:
@@ -66,11 +85,13 @@ class PostgreSQLDB:
                 port=self.port,
                 min_size=1,
                 max_size=self.max,
+                init=self._init_connection,
             )
 
             logger.info(
                 f"Connected to PostgreSQL database at {self.host}:{self.port}/{self.database}"
             )
+            await self.enable_vector_codec()
         except Exception as e:
             logger.error(
                 f"Failed to connect to PostgreSQL database at {self.host}:{self.port}/{self.database}"
@@ -78,6 +99,41 @@ class PostgreSQLDB:
             logger.error(f"PostgreSQL database error: {e}")
             raise
 
+    async def _init_connection(self, connection: asyncpg.Connection):
+        if self.vector_codec:
+            # no fallback: a connection without the codec would be handed
+            # numpy arrays, so failing to register it fails the connection
+            await connection.set_type_codec(
+                "vector",
+                schema="public",
+                encoder=_encode_vector,
+                decoder=_decode_vector,
+                format="binary",
+            )
+
+    async def enable_vector_codec(self):
+        """Switch the pool to binary vectors once the pgvector extension exists.
+
+        Open connections are expired so that every connection is recreated
+        with the codec; call this again after creating the extension.
+        """
+        if self.vector_codec or not self.binary_vectors:
+            return
+        has_vector = await self.pool.fetchval(
+            "SELECT 1 FROM pg_type WHERE typname = 'vector'"
+            " AND typnamespace = 'public'::regnamespace"
+        )
+        if has_vector:
+            self.vector_codec = True
+            await self.pool.expire_connections()
+            logger.info("Sending vectors to PostgreSQL in binary format")
+
+    def encode_vector(self, vector):
+        """Query/upsert parameter for a vector column"""
+        if self.vector_codec:
+            return np.asarray(vector, dtype=np.float32)
+        return "[" + ",".join(map(str, np.asarray(vector).tolist())) + "]"
+
     async def check_tables(self):
         for k, v in TABLES.items():
             try:
@@ -92,6 +148,7 @@ class PostgreSQLDB:
                     logger.error(f"Failed to create table {k} in PostgreSQL database")
                     logger.error(f"PostgreSQL database error: {e}")
 
+        await self.enable_vector_codec()
         logger.info("Finished checking all tables in PostgreSQL database")
 
     async def query(
@@ -161,6 +218,60 @@ class PostgreSQLDB:
             print(data)
             raise
 
+    async def executemany(self, sql: str, rows: list[dict]):
+        """Run one statement for many parameter dicts in a single pipeline"""
+        if not rows:
+            return
+        try:
+            async with self.pool.acquire() as connection:
+                await connection.executemany(sql, [tuple(row.values()) for row in rows])
+        except Exception as e:
+            logger.error(
+                f"PostgreSQL database error: {e.__class__} - {e}\n"
+                f"statement: {sql}\nrows: {len(rows)}"
+            )
+            raise
+
+    async def copy_upsert(self, table_name: str, rows: list[dict]):
+        """Binary COPY rows into a staging table, then upsert them in one statement.
+
+        All rows must have the same keys (the columns written) and unique
+        (workspace, id).
+        """
+        if not rows:
+            return
+        columns = list(rows[0])
+        staging_table = f"{table_name}_staging"
+        upsert_sql = SQL_TEMPLATES["upsert_from_staging"].format(
+            table_name=table_name,
+            staging_table=staging_table,
+            columns=", ".join(columns),
+            updates=", ".join(
+                f"{column}=EXCLUDED.{column}"
+                for column in columns
+                if column not in ("workspace", "id")
+            ),
+        )
+        try:
+            async with self.pool.acquire() as connection:
+                async with connection.transaction():
+                    await connection.execute(
+                        f"CREATE TEMP TABLE {staging_table} "
+                        f"(LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP"
+                    )
+                    await connection.copy_records_to_table(
+                        staging_table,
+                        records=[tuple(row.values()) for row in rows],
+                        columns=columns,
+                    )
+                    await connection.execute(upsert_sql)
+        except Exception as e:
+            logger.error(
+                f"PostgreSQL database error: {e.__class__} - {e}\n"
+                f"COPY into {table_name} ({len(rows)} rows), then: {upsert_sql}"
+            )
+            raise
+
     @staticmethod
     async def _prerequisite(conn: asyncpg.Connection, graph_name: str):
         try:
@@ -214,6 +325,8 @@ class PGKVStorage(BaseKVStorage):
     # Query by id
     async def get_by_ids(self, ids: List[str], fields=None) -> Union[List[dict], None]:
         """Get doc_chunks data by id"""
+        if not ids:
+            return None
         sql = SQL_TEMPLATES["get_by_ids_" + self.namespace].format(
             ids=",".join([f"'{id}'" for id in ids])
         )
@@ -232,6 +345,15 @@ class PGKVStorage(BaseKVStorage):
             res = [{k: v} for k, v in dict_res.items()]
         else:
             res = await self.db.query(sql, params, multirows=True)
+            if res:
+                # align rows with the requested ids, None for missing ones
+                rows = {row["id"]: row for row in res}
+                res = [
+                    {k: v for k, v in rows[id].items() if fields is None or k in fields}
+                    if id in rows
+                    else None
+                    for id in ids
+                ]
         if res:
             return res
         else:
@@ -242,9 +364,16 @@ class PGKVStorage(BaseKVStorage):
             sql = "select workspace,mode,id from lightrag_llm_cache"
             res = await self.db.query(sql, multirows=True)
             return res
+        elif self.namespace in NAMESPACE_TABLE_MAP:
+            sql = SQL_TEMPLATES["all_keys"].format(
+                table_name=NAMESPACE_TABLE_MAP[self.namespace]
+            )
+            params = {"workspace": self.db.workspace}
+            res = await self.db.query(sql, params, multirows=True)
+            return [row["id"] for row in res or []]
         else:
-            logger.error(
-                f"all_keys is only implemented for llm_response_cache, not for {self.namespace}"
+            raise NotImplementedError(
+                f"all_keys is not implemented for {self.namespace}"
             )
 
     async def filter_keys(self, keys: List[str]) -> Set[str]:
@@ -272,27 +401,30 @@ class PGKVStorage(BaseKVStorage):
         if self.namespace == "text_chunks":
             pass
         elif self.namespace == "full_docs":
-            for k, v in data.items():
-                upsert_sql = SQL_TEMPLATES["upsert_doc_full"]
-                _data = {
+            upsert_sql = SQL_TEMPLATES["upsert_doc_full"]
+            rows = [
+                {
                     "id": k,
                     "content": v["content"],
                     "workspace": self.db.workspace,
                 }
-                await self.db.execute(upsert_sql, _data)
+                for k, v in data.items()
+            ]
+            await self.db.executemany(upsert_sql, rows)
         elif self.namespace == "llm_response_cache":
-            for mode, items in data.items():
-                for k, v in items.items():
-                    upsert_sql = SQL_TEMPLATES["upsert_llm_response_cache"]
-                    _data = {
-                        "workspace": self.db.workspace,
-                        "id": k,
-                        "original_prompt": v["original_prompt"],
-                        "return_value": v["return"],
-                        "mode": mode,
-                    }
-
-                    await self.db.execute(upsert_sql, _data)
+            upsert_sql = SQL_TEMPLATES["upsert_llm_response_cache"]
+            rows = [
+                {
+                    "workspace": self.db.workspace,
+                    "id": k,
+                    "original_prompt": v["original_prompt"],
+                    "return_value": v["return"],
+                    "mode": mode,
+                }
+                for mode, items in data.items()
+                for k, v in items.items()
+            ]
+            await self.db.executemany(upsert_sql, rows)
 
     async def index_done_callback(self):
         if self.namespace in ["full_docs", "text_chunks"]:
@@ -322,7 +454,7 @@ class PGVectorStorage(BaseVectorStorage):
                 "chunk_order_index": item["chunk_order_index"],
                 "full_doc_id": item["full_doc_id"],
                 "content": item["content"],
-                "content_vector": json.dumps(item["__vector__"].tolist()),
+                "content_vector": self.db.encode_vector(item["__vector__"]),
             }
         except Exception as e:
             logger.error(f"Error to prepare upsert sql: {e}")
@@ -337,7 +469,7 @@ class PGVectorStorage(BaseVectorStorage):
             "id": item["__id__"],
             "entity_name": item["entity_name"],
             "content": item["content"],
-            "content_vector": json.dumps(item["__vector__"].tolist()),
+            "content_vector": self.db.encode_vector(item["__vector__"]),
         }
         return upsert_sql, data
 
@@ -349,7 +481,7 @@ class PGVectorStorage(BaseVectorStorage):
             "source_id": item["src_id"],
             "target_id": item["tgt_id"],
             "content": item["content"],
-            "content_vector": json.dumps(item["__vector__"].tolist()),
+            "content_vector": self.db.encode_vector(item["__vector__"]),
         }
         return upsert_sql, data
 
@@ -368,55 +500,84 @@ class PGVectorStorage(BaseVectorStorage):
             for k, v in data.items()
         ]
         contents = [v["content"] for v in data.values()]
-        batches = [
-            contents[i : i + self._max_batch_size]
-            for i in range(0, len(contents), self._max_batch_size)
-        ]
-
-        async def wrapped_task(batch):
-            result = await self.embedding_func(batch)
-            pbar.update(1)
-            return result
-
-        embedding_tasks = [wrapped_task(batch) for batch in batches]
-        pbar = tqdm_async(
-            total=len(embedding_tasks), desc="Generating embeddings", unit="batch"
+        embeddings = await embed_in_batches(
+            self.embedding_func, contents, self._max_batch_size, self.global_config
         )
-        embeddings_list = await asyncio.gather(*embedding_tasks)
-
-        embeddings = np.concatenate(embeddings_list)
         for i, d in enumerate(list_data):
             d["__vector__"] = embeddings[i]
-        for item in list_data:
-            if self.namespace == "chunks":
-                upsert_sql, data = self._upsert_chunks(item)
-            elif self.namespace == "entities":
-                upsert_sql, data = self._upsert_entities(item)
-            elif self.namespace == "relationships":
-                upsert_sql, data = self._upsert_relationships(item)
-            else:
-                raise ValueError(f"{self.namespace} is not supported")
-
-            await self.db.execute(upsert_sql, data)
+        if self.namespace == "chunks":
+            prepare = self._upsert_chunks
+        elif self.namespace == "entities":
+            prepare = self._upsert_entities
+        elif self.namespace == "relationships":
+            prepare = self._upsert_relationships
+        else:
+            raise ValueError(f"{self.namespace} is not supported")
+        statements = [prepare(item) for item in list_data]
+        rows = [row for _, row in statements]
+        if self.db.vector_codec:
+            # binary COPY needs a binary codec for every column
+            await self.db.copy_upsert(NAMESPACE_TABLE_MAP[self.namespace], rows)
+        else:
+            await self.db.executemany(statements[0][0], rows)
 
     async def index_done_callback(self):
         logger.info("vector data had been saved into postgresql db!")
 
     #################### query method ###############
-    async def query(self, query: str, top_k=5) -> Union[dict, list[dict]]:
+    def _filter_clause(self, filter: VectorFilter, first_param: int):
+        """WHERE conditions and their params for a filter, numbered from first_param"""
+        columns = FILTER_COLUMNS.get(self.namespace, {})
+        check_filter_fields(filter, columns, self.namespace)
+        clause, params = "", {}
+        for i, (field_name, value) in enumerate((filter or {}).items()):
+            clause += f" AND {columns[field_name]} = ANY(${first_param + i})"
+            params[f"filter_{field_name}"] = filter_values(value)
+        return clause, params
+
+    async def query(
+        self, query: str, top_k=5, filter: VectorFilter = None
+    ) -> Union[dict, list[dict]]:
         """从向量数据库中查询数据"""
-        embeddings = await self.embedding_func([query])
-        embedding = embeddings[0]
-        embedding_string = ",".join(map(str, embedding))
+        return (await self.query_many([query], top_k, filter=filter))[0]
+
+    async def query_many(
+        self, queries: list[str], top_k=5, filter: VectorFilter = None
+    ) -> list[list[dict]]:
+        embeddings = await self.embedding_func(queries)
+        filter_clause, filter_params = self._filter_clause(filter, 5)
+        # the SQL text is the same for every query, so asyncpg reuses its
+        # prepared statement
+        sql = SQL_TEMPLATES[self.namespace].format(filter_clause=filter_clause)
+
+        async def query_embedding(embedding):
+            params = {
+                "workspace": self.db.workspace,
+                "better_than_threshold": self.cosine_better_than_threshold,
+                "top_k": top_k,
+                "embedding": self.db.encode_vector(embedding),
+                **filter_params,
+            }
+            return await self.db.query(sql, params=params, multirows=True)
 
-        sql = SQL_TEMPLATES[self.namespace].format(embedding_string=embedding_string)
-        params = {
-            "workspace": self.db.workspace,
-            "better_than_threshold": self.cosine_better_than_threshold,
-            "top_k": top_k,
-        }
-        results = await self.db.query(sql, params=params, multirows=True)
-        return results
+        return list(await asyncio.gather(*[query_embedding(e) for e in embeddings]))
+
+    async def delete(self, ids: list[str]):
+        table_name = NAMESPACE_TABLE_MAP.get(self.namespace)
+        if table_name is None:
+            # upsert rejects these namespaces, so nothing was stored
+            logger.warning(f"{self.namespace} is not supported, nothing to delete")
+            return
+        if ids:
+            params = {"workspace": self.db.workspace, "ids": list(ids)}
+            sql = SQL_TEMPLATES["delete_vectors"].format(table_name=table_name)
+            await self.db.execute(sql, params)
+
+    async def delete_entities_cascade(self, entity_names: list[str]):
+        if self.namespace != "relationships":
+            return
+        params = {"workspace": self.db.workspace, "entity_names": list(entity_names)}
+        await self.db.execute(SQL_TEMPLATES["delete_entity_relations"], params)
 
 
 @dataclass
@@ -1015,6 +1176,13 @@ NAMESPACE_TABLE_MAP = {
     "llm_response_cache": "LIGHTRAG_LLM_CACHE",
 }
 
+# vector query filter fields -> table columns, per namespace
+FILTER_COLUMNS = {
+    "chunks": {"full_doc_id": "full_doc_id", "chunk_order_index": "chunk_order_index"},
+    "entities": {"entity_name": "entity_name"},
+    "relationships": {"src_id": "source_id", "tgt_id": "target_id"},
+}
+
 
 TABLES = {
     "LIGHTRAG_DOC_FULL": {
@@ -1122,6 +1290,7 @@ SQL_TEMPLATES = {
                                  FROM LIGHTRAG_LLM_CACHE WHERE workspace=$1 AND mode= IN ({ids})
                                 """,
     "filter_keys": "SELECT id FROM {table_name} WHERE workspace=$1 AND id IN ({ids})",
+    "all_keys": "SELECT id FROM {table_name} WHERE workspace=$1",
     "upsert_doc_full": """INSERT INTO LIGHTRAG_DOC_FULL (id, content, workspace)
                         VALUES ($1, $2, $3)
                         ON CONFLICT (workspace,id) DO UPDATE
@@ -1163,20 +1332,30 @@ SQL_TEMPLATES = {
                       content=EXCLUDED.content,
                       content_vector=EXCLUDED.content_vector, update_time = CURRENT_TIMESTAMP
                      """,
-    # SQL for VectorStorage
+    "upsert_from_staging": """INSERT INTO {table_name} ({columns})
+        SELECT {columns} FROM {staging_table}
+        ON CONFLICT (workspace,id) DO UPDATE
+        SET {updates}, update_time = CURRENT_TIMESTAMP
+       """,
+    "delete_vectors": """DELETE FROM {table_name} WHERE workspace=$1 AND id = ANY($2)
+       """,
+    "delete_entity_relations": """DELETE FROM LIGHTRAG_VDB_RELATION
+        WHERE workspace=$1 AND (source_id = ANY($2) OR target_id = ANY($2))
+       """,
+    # SQL for VectorStorage, {filter_clause} holds the optional metadata filter
     "entities": """SELECT entity_name FROM
-        (SELECT id, entity_name, 1 - (content_vector <=> '[{embedding_string}]'::vector) as distance
-        FROM LIGHTRAG_VDB_ENTITY where workspace=$1)
+        (SELECT id, entity_name, 1 - (content_vector <=> $4::vector) as distance
+        FROM LIGHTRAG_VDB_ENTITY where workspace=$1{filter_clause})
         WHERE distance>$2 ORDER BY distance DESC  LIMIT $3
        """,
     "relationships": """SELECT source_id as src_id, target_id as tgt_id FROM
-        (SELECT id, source_id,target_id, 1 - (content_vector <=> '[{embedding_string}]'::vector) as distance
-        FROM LIGHTRAG_VDB_RELATION where workspace=$1)
+        (SELECT id, source_id,target_id, 1 - (content_vector <=> $4::vector) as distance
+        FROM LIGHTRAG_VDB_RELATION where workspace=$1{filter_clause})
         WHERE distance>$2 ORDER BY distance DESC  LIMIT $3
        """,
     "chunks": """SELECT id FROM
-        (SELECT id, 1 - (content_vector <=> '[{embedding_string}]'::vector) as distance
-        FROM LIGHTRAG_DOC_CHUNKS where workspace=$1)
+        (SELECT id, 1 - (content_vector <=> $4::vector) as distance
+        FROM LIGHTRAG_DOC_CHUNKS where workspace=$1{filter_clause})
         WHERE distance>$2 ORDER BY distance DESC  LIMIT $3
        """,
 }
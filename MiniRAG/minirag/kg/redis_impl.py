@@ -31,16 +31,15 @@ class RedisKVStorage(BaseKVStorage):
         return json.loads(data) if data else None
 
     async def get_by_ids(self, ids, fields=None):
-        pipe = self._redis.pipeline()
-        for id in ids:
-            pipe.get(f"{self.namespace}:{id}")
-        results = await pipe.execute()
+        if not ids:
+            return []
+        results = await self._redis.mget([f"{self.namespace}:{id}" for id in ids])
 
         if fields:
             # Filter fields if specified
             return [
                 {field: value.get(field) for field in fields if field in value}
-                if (value := json.loads(result))
+                if result and (value := json.loads(result))
                 else None
                 for result in results
             ]
@@ -6,11 +6,21 @@ from dataclasses import dataclass, field
 from minirag.base import (
     BaseVectorStorage,
     BaseKVStorage,
-    BaseGraphStorage
+    BaseGraphStorage,
+    VectorFilter,
+    check_filter_fields,
+    filter_values,
 )
+from minirag.utils import ClientThreadPools, logger
+
+# the v3 client blocks; its calls run in dedicated threads, with batch
+# imports on their own pool so queries keep their latency during ingestion.
+# The client's batch object is not thread-safe, so there is one writer.
+_client_pools = ClientThreadPools("weaviate", write_threads=1)
+
 
 async def run_sync(func, *args, **kwargs):
-    return await asyncio.to_thread(func, *args, **kwargs)
+    return await _client_pools.read(func, *args, **kwargs)
 
 @dataclass
 class WeaviateVectorStorage(BaseVectorStorage):
@@ -18,6 +28,12 @@ class WeaviateVectorStorage(BaseVectorStorage):
 
     def __post_init__(self):
         self.client = weaviate.Client(url="http://localhost:8080")
+        # dynamic batching sizes each import request from the server's latency;
+        # per-object failures only reach the callback, they are never raised
+        self._batch_errors = []
+        self.client.batch.configure(
+            batch_size=100, dynamic=True, callback=self._record_batch_errors
+        )
         self.init_schema()
         # We assume `namespace` holds the weaviate URL
     def init_schema(self):
@@ -30,36 +46,92 @@ class WeaviateVectorStorage(BaseVectorStorage):
         except WeaviateQueryException as e:
             print(f"Vector schema init error: {e}")
 
-    async def query(self, query: str, top_k: int) -> List[Dict]:
+    @staticmethod
+    def _where_operand(field_name: str, value: Any) -> Dict:
+        if isinstance(value, bool):
+            value_key = "valueBoolean"
+        elif isinstance(value, int):
+            value_key = "valueInt"
+        elif isinstance(value, float):
+            value_key = "valueNumber"
+        else:
+            value_key = "valueText"
+        return {"path": [field_name], "operator": "Equal", value_key: value}
+
+    def _where(self, filter: VectorFilter) -> Dict:
+        """Weaviate where filter: Or over accepted values, And over fields"""
+        check_filter_fields(filter, self.meta_fields, self.namespace)
+        operands = []
+        for field_name, value in filter.items():
+            field_operands = [
+                self._where_operand(field_name, accepted)
+                for accepted in filter_values(value)
+            ]
+            operands.append(
+                field_operands[0]
+                if len(field_operands) == 1
+                else {"operator": "Or", "operands": field_operands}
+            )
+        if len(operands) == 1:
+            return operands[0]
+        return {"operator": "And", "operands": operands}
+
+    async def query(
+        self, query: str, top_k: int, filter: VectorFilter = None
+    ) -> List[Dict]:
         try:
             near_text = {"concepts": [query]}
-            response = await run_sync(
-                self.client.query.get, "Document", ["content"]
-            )
-            response = (
-                self.client.query.get("Document", ["content"])
-                .with_near_text(near_text)
-                .with_limit(top_k)
-                .do()
-            )
+            request = self.client.query.get("Document", ["content"])
+            if filter:
+                request = request.with_where(self._where(filter))
+            request = request.with_near_text(near_text).with_limit(top_k)
+            response = await run_sync(request.do)
             return response.get("data", {}).get("Get", {}).get("Document", [])
         except WeaviateQueryException as e:
             print(f"Weaviate query error: {e}")
             return []
 
+    def _record_batch_errors(self, results: Union[List[Dict], None]):
+        for result in results or []:
+            errors = result.get("result", {}).get("errors", {}).get("error", [])
+            if errors:
+                self._batch_errors.append(
+                    (result.get("id"), [error.get("message") for error in errors])
+                )
+
+    def _import_objects(self, objects: List[tuple[str, Dict]]) -> List[tuple]:
+        """Batch-import objects; returns (id, error messages) of failed ones"""
+        self._batch_errors = []
+        # the batch context flushes whatever is left on exit
+        with self.client.batch as batch:
+            for _id, obj in objects:
+                batch.add_data_object(obj, "Document", uuid=_id)
+        return self._batch_errors
+
     async def upsert(self, data: Dict[str, Dict]):
         # data: {id: {content: str, embedding: list[float], ...}}
-        for _id, value in data.items():
-            try:
-                # Weaviate expects data objects for upsert
-                obj = {
+        objects = [
+            (
+                _id,
+                {
                     "content": value.get("content"),
-                }
-                await run_sync(
-                    self.client.data_object.create, obj, "Document", _id
-                )
-            except WeaviateQueryException as e:
-                print(f"Error upserting id {_id} to weaviate: {e}")
+                    # stored as properties so queries can filter on them
+                    **{k: v for k, v in value.items() if k in self.meta_fields},
+                },
+            )
+            for _id, value in data.items()
+        ]
+        try:
+            failed = await _client_pools.write(self._import_objects, objects)
+        except WeaviateQueryException as e:
+            print(f"Error upserting {len(objects)} objects to weaviate: {e}")
+            return
+        for _id, messages in failed:
+            logger.error(f"Error upserting id {_id} to weaviate: {'; '.join(messages)}")
+        if failed:
+            logger.error(
+                f"{len(failed)} of {len(objects)} objects failed to import into weaviate"
+            )
 
     async def delete(self, ids: List[str]):
         for _id in ids:
@@ -68,6 +140,24 @@ class WeaviateVectorStorage(BaseVectorStorage):
             except WeaviateQueryException as e:
                 print(f"Error deleting id {_id}: {e}")
 
+    async def delete_entities_cascade(self, entity_names: List[str]):
+        if not entity_names or not {"src_id", "tgt_id"} <= self.meta_fields:
+            return
+        where = {
+            "operator": "Or",
+            "operands": [
+                self._where_operand(field_name, entity_name)
+                for field_name in ("src_id", "tgt_id")
+                for entity_name in entity_names
+            ],
+        }
+        try:
+            await _client_pools.write(
+                self.client.batch.delete_objects, class_name="Document", where=where
+            )
+        except WeaviateQueryException as e:
+            print(f"Error deleting relations of {entity_names}: {e}")
+
     async def clear(self):
         try:
             await run_sync(self.client.batch.delete_objects, class_name="Document")
@@ -110,13 +200,13 @@ class WeaviateKVStorage(BaseKVStorage):
             return None
 
     async def get_by_ids(self, ids: List[str], fields: Union[Set[str], None] = None) -> List[Union[Dict, None]]:
-        results = []
-        for _id in ids:
-            data = await self.get_by_id(_id)
-            if data and fields:
-                data = {k: v for k, v in data.items() if k in fields}
-            results.append(data)
-        return results
+        results = await asyncio.gather(*[self.get_by_id(_id) for _id in ids])
+        if fields:
+            results = [
+                {k: v for k, v in data.items() if k in fields} if data else data
+                for data in results
+            ]
+        return list(results)
 
     async def filter_keys(self, data: List[str]) -> Set[str]:
         existing_keys = set(await self.all_keys())
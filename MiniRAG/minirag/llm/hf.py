@@ -52,7 +52,11 @@ if not pm.is_installed("torch"):
 if not pm.is_installed("tenacity"):
     pm.install("tenacity")
 
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import (
+    AutoTokenizer,
+    AutoModelForCausalLM,
+    AutoModelForSequenceClassification,
+)
 from functools import lru_cache
 from tenacity import (
     retry,
@@ -88,6 +92,14 @@ def initialize_hf_model(model_name):
     return hf_model, hf_tokenizer
 
 
+@lru_cache(maxsize=1)
+def initialize_hf_cross_encoder(model_name):
+    hf_tokenizer = AutoTokenizer.from_pretrained(model_name)
+    hf_model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    hf_model.eval()
+    return hf_model, hf_tokenizer
+
+
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=4, max=10),
@@ -186,3 +198,27 @@ async def hf_embed(texts: list[str], tokenizer, embed_model) -> np.ndarray:
         return embeddings.detach().to(torch.float32).cpu().numpy()
     else:
         return embeddings.detach().cpu().numpy()
+
+
+async def hf_rerank(
+    query: str,
+    documents: list[str],
+    model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+) -> np.ndarray:
+    """Score (query, document) pairs with a local cross-encoder in one forward pass."""
+    model, tokenizer = initialize_hf_cross_encoder(model_name)
+    device = next(model.parameters()).device
+    inputs = tokenizer(
+        [query] * len(documents),
+        documents,
+        return_tensors="pt",
+        padding=True,
+        truncation=True,
+    ).to(device)
+    with torch.no_grad():
+        logits = model(**inputs).logits
+    if logits.shape[-1] == 1:
+        scores = logits.squeeze(-1)
+    else:
+        scores = logits.softmax(dim=-1)[:, -1]
+    return scores.detach().to(torch.float32).cpu().numpy()
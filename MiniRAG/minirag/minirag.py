@@ -1,6 +1,8 @@
 import asyncio
+import json
 import os
-from dataclasses import asdict, dataclass, field
+import time
+from dataclasses import asdict, dataclass, field, replace
 from datetime import datetime
 from functools import partial
 from typing import Type, cast, Any
@@ -8,7 +10,9 @@ from dotenv import load_dotenv
 
 
 from .operate import (
+    answer_from_context,
     chunking_by_token_size,
+    delete_description_embeddings,
     extract_entities,
     hybrid_query,
     minirag_query,
@@ -17,13 +21,20 @@ from .operate import (
 
 from .utils import (
     EmbeddingFunc,
+    LRUCache,
     compute_mdhash_id,
     limit_async_func_call,
+    batch_embedding_calls,
+    embedding_batch_scope,
+    query_profile_scope,
+    QueryProfiler,
+    profile_stage,
     convert_response_to_json,
     logger,
     clean_text,
     get_content_summary,
     set_logger,
+    warm_tiktoken_encoders,
     logger,
 )
 from .base import (
@@ -34,12 +45,14 @@ from .base import (
     QueryParam,
     DocStatus,
 )
+from .prompt import PROMPTS
 
 
 STORAGES = {
     "NetworkXStorage": ".kg.networkx_impl",
     "JsonKVStorage": ".kg.json_kv_impl",
     "NanoVectorDBStorage": ".kg.nano_vector_db_impl",
+    "NumpyVectorDBStorage": ".kg.numpy_vector_impl",
     "JsonDocStatusStorage": ".kg.jsondocstatus_impl",
     "Neo4JStorage": ".kg.neo4j_impl",
     "OracleKVStorage": ".kg.oracle_impl",
@@ -63,6 +76,7 @@ STORAGES = {
     "WeaviateKVStorage": ".kg.weaviate_impl",
     "WeaviateGraphStorage": ".kg.weaviate_impl",
     "run_sync": ".kg.weaviate_impl",
+    "JsonBM25Storage": ".kg.bm25_impl",
 }
 
 # future KG integrations
@@ -119,6 +133,14 @@ def always_get_an_event_loop() -> asyncio.AbstractEventLoop:
         return new_loop
 
 
+def _discard_task(task: asyncio.Future):
+    """Cancel a task whose result is not needed, observing its exception"""
+    task.cancel()
+    # a task that already failed would otherwise log "Task exception was
+    # never retrieved" when it is garbage-collected
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
 @dataclass
 class MiniRAG:
     working_dir: str = field(
@@ -159,6 +181,11 @@ class MiniRAG:
     embedding_func: EmbeddingFunc = None
     embedding_batch_num: int = 32
     embedding_func_max_async: int = 16
+    # Token budget per embedding request for storage upserts; None cuts
+    # requests by embedding_batch_num only. Length bucketing sorts texts by
+    # size and charges the budget for padding, for local HF embedders.
+    embedding_batch_tokens: int = None
+    embedding_length_bucketing: bool = False
 
     # LLM
     llm_model_func: callable = None
@@ -169,6 +196,14 @@ class MiniRAG:
     llm_model_max_async: int = 16
     llm_model_kwargs: dict = field(default_factory=dict)
 
+    # Optional chunk reranker: async (query, documents) -> scores, e.g.
+    # minirag.llm.hf.hf_rerank. Keeps QueryParam.rerank_top_n chunks.
+    rerank_func: callable = None
+
+    # Share of QueryParam.deadline_ms the graph stages may use before the
+    # query falls back to naive chunk retrieval.
+    deadline_graph_share: float = 0.6
+
     # storage
     vector_db_storage_cls_kwargs: dict = field(default_factory=dict)
 
@@ -181,6 +216,10 @@ class MiniRAG:
     # Add new field for document status storage type
     doc_status_storage: str = field(default="JsonDocStatusStorage")
 
+    # BM25 index over text chunks, fused with vector chunk search at query time
+    lexical_storage: str = field(default="JsonBM25Storage")
+    enable_lexical_search: bool = True
+
     # Custom Chunking Function
     chunking_func: callable = chunking_by_token_size
     chunking_func_kwargs: dict = field(default_factory=dict)
@@ -197,6 +236,9 @@ class MiniRAG:
             logger.info(f"Creating working directory {self.working_dir}")
             os.makedirs(self.working_dir)
 
+        # chunking uses tiktoken_model_name, context truncation the default model
+        warm_tiktoken_encoders(self.tiktoken_model_name, "gpt-4o")
+
         # show config
         global_config = asdict(self)
         _print_config = ",\n  ".join([f"{k} = {v}" for k, v in global_config.items()])
@@ -244,8 +286,8 @@ class MiniRAG:
             else None
         )
 
-        self.embedding_func = limit_async_func_call(self.embedding_func_max_async)(
-            self.embedding_func
+        self.embedding_func = batch_embedding_calls(self.embedding_batch_num)(
+            limit_async_func_call(self.embedding_func_max_async)(self.embedding_func)
         )
 
         ####
@@ -261,6 +303,13 @@ class MiniRAG:
             global_config=asdict(self),
             embedding_func=self.embedding_func,
         )
+        # a derived cache of local files rather than a kv_storage namespace,
+        # so it works the same whichever KV backend is configured
+        self.entity_description_embeddings = self._get_storage_class("JsonKVStorage")(
+            namespace="entity_description_embeddings",
+            global_config=asdict(self),
+            embedding_func=self.embedding_func,
+        )
         self.chunk_entity_relation_graph = self.graph_storage_cls(
             namespace="chunk_entity_relation",
             global_config=asdict(self),
@@ -295,7 +344,24 @@ class MiniRAG:
             namespace="chunks",
             global_config=asdict(self),
             embedding_func=self.embedding_func,
+            meta_fields={"full_doc_id"},
+        )
+        self.chunks_lexical = (
+            self._get_storage_class(self.lexical_storage)(
+                namespace="chunks",
+                global_config=global_config,
+            )
+            if self.enable_lexical_search
+            else None
         )
+        # chunks stored before lexical search was enabled are indexed once
+        self._lexical_backfill_lock = asyncio.Lock()
+        self._lexical_backfill_checked = False
+        # query-time caches of this instance's embedding and rerank models
+        self.query_caches = {
+            "description": LRUCache(65536),
+            "rerank": LRUCache(16384),
+        }
 
         self.llm_model_func = limit_async_func_call(self.llm_model_max_async)(
             partial(
@@ -384,6 +450,7 @@ class MiniRAG:
                 entity_name_vdb=self.entity_name_vdb,
                 relationships_vdb=self.relationships_vdb,
                 global_config=asdict(self),
+                entity_description_db=self.entity_description_embeddings,
             )
  
         await self._insert_done()
@@ -472,6 +539,8 @@ class MiniRAG:
         if not to_process_docs:
             logger.info("No documents to process")
             return
+        # before new chunks make the lexical index non-empty
+        await self._backfill_lexical_index()
 
         docs_batches = [
             list(to_process_docs.items())[i : i + self.max_parallel_insert]
@@ -498,6 +567,8 @@ class MiniRAG:
                     self.full_docs.upsert({doc_id: {"content": status_doc.content}}),
                     self.text_chunks.upsert(chunks),
                 )
+                if self.chunks_lexical is not None:
+                    await self.chunks_lexical.upsert(chunks)
                 await self.doc_status.upsert(
                     {
                         doc_id: {
@@ -513,16 +584,49 @@ class MiniRAG:
                 )
         logger.info("Document processing pipeline completed")
 
+    async def _backfill_lexical_index(self, batch_size: int = 1024):
+        """Index the stored text chunks if the lexical index is still empty"""
+        if self.chunks_lexical is None or self._lexical_backfill_checked:
+            return
+        async with self._lexical_backfill_lock:
+            if self._lexical_backfill_checked:
+                return
+            self._lexical_backfill_checked = True
+            if not await self.chunks_lexical.is_empty():
+                return
+            try:
+                chunk_ids = await self.text_chunks.all_keys()
+            except NotImplementedError:
+                chunk_ids = None
+            if chunk_ids is None:
+                logger.info(
+                    f"{type(self.text_chunks).__name__} cannot list its keys, "
+                    "chunks stored before lexical search was enabled are not indexed"
+                )
+                return
+            if not chunk_ids:
+                return
+            for start in range(0, len(chunk_ids), batch_size):
+                ids = chunk_ids[start : start + batch_size]
+                chunks = await self.text_chunks.get_by_ids(ids, fields={"content"})
+                await self.chunks_lexical.upsert(
+                    {id_: chunk for id_, chunk in zip(ids, chunks) if chunk}
+                )
+            await self.chunks_lexical.index_done_callback()
+            logger.info(f"Built the lexical index from {len(chunk_ids)} stored chunks")
+
     async def _insert_done(self):
         tasks = []
         for storage_inst in [
             self.full_docs,
             self.text_chunks,
             self.llm_response_cache,
+            self.entity_description_embeddings,
             self.entities_vdb,
             self.entity_name_vdb,
             self.relationships_vdb,
             self.chunks_vdb,
+            self.chunks_lexical,
             self.chunk_entity_relation_graph,
         ]:
             if storage_inst is None:
@@ -535,18 +639,130 @@ class MiniRAG:
         return loop.run_until_complete(self.aquery(query, param))
 
     async def aquery(self, query: str, param: QueryParam = QueryParam()):
+        """
+        Answer a query with the configured retrieval mode.
+
+        When ``param.stream`` is set the answer LLM call is made with
+        ``stream=True`` and an async iterator of text chunks is returned
+        instead of a string, so callers can forward tokens as they arrive.
+        Short-circuit results (context-only, failure responses) are still
+        returned as plain strings.
+
+        When ``param.profile`` is set the result is a dict with the
+        ``response`` and a ``profile`` of per-stage timings and counts.
+        When ``param.deadline_ms`` is set the result is a dict with the
+        ``response`` and ``degraded``, which is True when the graph stages
+        ran out of time and the answer was built from naive retrieval.
+        """
+        await self._backfill_lexical_index()
+        with query_profile_scope(param.profile) as profiler:
+            if param.deadline_ms is None:
+                response = await self._run_query(query, param)
+            else:
+                response, degraded = await self._run_query_with_deadline(query, param)
+        await self._query_done()
+        if profiler is None and param.deadline_ms is None:
+            return response
+        result = {"response": response}
+        if param.deadline_ms is not None:
+            result["degraded"] = degraded
+        if profiler is not None:
+            result["profile"] = self._log_profile(profiler, query)
+        return result
+
+    def query_batch(
+        self,
+        queries: list[str],
+        param: QueryParam = QueryParam(),
+        concurrency: int | None = None,
+    ):
+        loop = always_get_an_event_loop()
+        return loop.run_until_complete(self.aquery_batch(queries, param, concurrency))
+
+    async def aquery_batch(
+        self,
+        queries: list[str],
+        param: QueryParam = QueryParam(),
+        concurrency: int | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Answer many queries concurrently with a single storage flush.
+
+        Up to ``concurrency`` queries (default ``llm_model_max_async``) run at
+        once; their LLM calls still go through the shared ``llm_model_func``
+        limiter, and their query embeddings are coalesced into shared batches
+        of up to ``embedding_batch_num`` texts.
+
+        Returns one dict per query, in input order, with the ``query``, its
+        ``response`` (None on failure), ``error`` and ``elapsed`` seconds,
+        plus ``degraded`` when ``param.deadline_ms`` is set and a ``profile``
+        when ``param.profile`` is set.
+        """
+        concurrency = concurrency or self.llm_model_max_async
+        global_config = asdict(self)
+        await self._backfill_lexical_index()
+
+        async def answer(query: str) -> dict[str, Any]:
+            start = time.perf_counter()
+            with query_profile_scope(param.profile) as profiler:
+                degraded = False
+                try:
+                    if param.deadline_ms is None:
+                        response = await self._run_query(query, param, global_config)
+                    else:
+                        response, degraded = await self._run_query_with_deadline(
+                            query, param, global_config
+                        )
+                    error = None
+                except Exception as e:
+                    logger.error(f"Batch query failed for {query!r}: {e}")
+                    response, error = None, str(e)
+            result = {
+                "query": query,
+                "response": response,
+                "error": error,
+                "elapsed": time.perf_counter() - start,
+            }
+            if param.deadline_ms is not None:
+                result["degraded"] = degraded
+            if profiler is not None:
+                result["profile"] = self._log_profile(profiler, query)
+            return result
+
+        # waiting queries are woken on release instead of polling
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(query: str) -> dict[str, Any]:
+            async with semaphore:
+                return await answer(query)
+
+        start = time.perf_counter()
+        with embedding_batch_scope():
+            results = await asyncio.gather(*[run_one(q) for q in queries])
+        await self._query_done()
+        logger.info(
+            f"Answered {len(queries)} queries in {time.perf_counter() - start:.2f}s "
+            f"(concurrency={concurrency})"
+        )
+        return results
+
+    async def _run_query(
+        self, query: str, param: QueryParam, global_config: dict | None = None
+    ):
+        if global_config is None:
+            global_config = asdict(self)
         if param.mode == "light":
-            response = await hybrid_query(
+            return await hybrid_query(
                 query,
                 self.chunk_entity_relation_graph,
                 self.entities_vdb,
                 self.relationships_vdb,
                 self.text_chunks,
                 param,
-                asdict(self),
+                global_config,
             )
-        elif param.mode == "mini":
-            response = await minirag_query(
+        if param.mode == "mini":
+            return await minirag_query(
                 query,
                 self.chunk_entity_relation_graph,
                 self.entities_vdb,
@@ -556,20 +772,98 @@ class MiniRAG:
                 self.text_chunks,
                 self.embedding_func,
                 param,
-                asdict(self),
+                global_config,
+                entity_description_db=self.entity_description_embeddings,
+                chunks_lexical=self.chunks_lexical,
+                query_caches=self.query_caches,
             )
-        elif param.mode == "naive":
-            response = await naive_query(
+        if param.mode == "naive":
+            return await naive_query(
                 query,
                 self.chunks_vdb,
                 self.text_chunks,
                 param,
-                asdict(self),
+                global_config,
+                chunks_lexical=self.chunks_lexical,
+                query_caches=self.query_caches,
             )
-        else:
-            raise ValueError(f"Unknown mode {param.mode}")
-        await self._query_done()
-        return response
+        raise ValueError(f"Unknown mode {param.mode}")
+
+    async def _run_query_with_deadline(
+        self, query: str, param: QueryParam, global_config: dict | None = None
+    ) -> tuple[Any, bool]:
+        """Run a query within ``param.deadline_ms``; returns (response, degraded).
+
+        Naive chunk retrieval runs next to the graph stages of "mini" and
+        "light" mode. If the graph stages do not produce a context within
+        ``deadline_graph_share`` of the budget they are cancelled and the
+        answer is generated from the naive context instead.
+        """
+        if global_config is None:
+            global_config = asdict(self)
+        if param.mode == "naive":
+            return await self._run_query(query, param, global_config), False
+
+        context_param = replace(
+            param,
+            only_need_context=True,
+            structured_context=param.only_need_context and param.structured_context,
+            stream=False,
+            deadline_ms=None,
+        )
+        graph_budget = param.deadline_ms * self.deadline_graph_share / 1000
+        with embedding_batch_scope():
+            naive_context = asyncio.ensure_future(
+                naive_query(
+                    query,
+                    self.chunks_vdb,
+                    self.text_chunks,
+                    context_param,
+                    global_config,
+                    chunks_lexical=self.chunks_lexical,
+                    query_caches=self.query_caches,
+                )
+            )
+            try:
+                context = await asyncio.wait_for(
+                    self._run_query(query, context_param, global_config),
+                    timeout=graph_budget,
+                )
+                degraded = not context or context == PROMPTS["fail_response"]
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"{param.mode} retrieval exceeded {graph_budget * 1000:.0f}ms "
+                    f"for {query!r}, falling back to naive retrieval"
+                )
+                degraded = True
+            except BaseException:
+                _discard_task(naive_context)
+                raise
+
+            if degraded:
+                with profile_stage("naive_fallback"):
+                    context = await naive_context
+            else:
+                _discard_task(naive_context)
+
+        if param.only_need_context or context == PROMPTS["fail_response"]:
+            return context, degraded
+        response = await answer_from_context(
+            query,
+            context,
+            param,
+            global_config,
+            prompt_name="naive_rag_response" if degraded else "rag_response",
+        )
+        return response, degraded
+
+    def _log_profile(self, profiler: QueryProfiler, query: str = None) -> dict:
+        profile = profiler.to_dict()
+        logger.info(
+            "query_profile %s",
+            json.dumps({"query": query, **profile}, ensure_ascii=False),
+        )
+        return profile
 
     async def _query_done(self):
         tasks = []
@@ -584,26 +878,73 @@ class MiniRAG:
         return loop.run_until_complete(self.adelete_by_entity(entity_name))
 
     async def adelete_by_entity(self, entity_name: str):
-        entity_name = f'"{entity_name.upper()}"'
+        await self.adelete_by_entities([entity_name])
+
+    def delete_by_entities(self, entity_names: list[str]):
+        loop = always_get_an_event_loop()
+        return loop.run_until_complete(self.adelete_by_entities(entity_names))
+
+    def _entity_deletion_unsupported(self) -> list[str]:
+        """Storage methods entity deletion needs that the backends lack"""
+        required = [
+            (self.entities_vdb, "delete", BaseVectorStorage),
+            (self.entity_name_vdb, "delete", BaseVectorStorage),
+            (self.relationships_vdb, "delete_entities_cascade", BaseVectorStorage),
+            (self.chunk_entity_relation_graph, "delete_node", BaseGraphStorage),
+        ]
+        return [
+            f"{type(storage).__name__}.{method}"
+            for storage, method, base in required
+            if getattr(type(storage), method, None) in (None, getattr(base, method))
+        ]
+
+    async def adelete_by_entities(self, entity_names: list[str]):
+        """Delete entities with their vectors and every relation touching them"""
+        entity_names = [f'"{entity_name.upper()}"' for entity_name in entity_names]
+        # refuse up front rather than stop halfway through the deletion
+        unsupported = self._entity_deletion_unsupported()
+        if unsupported:
+            logger.error(
+                f"Cannot delete entities {entity_names}: "
+                f"{', '.join(unsupported)} not implemented"
+            )
+            return
 
         try:
-            await self.entities_vdb.delete_entity(entity_name)
-            await self.relationships_vdb.delete_relation(entity_name)
-            await self.chunk_entity_relation_graph.delete_node(entity_name)
+            await self.entities_vdb.delete(
+                [
+                    compute_mdhash_id(entity_name, prefix="ent-")
+                    for entity_name in entity_names
+                ]
+            )
+            await self.entity_name_vdb.delete(
+                [
+                    compute_mdhash_id(entity_name, prefix="Ename-")
+                    for entity_name in entity_names
+                ]
+            )
+            await self.relationships_vdb.delete_entities_cascade(entity_names)
+            for entity_name in entity_names:
+                await self.chunk_entity_relation_graph.delete_node(entity_name)
+            await delete_description_embeddings(
+                entity_names, self.entity_description_embeddings
+            )
 
             logger.info(
-                f"Entity '{entity_name}' and its relationships have been deleted."
+                f"Entities {entity_names} and their relationships have been deleted."
             )
             await self._delete_by_entity_done()
         except Exception as e:
-            logger.error(f"Error while deleting entity '{entity_name}': {e}")
+            logger.error(f"Error while deleting entities {entity_names}: {e}")
 
     async def _delete_by_entity_done(self):
         tasks = []
         for storage_inst in [
             self.entities_vdb,
+            self.entity_name_vdb,
             self.relationships_vdb,
             self.chunk_entity_relation_graph,
+            self.entity_description_embeddings,
         ]:
             if storage_inst is None:
                 continue
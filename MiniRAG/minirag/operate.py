@@ -2,9 +2,12 @@ import asyncio
 import json
 import re
 from typing import Union
+from collections.abc import AsyncIterator
 from collections import Counter, defaultdict
 import warnings
+from dataclasses import dataclass, field
 import json_repair
+import numpy as np
 
 from .utils import (
     list_of_list_to_csv,
@@ -12,7 +15,6 @@ from .utils import (
     split_string_by_multi_markers,
     logger,
     locate_json_string_body_from_string,
-    process_combine_contexts,
     clean_str,
     edge_vote_path,
     encode_string_by_tiktoken,
@@ -22,16 +24,35 @@ from .utils import (
     compute_mdhash_id,
     calculate_similarity,
     cal_path_score_list,
+    profile_stage,
+    encode_embedding_matrix,
+    decode_embedding_matrix,
+    embed_in_batches,
+    LRUCache,
+    normalize_rows,
+    reciprocal_rank_fusion,
+    count_tokens,
+    compact_text_units,
+    normalize_context_line,
 )
 from .base import (
     BaseGraphStorage,
     BaseKVStorage,
+    BaseLexicalStorage,
     BaseVectorStorage,
     TextChunkSchema,
     QueryParam,
+    split_graph_field,
 )
 from .prompt import GRAPH_FIELD_SEP, PROMPTS
 
+# Upper bound on the entities taken from the mini-mode keyword extraction.
+MINI_MAX_QUERY_ENTITIES = 5
+# path2chunk only ranks a node's descriptions against the query above this size.
+PATH2CHUNK_MIN_DESCRIPTIONS = 5
+# Text chunk fields the context builders read; requested via get_by_ids(fields=...).
+CONTEXT_CHUNK_FIELDS = {"content", "tokens", "full_doc_id", "chunk_order_index"}
+
 
 def chunking_by_token_size(
     content: str, overlap_token_size=128, max_token_size=1024, tiktoken_model="gpt-4o"
@@ -128,7 +149,7 @@ async def _merge_nodes_then_upsert(
     if already_node is not None:
         already_entitiy_types.append(already_node["entity_type"])
         already_source_ids.extend(
-            split_string_by_multi_markers(already_node["source_id"], [GRAPH_FIELD_SEP])
+            await knowledge_graph_inst.get_node_chunk_ids(entity_name)
         )
         already_description.append(already_node["description"])
 
@@ -153,6 +174,7 @@ async def _merge_nodes_then_upsert(
     node_data = dict(
         entity_type=entity_type,
         description=description,
+        description_tokens=count_tokens(description),
         source_id=source_id,
     )
     await knowledge_graph_inst.upsert_node(
@@ -179,7 +201,7 @@ async def _merge_edges_then_upsert(
         already_edge = await knowledge_graph_inst.get_edge(src_id, tgt_id)
         already_weights.append(already_edge["weight"])
         already_source_ids.extend(
-            split_string_by_multi_markers(already_edge["source_id"], [GRAPH_FIELD_SEP])
+            await knowledge_graph_inst.get_edge_chunk_ids(src_id, tgt_id)
         )
         already_description.append(already_edge["description"])
         already_keywords.extend(
@@ -203,6 +225,7 @@ async def _merge_edges_then_upsert(
                 node_data={
                     "source_id": source_id,
                     "description": description,
+                    "description_tokens": count_tokens(description),
                     "entity_type": '"UNKNOWN"',
                 },
             )
@@ -215,6 +238,7 @@ async def _merge_edges_then_upsert(
         edge_data=dict(
             weight=weight,
             description=description,
+            description_tokens=count_tokens(description),
             keywords=keywords,
             source_id=source_id,
         ),
@@ -230,6 +254,97 @@ async def _merge_edges_then_upsert(
     return edge_data
 
 
+def _description_embedding_key(entity_name: str, description: str) -> str:
+    return compute_mdhash_id(
+        entity_name + GRAPH_FIELD_SEP + description, prefix="desc-"
+    )
+
+
+def _description_index_key(entity_name: str) -> str:
+    return compute_mdhash_id(entity_name, prefix="descs-")
+
+
+async def _upsert_description_embeddings(
+    nodes_data: list[dict],
+    entity_description_db: BaseKVStorage,
+    global_config: dict,
+):
+    """Embed the individual descriptions of multi-description nodes.
+
+    Each description is stored under a key of its entity name and text, so a
+    merge that appends a description embeds only the new one. A per-node
+    entry lists the node's keys; keys that leave a node are deleted.
+    """
+    node_keys, texts = {}, {}
+    for dp in nodes_data:
+        descriptions = split_string_by_multi_markers(
+            dp["description"], [GRAPH_FIELD_SEP]
+        )
+        if len(descriptions) <= PATH2CHUNK_MIN_DESCRIPTIONS:
+            continue
+        keys = []
+        for description in descriptions:
+            key = _description_embedding_key(dp["entity_name"], description)
+            texts[key] = description
+            keys.append(key)
+        node_keys[_description_index_key(dp["entity_name"])] = keys
+    if not node_keys:
+        return
+
+    index_keys = list(node_keys)
+    old_entries = await entity_description_db.get_by_ids(index_keys)
+    stale, replaced, changed = set(), [], []
+    for index_key, old in zip(index_keys, old_entries):
+        if old is not None and old["keys"] == node_keys[index_key]:
+            continue
+        changed.append(index_key)
+        if old is not None:
+            replaced.append(index_key)
+            stale.update(set(old["keys"]) - set(node_keys[index_key]))
+
+    new_keys = await entity_description_db.filter_keys(list(texts))
+    new_keys = [k for k in texts if k in new_keys]
+    data_for_kv = {}
+    if new_keys:
+        embeddings = await embed_in_batches(
+            entity_description_db.embedding_func,
+            [texts[k] for k in new_keys],
+            global_config["embedding_batch_num"],
+            global_config,
+            desc="Embedding entity descriptions",
+        )
+        data_for_kv = {
+            key: {"embedding": encode_embedding_matrix(embedding[None])}
+            for key, embedding in zip(new_keys, embeddings)
+        }
+    # upsert keeps existing keys, so changed node entries are replaced
+    if stale or replaced:
+        await entity_description_db.delete(list(stale) + replaced)
+    data_for_kv.update({k: {"keys": node_keys[k]} for k in changed})
+    if data_for_kv:
+        await entity_description_db.upsert(data_for_kv)
+    logger.info(
+        f"Stored {len(new_keys)} description embeddings for {len(changed)} "
+        f"entities, dropped {len(stale)}"
+    )
+
+
+async def delete_description_embeddings(
+    entity_names: list[str], entity_description_db: BaseKVStorage
+):
+    """Drop the stored description embeddings of deleted entities"""
+    index_keys = [_description_index_key(name) for name in entity_names]
+    entries = await entity_description_db.get_by_ids(index_keys)
+    ids = [
+        key
+        for index_key, entry in zip(index_keys, entries)
+        if entry is not None
+        for key in [index_key, *entry["keys"]]
+    ]
+    if ids:
+        await entity_description_db.delete(ids)
+
+
 async def extract_entities(
     chunks: dict[str, TextChunkSchema],
     knowledge_graph_inst: BaseGraphStorage,
@@ -237,6 +352,7 @@ async def extract_entities(
     entity_name_vdb: BaseVectorStorage,
     relationships_vdb: BaseVectorStorage,
     global_config: dict,
+    entity_description_db: BaseKVStorage = None,
 ) -> Union[BaseGraphStorage, None]:
     use_llm_func: callable = global_config["llm_model_func"]
     entity_extract_max_gleaning = global_config["entity_extract_max_gleaning"]
@@ -390,6 +506,11 @@ async def extract_entities(
         }
         await entity_name_vdb.upsert(data_for_vdb)
 
+    if entity_description_db is not None:
+        await _upsert_description_embeddings(
+            all_entities_data, entity_description_db, global_config
+        )
+
     if relationships_vdb is not None:
         data_for_vdb = {
             compute_mdhash_id(dp["src_id"] + dp["tgt_id"], prefix="rel-"): {
@@ -416,13 +537,14 @@ async def local_query(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
     global_config: dict,
-) -> str:
+) -> Union[str, AsyncIterator[str]]:
     context = None
     use_model_func = global_config["llm_model_func"]
 
     kw_prompt_temp = PROMPTS["keywords_extraction"]
     kw_prompt = kw_prompt_temp.format(query=query)
-    result = await use_model_func(kw_prompt)
+    with profile_stage("keyword_llm"):
+        result = await use_model_func(kw_prompt)
     json_text = locate_json_string_body_from_string(result)
 
     try:
@@ -455,18 +577,21 @@ async def local_query(
             query_param,
         )
     if query_param.only_need_context:
-        return context
+        return _context_result(context, query_param)
     if context is None:
         return PROMPTS["fail_response"]
+    context = context.render()
     sys_prompt_temp = PROMPTS["rag_response"]
     sys_prompt = sys_prompt_temp.format(
         context_data=context, response_type=query_param.response_type
     )
-    response = await use_model_func(
-        query,
-        system_prompt=sys_prompt,
-    )
-    if len(response) > len(sys_prompt):
+    with profile_stage("answer_llm"):
+        response = await use_model_func(
+            query,
+            system_prompt=sys_prompt,
+            stream=query_param.stream,
+        )
+    if isinstance(response, str) and len(response) > len(sys_prompt):
         response = (
             response.replace(sys_prompt, "")
             .replace("user", "")
@@ -480,6 +605,111 @@ async def local_query(
     return response
 
 
+@dataclass
+class QueryContext:
+    """Entity, relation and source rows of a light-mode context.
+
+    The builders return this instead of CSV text so hybrid mode can merge the
+    high- and low-level contexts in memory and render the prompt text once.
+    """
+
+    # (entity, type, description, rank)
+    entities: list[tuple] = field(default_factory=list)
+    # (source, target, description, keywords, weight, rank)
+    relations: list[tuple] = field(default_factory=list)
+    # text chunk dicts with at least a "content" field
+    sources: list[dict] = field(default_factory=list)
+
+    entity_columns = ("entity", "type", "description", "rank")
+    relation_columns = ("source", "target", "description", "keywords", "weight", "rank")
+
+    def to_dict(self) -> dict:
+        """JSON-serializable rows; chunks keep their stored fields plus a rank."""
+
+        def value(v):
+            return v.item() if isinstance(v, np.generic) else v
+
+        return {
+            "entities": [
+                {k: value(v) for k, v in zip(self.entity_columns, row)}
+                for row in self.entities
+            ],
+            "relations": [
+                {k: value(v) for k, v in zip(self.relation_columns, row)}
+                for row in self.relations
+            ],
+            "chunks": [
+                {"rank": i, **{k: value(v) for k, v in t.items()}}
+                for i, t in enumerate(self.sources)
+            ],
+        }
+
+    def render(self) -> str:
+        entities_context = list_of_list_to_csv(
+            [["id", "entity", "type", "description", "rank"]]
+            + [[i, *row] for i, row in enumerate(self.entities)]
+        )
+        relations_context = list_of_list_to_csv(
+            [["id", "source", "target", "description", "keywords", "weight", "rank"]]
+            + [[i, *row] for i, row in enumerate(self.relations)]
+        )
+        text_units_context = list_of_list_to_csv(
+            [["id", "content"]]
+            + [[i, t["content"]] for i, t in enumerate(self.sources)]
+        )
+        return f"""
+-----Entities-----
+```csv
+{entities_context}
+```
+-----Relationships-----
+```csv
+{relations_context}
+```
+-----Sources-----
+```csv
+{text_units_context}
+```
+"""
+
+
+@dataclass
+class MiniQueryContext(QueryContext):
+    """Mini-mode context: scored entities and sources, no relation rows."""
+
+    entity_columns = ("entity", "score", "description")
+
+    def render(self) -> str:
+        entities_context = list_of_list_to_csv(
+            [list(self.entity_columns)] + [list(row) for row in self.entities]
+        )
+        text_units_context = list_of_list_to_csv(
+            [["id", "content"]]
+            + [[i, t["content"]] for i, t in enumerate(self.sources)]
+        )
+        return f"""
+-----Entities-----
+```csv
+{entities_context}
+```
+-----Sources-----
+```csv
+{text_units_context}
+```
+"""
+
+
+def _context_result(
+    context: Union[QueryContext, None], query_param: QueryParam
+) -> Union[str, dict, None]:
+    """What an ``only_need_context`` query returns for a built context."""
+    if context is None:
+        return None
+    if query_param.structured_context:
+        return context.to_dict()
+    return context.render()
+
+
 async def _build_local_query_context(
     query,
     knowledge_graph_inst: BaseGraphStorage,
@@ -510,57 +740,39 @@ async def _build_local_query_context(
     use_relations = await _find_most_related_edges_from_entities(
         node_datas, query_param, knowledge_graph_inst
     )
+    use_text_units = _compact_text_units(
+        use_text_units,
+        _description_lines(
+            [n.get("description") for n in node_datas]
+            + [e["description"] for e in use_relations]
+        ),
+    )
     logger.info(
         f"Local query uses {len(node_datas)} entites, {len(use_relations)} relations, {len(use_text_units)} text units"
     )
-    entites_section_list = [["id", "entity", "type", "description", "rank"]]
-    for i, n in enumerate(node_datas):
-        entites_section_list.append(
-            [
-                i,
+    return QueryContext(
+        entities=[
+            (
                 n["entity_name"],
                 n.get("entity_type", "UNKNOWN"),
                 n.get("description", "UNKNOWN"),
                 n["rank"],
-            ]
-        )
-    entities_context = list_of_list_to_csv(entites_section_list)
-
-    relations_section_list = [
-        ["id", "source", "target", "description", "keywords", "weight", "rank"]
-    ]
-    for i, e in enumerate(use_relations):
-        relations_section_list.append(
-            [
-                i,
+            )
+            for n in node_datas
+        ],
+        relations=[
+            (
                 e["src_tgt"][0],
                 e["src_tgt"][1],
                 e["description"],
                 e["keywords"],
                 e["weight"],
                 e["rank"],
-            ]
-        )
-    relations_context = list_of_list_to_csv(relations_section_list)
-
-    text_units_section_list = [["id", "content"]]
-    for i, t in enumerate(use_text_units):
-        text_units_section_list.append([i, t["content"]])
-    text_units_context = list_of_list_to_csv(text_units_section_list)
-    return f"""
------Entities-----
-```csv
-{entities_context}
-```
------Relationships-----
-```csv
-{relations_context}
-```
------Sources-----
-```csv
-{text_units_context}
-```
-"""
+            )
+            for e in use_relations
+        ],
+        sources=use_text_units,
+    )
 
 
 async def _find_most_related_text_unit_from_entities(
@@ -569,10 +781,12 @@ async def _find_most_related_text_unit_from_entities(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     knowledge_graph_inst: BaseGraphStorage,
 ):
-    text_units = [
-        split_string_by_multi_markers(dp["source_id"], [GRAPH_FIELD_SEP])
-        for dp in node_datas
-    ]
+    text_units = await asyncio.gather(
+        *[
+            knowledge_graph_inst.get_node_chunk_ids(dp["entity_name"])
+            for dp in node_datas
+        ]
+    )
     edges = await asyncio.gather(
         *[knowledge_graph_inst.get_node_edges(dp["entity_name"]) for dp in node_datas]
     )
@@ -583,15 +797,12 @@ async def _find_most_related_text_unit_from_entities(
         all_one_hop_nodes.update([e[1] for e in this_edges])
 
     all_one_hop_nodes = list(all_one_hop_nodes)
-    all_one_hop_nodes_data = await asyncio.gather(
-        *[knowledge_graph_inst.get_node(e) for e in all_one_hop_nodes]
+    all_one_hop_chunk_ids = await asyncio.gather(
+        *[knowledge_graph_inst.get_node_chunk_ids(e) for e in all_one_hop_nodes]
     )
 
-    # Add null check for node data
     all_one_hop_text_units_lookup = {
-        k: set(split_string_by_multi_markers(v["source_id"], [GRAPH_FIELD_SEP]))
-        for k, v in zip(all_one_hop_nodes, all_one_hop_nodes_data)
-        if v is not None and "source_id" in v  # Add source_id check
+        k: set(v) for k, v in zip(all_one_hop_nodes, all_one_hop_chunk_ids) if v
     }
 
     all_text_units_lookup = {}
@@ -607,14 +818,19 @@ async def _find_most_related_text_unit_from_entities(
                         and c_id in all_one_hop_text_units_lookup[e[1]]
                     ):
                         relation_counts += 1
+            all_text_units_lookup[c_id] = {
+                "order": index,
+                "relation_counts": relation_counts,
+            }
 
-            chunk_data = await text_chunks_db.get_by_id(c_id)
-            if chunk_data is not None and "content" in chunk_data:  # Add content check
-                all_text_units_lookup[c_id] = {
-                    "data": chunk_data,
-                    "order": index,
-                    "relation_counts": relation_counts,
-                }
+    # Fetch every referenced chunk in one round-trip
+    chunk_ids = list(all_text_units_lookup.keys())
+    chunk_datas = await text_chunks_db.get_by_ids(
+        chunk_ids, fields=CONTEXT_CHUNK_FIELDS
+    )
+    for c_id, chunk_data in zip(chunk_ids, chunk_datas or []):
+        if chunk_data is not None and "content" in chunk_data:  # Add content check
+            all_text_units_lookup[c_id]["data"] = chunk_data
 
     # Filter out None values and ensure data has content
     all_text_units = [
@@ -635,6 +851,7 @@ async def _find_most_related_text_unit_from_entities(
         all_text_units,
         key=lambda x: x["data"]["content"],
         max_token_size=query_param.max_token_for_text_unit,
+        token_count=lambda x: x["data"].get("tokens"),
     )
 
     all_text_units = [t["data"] for t in all_text_units]
@@ -671,6 +888,7 @@ async def _find_most_related_edges_from_entities(
         all_edges_data,
         key=lambda x: x["description"],
         max_token_size=query_param.max_token_for_global_context,
+        token_count=lambda x: x.get("description_tokens"),
     )
     return all_edges_data
 
@@ -683,13 +901,14 @@ async def global_query(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
     global_config: dict,
-) -> str:
+) -> Union[str, AsyncIterator[str]]:
     context = None
     use_model_func = global_config["llm_model_func"]
 
     kw_prompt_temp = PROMPTS["keywords_extraction"]
     kw_prompt = kw_prompt_temp.format(query=query)
-    result = await use_model_func(kw_prompt)
+    with profile_stage("keyword_llm"):
+        result = await use_model_func(kw_prompt)
     json_text = locate_json_string_body_from_string(result)
 
     try:
@@ -725,19 +944,22 @@ async def global_query(
         )
 
     if query_param.only_need_context:
-        return context
+        return _context_result(context, query_param)
     if context is None:
         return PROMPTS["fail_response"]
+    context = context.render()
 
     sys_prompt_temp = PROMPTS["rag_response"]
     sys_prompt = sys_prompt_temp.format(
         context_data=context, response_type=query_param.response_type
     )
-    response = await use_model_func(
-        query,
-        system_prompt=sys_prompt,
-    )
-    if len(response) > len(sys_prompt):
+    with profile_stage("answer_llm"):
+        response = await use_model_func(
+            query,
+            system_prompt=sys_prompt,
+            stream=query_param.stream,
+        )
+    if isinstance(response, str) and len(response) > len(sys_prompt):
         response = (
             response.replace(sys_prompt, "")
             .replace("user", "")
@@ -785,6 +1007,7 @@ async def _build_global_query_context(
         edge_datas,
         key=lambda x: x["description"],
         max_token_size=query_param.max_token_for_global_context,
+        token_count=lambda x: x.get("description_tokens"),
     )
 
     use_entities = await _find_most_related_entities_from_relationships(
@@ -793,58 +1016,39 @@ async def _build_global_query_context(
     use_text_units = await _find_related_text_unit_from_relationships(
         edge_datas, query_param, text_chunks_db, knowledge_graph_inst
     )
+    use_text_units = _compact_text_units(
+        use_text_units,
+        _description_lines(
+            [n.get("description") for n in use_entities]
+            + [e["description"] for e in edge_datas]
+        ),
+    )
     logger.info(
         f"Global query uses {len(use_entities)} entites, {len(edge_datas)} relations, {len(use_text_units)} text units"
     )
-    relations_section_list = [
-        ["id", "source", "target", "description", "keywords", "weight", "rank"]
-    ]
-    for i, e in enumerate(edge_datas):
-        relations_section_list.append(
-            [
-                i,
+    return QueryContext(
+        entities=[
+            (
+                n["entity_name"],
+                n.get("entity_type", "UNKNOWN"),
+                n.get("description", "UNKNOWN"),
+                n["rank"],
+            )
+            for n in use_entities
+        ],
+        relations=[
+            (
                 e["src_id"],
                 e["tgt_id"],
                 e["description"],
                 e["keywords"],
                 e["weight"],
                 e["rank"],
-            ]
-        )
-    relations_context = list_of_list_to_csv(relations_section_list)
-
-    entites_section_list = [["id", "entity", "type", "description", "rank"]]
-    for i, n in enumerate(use_entities):
-        entites_section_list.append(
-            [
-                i,
-                n["entity_name"],
-                n.get("entity_type", "UNKNOWN"),
-                n.get("description", "UNKNOWN"),
-                n["rank"],
-            ]
-        )
-    entities_context = list_of_list_to_csv(entites_section_list)
-
-    text_units_section_list = [["id", "content"]]
-    for i, t in enumerate(use_text_units):
-        text_units_section_list.append([i, t["content"]])
-    text_units_context = list_of_list_to_csv(text_units_section_list)
-
-    return f"""
------Entities-----
-```csv
-{entities_context}
-```
------Relationships-----
-```csv
-{relations_context}
-```
------Sources-----
-```csv
-{text_units_context}
-```
-"""
+            )
+            for e in edge_datas
+        ],
+        sources=use_text_units,
+    )
 
 
 async def _find_most_related_entities_from_relationships(
@@ -873,6 +1077,7 @@ async def _find_most_related_entities_from_relationships(
         node_datas,
         key=lambda x: x["description"],
         max_token_size=query_param.max_token_for_local_context,
+        token_count=lambda x: x.get("description_tokens"),
     )
 
     return node_datas
@@ -884,31 +1089,41 @@ async def _find_related_text_unit_from_relationships(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     knowledge_graph_inst: BaseGraphStorage,
 ):
-    text_units = [
-        split_string_by_multi_markers(dp["source_id"], [GRAPH_FIELD_SEP])
-        for dp in edge_datas
-    ]
+    text_units = await asyncio.gather(
+        *[
+            knowledge_graph_inst.get_edge_chunk_ids(dp["src_id"], dp["tgt_id"])
+            for dp in edge_datas
+        ]
+    )
 
     all_text_units_lookup = {}
 
     for index, unit_list in enumerate(text_units):
         for c_id in unit_list:
             if c_id not in all_text_units_lookup:
-                all_text_units_lookup[c_id] = {
-                    "data": await text_chunks_db.get_by_id(c_id),
-                    "order": index,
-                }
+                all_text_units_lookup[c_id] = {"order": index}
 
-    if any([v is None for v in all_text_units_lookup.values()]):
+    # Fetch every referenced chunk in one round-trip
+    chunk_ids = list(all_text_units_lookup.keys())
+    chunk_datas = await text_chunks_db.get_by_ids(
+        chunk_ids, fields=CONTEXT_CHUNK_FIELDS
+    )
+    for c_id, chunk_data in zip(chunk_ids, chunk_datas or []):
+        all_text_units_lookup[c_id]["data"] = chunk_data
+
+    if any([v.get("data") is None for v in all_text_units_lookup.values()]):
         logger.warning("Text chunks are missing, maybe the storage is damaged")
     all_text_units = [
-        {"id": k, **v} for k, v in all_text_units_lookup.items() if v is not None
+        {"id": k, **v}
+        for k, v in all_text_units_lookup.items()
+        if v.get("data") is not None
     ]
     all_text_units = sorted(all_text_units, key=lambda x: x["order"])
     all_text_units = truncate_list_by_token_size(
         all_text_units,
         key=lambda x: x["data"]["content"],
         max_token_size=query_param.max_token_for_text_unit,
+        token_count=lambda x: x["data"].get("tokens"),
     )
     all_text_units: list[TextChunkSchema] = [t["data"] for t in all_text_units]
 
@@ -923,75 +1138,61 @@ async def hybrid_query(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
     global_config: dict,
-) -> str:
+) -> Union[str, AsyncIterator[str]]:
     low_level_context = None
     high_level_context = None
     use_model_func = global_config["llm_model_func"]
 
-    kw_prompt_temp = PROMPTS["keywords_extraction"]
-    kw_prompt = kw_prompt_temp.format(query=query)
-
-    result = await use_model_func(kw_prompt)
-    json_text = locate_json_string_body_from_string(result)
-    try:
-        keywords_data = json.loads(json_text)
-        hl_keywords = keywords_data.get("high_level_keywords", [])
-        ll_keywords = keywords_data.get("low_level_keywords", [])
-        hl_keywords = ", ".join(hl_keywords)
-        ll_keywords = ", ".join(ll_keywords)
-    except json.JSONDecodeError:
-        try:
-            result = (
-                result.replace(kw_prompt[:-1], "")
-                .replace("user", "")
-                .replace("model", "")
-                .strip()
-            )
-            result = "{" + result.split("{")[1].split("}")[0] + "}"
-            keywords_data = json.loads(result)
-            hl_keywords = keywords_data.get("high_level_keywords", [])
-            ll_keywords = keywords_data.get("low_level_keywords", [])
-            hl_keywords = ", ".join(hl_keywords)
-            ll_keywords = ", ".join(ll_keywords)
-        # Handle parsing error
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {e}")
+    if query_param.hl_keywords or query_param.ll_keywords:
+        # Caller-supplied keywords: retrieval runs without any LLM call
+        hl_keywords = ", ".join(query_param.hl_keywords)
+        ll_keywords = ", ".join(query_param.ll_keywords)
+    else:
+        keywords = await _extract_hybrid_keywords(query, use_model_func)
+        if keywords is None:
             return PROMPTS["fail_response"]
+        hl_keywords, ll_keywords = keywords
     if ll_keywords:
-        low_level_context = await _build_local_query_context(
-            ll_keywords,
-            knowledge_graph_inst,
-            entities_vdb,
-            text_chunks_db,
-            query_param,
-        )
+        with profile_stage("local_context"):
+            low_level_context = await _build_local_query_context(
+                ll_keywords,
+                knowledge_graph_inst,
+                entities_vdb,
+                text_chunks_db,
+                query_param,
+            )
 
     if hl_keywords:
-        high_level_context = await _build_global_query_context(
-            hl_keywords,
-            knowledge_graph_inst,
-            entities_vdb,
-            relationships_vdb,
-            text_chunks_db,
-            query_param,
-        )
+        with profile_stage("global_context"):
+            high_level_context = await _build_global_query_context(
+                hl_keywords,
+                knowledge_graph_inst,
+                entities_vdb,
+                relationships_vdb,
+                text_chunks_db,
+                query_param,
+            )
 
-    context = combine_contexts(high_level_context, low_level_context)
+    with profile_stage("combine_contexts"):
+        context = combine_contexts(high_level_context, low_level_context)
 
     if query_param.only_need_context:
-        return context
+        return _context_result(context, query_param)
     if context is None:
         return PROMPTS["fail_response"]
+    context = context.render()
 
     sys_prompt_temp = PROMPTS["rag_response"]
     sys_prompt = sys_prompt_temp.format(
         context_data=context, response_type=query_param.response_type
     )
-    response = await use_model_func(
-        query,
-        system_prompt=sys_prompt,
-    )
-    if len(response) > len(sys_prompt):
+    with profile_stage("answer_llm"):
+        response = await use_model_func(
+            query,
+            system_prompt=sys_prompt,
+            stream=query_param.stream,
+        )
+    if isinstance(response, str) and len(response) > len(sys_prompt):
         response = (
             response.replace(sys_prompt, "")
             .replace("user", "")
@@ -1004,73 +1205,115 @@ async def hybrid_query(
     return response
 
 
-def combine_contexts(high_level_context, low_level_context):
-    # Function to extract entities, relationships, and sources from context strings
-
-    def extract_sections(context):
-        entities_match = re.search(
-            r"-----Entities-----\s*```csv\s*(.*?)\s*```", context, re.DOTALL
-        )
-        relationships_match = re.search(
-            r"-----Relationships-----\s*```csv\s*(.*?)\s*```", context, re.DOTALL
-        )
-        sources_match = re.search(
-            r"-----Sources-----\s*```csv\s*(.*?)\s*```", context, re.DOTALL
-        )
-
-        entities = entities_match.group(1) if entities_match else ""
-        relationships = relationships_match.group(1) if relationships_match else ""
-        sources = sources_match.group(1) if sources_match else ""
+async def _extract_hybrid_keywords(
+    query: str, use_model_func
+) -> Union[tuple[str, str], None]:
+    """Ask the LLM for (high-level, low-level) keywords; None if unparsable."""
+    kw_prompt_temp = PROMPTS["keywords_extraction"]
+    kw_prompt = kw_prompt_temp.format(query=query)
 
-        return entities, relationships, sources
+    with profile_stage("keyword_llm"):
+        result = await use_model_func(kw_prompt)
+    json_text = locate_json_string_body_from_string(result)
+    try:
+        keywords_data = json.loads(json_text)
+    except json.JSONDecodeError:
+        try:
+            result = (
+                result.replace(kw_prompt[:-1], "")
+                .replace("user", "")
+                .replace("model", "")
+                .strip()
+            )
+            result = "{" + result.split("{")[1].split("}")[0] + "}"
+            keywords_data = json.loads(result)
+        # Handle parsing error
+        except json.JSONDecodeError as e:
+            print(f"JSON parsing error: {e}")
+            return None
+    hl_keywords = keywords_data.get("high_level_keywords", [])
+    ll_keywords = keywords_data.get("low_level_keywords", [])
+    return ", ".join(hl_keywords), ", ".join(ll_keywords)
 
-    # Extract sections from both contexts
 
+def combine_contexts(
+    high_level_context: Union["QueryContext", None],
+    low_level_context: Union["QueryContext", None],
+) -> Union["QueryContext", None]:
+    """Merge the high- and low-level contexts row by row."""
     if high_level_context is None:
         warnings.warn(
             "High Level context is None. Return empty High entity/relationship/source"
         )
-        hl_entities, hl_relationships, hl_sources = "", "", ""
-    else:
-        hl_entities, hl_relationships, hl_sources = extract_sections(high_level_context)
-
     if low_level_context is None:
         warnings.warn(
             "Low Level context is None. Return empty Low entity/relationship/source"
         )
-        ll_entities, ll_relationships, ll_sources = "", "", ""
-    else:
-        ll_entities, ll_relationships, ll_sources = extract_sections(low_level_context)
+    contexts = [c for c in (high_level_context, low_level_context) if c is not None]
+    if not contexts:
+        return None
 
-    # Combine and deduplicate the entities
+    # Rows are tuples, so exact duplicates collapse while keeping first-seen order
+    entities = list(dict.fromkeys(row for c in contexts for row in c.entities))
+    relations = list(dict.fromkeys(row for c in contexts for row in c.relations))
+    # repeated chunks are dropped by the compaction pass
+    sources = _compact_text_units([t for c in contexts for t in c.sources])
+    return QueryContext(entities, relations, sources)
 
-    combined_entities = process_combine_contexts(hl_entities, ll_entities)
-    combined_entities = chunking_by_token_size(combined_entities, max_token_size=2000)
-    # Combine and deduplicate the relationships
-    combined_relationships = process_combine_contexts(
-        hl_relationships, ll_relationships
-    )
-    combined_relationships = chunking_by_token_size(
-        combined_relationships, max_token_size=2000
-    )
-    # Combine and deduplicate the sources
-    combined_sources = process_combine_contexts(hl_sources, ll_sources)
-    combined_sources = chunking_by_token_size(combined_sources, max_token_size=2000)
-    # Format the combined context
-    return f"""
------Entities-----
-```csv
-{combined_entities}
-```
------Relationships-----
-```csv
-{combined_relationships}
-```
------Sources-----
-```csv
-{combined_sources}
-```
-"""
+
+def _description_lines(descriptions: list[str]) -> set[str]:
+    """Normalized description lines already present in the entity/relation sections."""
+    lines = {
+        normalize_context_line(part)
+        for description in descriptions
+        for part in split_graph_field(description or "")
+    }
+    lines.discard("")
+    return lines
+
+
+def _compact_text_units(
+    text_units: list[dict], seen_lines: set[str] | None = None
+) -> list[dict]:
+    """compact_text_units plus per-query reporting of the characters it saved.
+
+    Characters rather than tokens: rewritten units lose their stored token
+    count, and tokenizing them here only for a log line is not worth it.
+    Truncation counts them later, and only the ones it actually reaches.
+    """
+    with profile_stage("context_compaction") as stage:
+        compacted = compact_text_units(text_units, seen_lines)
+        chars_saved = sum(len(t["content"]) for t in text_units) - sum(
+            len(t["content"]) for t in compacted
+        )
+        stage["units_before"] = len(text_units)
+        stage["units_after"] = len(compacted)
+        stage["chars_saved"] = chars_saved
+    if chars_saved > 0:
+        logger.info(
+            f"Context compaction saved {chars_saved} characters "
+            f"({len(text_units)} to {len(compacted)} text units)"
+        )
+    return compacted
+
+
+async def _fuse_lexical_chunk_ids(
+    query: str,
+    vector_results: list[dict],
+    chunks_lexical: BaseLexicalStorage,
+    top_k: int,
+) -> list[str]:
+    """Fuse vector chunk hits with BM25 hits by reciprocal rank, keeping top_k ids."""
+    vector_ids = [r["id"] for r in vector_results]
+    if chunks_lexical is None:
+        return vector_ids
+    with profile_stage("lexical_lookup") as stage:
+        lexical_results = await chunks_lexical.query(query, top_k=top_k)
+        stage["chunks"] = len(lexical_results)
+    if not lexical_results:
+        return vector_ids
+    lexical_ids = [r["id"] for r in lexical_results]
+    return reciprocal_rank_fusion([vector_ids, lexical_ids])[:top_k]
 
 
 async def naive_query(
@@ -1079,21 +1322,43 @@ async def naive_query(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
     global_config: dict,
+    chunks_lexical: BaseLexicalStorage = None,
+    query_caches: dict = None,
 ):
     use_model_func = global_config["llm_model_func"]
-    results = await chunks_vdb.query(query, top_k=query_param.top_k)
-    if not len(results):
+    with profile_stage("chunk_lookup") as stage:
+        results = await chunks_vdb.query(query, top_k=query_param.top_k)
+        stage["chunks"] = len(results)
+    chunks_ids = await _fuse_lexical_chunk_ids(
+        query, results, chunks_lexical, query_param.top_k
+    )
+    if not len(chunks_ids):
         return PROMPTS["fail_response"]
-    chunks_ids = [r["id"] for r in results]
 
-    chunks = await text_chunks_db.get_by_ids(chunks_ids)
+    with profile_stage("chunk_fetch") as stage:
+        chunks = await text_chunks_db.get_by_ids(
+            chunks_ids, fields=CONTEXT_CHUNK_FIELDS
+        )
+        stage["chunks_fetched"] = sum(c is not None for c in chunks or [])
+    chunks_ids, chunks = await _rerank_chunks(
+        query,
+        chunks_ids,
+        chunks or [],
+        global_config.get("rerank_func"),
+        query_param.rerank_top_n,
+        cache=(query_caches or {}).get("rerank"),
+    )
+    chunks = _compact_text_units(chunks)
 
     maybe_trun_chunks = truncate_list_by_token_size(
         chunks,
         key=lambda x: x["content"],
         max_token_size=query_param.max_token_for_text_unit,
+        token_count=lambda x: x.get("tokens"),
     )
     logger.info(f"Truncate {len(chunks)} to {len(maybe_trun_chunks)} chunks")
+    if query_param.only_need_context and query_param.structured_context:
+        return QueryContext(sources=maybe_trun_chunks).to_dict()
     section = "--New Chunk--\n".join([c["content"] for c in maybe_trun_chunks])
     if query_param.only_need_context:
         return section
@@ -1101,12 +1366,14 @@ async def naive_query(
     sys_prompt = sys_prompt_temp.format(
         content_data=section, response_type=query_param.response_type
     )
-    response = await use_model_func(
-        query,
-        system_prompt=sys_prompt,
-    )
+    with profile_stage("answer_llm"):
+        response = await use_model_func(
+            query,
+            system_prompt=sys_prompt,
+            stream=query_param.stream,
+        )
 
-    if len(response) > len(sys_prompt):
+    if isinstance(response, str) and len(response) > len(sys_prompt):
         response = (
             response[len(sys_prompt) :]
             .replace(sys_prompt, "")
@@ -1121,64 +1388,220 @@ async def naive_query(
     return response
 
 
+async def answer_from_context(
+    query,
+    context: str,
+    query_param: QueryParam,
+    global_config: dict,
+    prompt_name: str = "rag_response",
+) -> Union[str, AsyncIterator[str]]:
+    """Generate the answer for a context built with ``only_need_context``"""
+    use_model_func = global_config["llm_model_func"]
+    sys_prompt = PROMPTS[prompt_name].format(
+        context_data=context,
+        content_data=context,
+        response_type=query_param.response_type,
+    )
+    with profile_stage("answer_llm"):
+        response = await use_model_func(
+            query,
+            system_prompt=sys_prompt,
+            stream=query_param.stream,
+        )
+    if isinstance(response, str) and len(response) > len(sys_prompt):
+        response = (
+            response.replace(sys_prompt, "")
+            .replace("user", "")
+            .replace("model", "")
+            .replace(query, "")
+            .replace("<system>", "")
+            .replace("</system>", "")
+            .strip()
+        )
+    return response
+
+
+class _DescriptionScorer:
+    """Rank a node's descriptions against the query by embedding similarity.
+
+    Description embeddings come from the index-time ``entity_description_db``
+    (or are computed once on the fly for nodes indexed before it existed) and
+    are kept normalized in ``cache``, which the MiniRAG instance owns so that
+    it never mixes embedding models. Each query costs one embedding call plus
+    a matrix-vector product per node.
+    """
+
+    def __init__(
+        self,
+        query: str,
+        embedder,
+        entity_description_db=None,
+        cache: LRUCache = None,
+    ):
+        self.query = query
+        self.embedder = embedder
+        self.entity_description_db = entity_description_db
+        self._cache = cache if cache is not None else LRUCache(4096)
+        self._query_vec = None
+
+    async def _query_embedding(self) -> np.ndarray:
+        if self._query_vec is None:
+            self._query_vec = normalize_rows(await self.embedder([self.query]))[0]
+        return self._query_vec
+
+    async def _description_matrix(
+        self, entity_name: str, descriptions: list[str]
+    ) -> np.ndarray:
+        keys = [_description_embedding_key(entity_name, d) for d in descriptions]
+        vectors = [self._cache.get(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            stored = [None] * len(missing)
+            if self.entity_description_db is not None:
+                stored = await self.entity_description_db.get_by_ids(
+                    [keys[i] for i in missing]
+                )
+            for i, entry in zip(missing, stored):
+                if entry is not None:
+                    vectors[i] = decode_embedding_matrix(entry["embedding"], 1)[0]
+            unstored = [i for i in missing if vectors[i] is None]
+            if unstored:
+                embeddings = await self.embedder([descriptions[i] for i in unstored])
+                for i, embedding in zip(unstored, embeddings):
+                    vectors[i] = embedding
+            for i in missing:
+                vectors[i] = normalize_rows(vectors[i][None])[0]
+                self._cache.put(keys[i], vectors[i])
+        return np.stack(vectors)
+
+    async def top_k(self, entity_name: str, descriptions: list[str], k: int):
+        if self.embedder is None:
+            return calculate_similarity(descriptions, self.query, k=k)
+        matrix, query_vec = await asyncio.gather(
+            self._description_matrix(entity_name, descriptions),
+            self._query_embedding(),
+        )
+        scores = matrix @ query_vec
+        return np.argsort(-scores, kind="stable")[:k].tolist()
+
+
+class _ChunkReranker:
+    """Rerank candidate chunks against the query with ``rerank_func``.
+
+    Scores are cached per (query hash, chunk id) in ``cache``, which the
+    MiniRAG instance owns so that it never mixes rerank models, and every
+    uncached candidate is sent to the model in a single call.
+    """
+
+    def __init__(self, query: str, rerank_func, cache: LRUCache = None):
+        self.query = query
+        self.rerank_func = rerank_func
+        self._cache = cache if cache is not None else LRUCache(16384)
+        self._query_key = compute_mdhash_id(query)
+
+    async def top_n(self, chunk_ids: list[str], chunks: list[dict], n: int):
+        """Return the indices of the n best chunks, best first."""
+        scores = []
+        for chunk_id in chunk_ids:
+            scores.append(self._cache.get((self._query_key, chunk_id)))
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            new_scores = await self.rerank_func(
+                self.query, [chunks[i]["content"] for i in missing]
+            )
+            for i, score in zip(missing, new_scores):
+                scores[i] = float(score)
+                self._cache.put((self._query_key, chunk_ids[i]), scores[i])
+        return sorted(range(len(scores)), key=lambda i: -scores[i])[:n]
+
+
+async def _rerank_chunks(
+    query: str,
+    chunk_ids: list[str],
+    chunks: list[dict],
+    rerank_func,
+    top_n: int,
+    cache: LRUCache = None,
+) -> tuple[list[str], list[dict]]:
+    """Keep the top_n of the (non-missing) chunks by rerank score, best first."""
+    pairs = [(i, c) for i, c in zip(chunk_ids, chunks) if c is not None]
+    if rerank_func is None or not pairs:
+        return [i for i, _ in pairs], [c for _, c in pairs]
+    with profile_stage("rerank") as stage:
+        chunk_ids, chunks = [list(x) for x in zip(*pairs)]
+        reranker = _ChunkReranker(query, rerank_func, cache)
+        best = await reranker.top_n(chunk_ids, chunks, top_n)
+        stage["candidates"] = len(chunks)
+        stage["kept"] = len(best)
+    return [chunk_ids[i] for i in best], [chunks[i] for i in best]
+
+
 async def path2chunk(
-    scored_edged_reasoning_path, knowledge_graph_inst, pairs_append, query, max_chunks=5
+    scored_edged_reasoning_path,
+    knowledge_graph_inst,
+    pairs_append,
+    query,
+    max_chunks=5,
+    embedder=None,
+    entity_description_db: BaseKVStorage = None,
+    description_cache: LRUCache = None,
 ):
     already_node = {}
+    scorer = _DescriptionScorer(
+        query, embedder, entity_description_db, description_cache
+    )
     for k, v in scored_edged_reasoning_path.items():
         node_chunk_id = None
 
         for pathtuple, scorelist in v["Path"].items():
             if pathtuple in pairs_append:
                 use_edge = pairs_append[pathtuple]
-                edge_datas = []
-                edge_datas = await asyncio.gather(
-                    *[knowledge_graph_inst.get_edge(r[0], r[1]) for r in use_edge]
+                # chunk ids of the first edge on the path
+                text_units = await knowledge_graph_inst.get_edge_chunk_ids(
+                    use_edge[0][0], use_edge[0][1]
                 )
-                text_units = [
-                    split_string_by_multi_markers(dp["source_id"], [GRAPH_FIELD_SEP])
-                    for dp in edge_datas  # chunk ID
-                ][0]
 
             else:
                 use_edge = []
                 text_units = []
 
-            node_datas = await asyncio.gather(
-                *[knowledge_graph_inst.get_node(pathtuple[0])]
+            text_units = text_units + await knowledge_graph_inst.get_node_chunk_ids(
+                pathtuple[0]
             )
-            for dp in node_datas:
-                text_units_node = split_string_by_multi_markers(
-                    dp["source_id"], [GRAPH_FIELD_SEP]
-                )
-                text_units = text_units + text_units_node
 
-            node_datas = await asyncio.gather(
-                *[knowledge_graph_inst.get_node(ents) for ents in pathtuple[1:]]
-            )
             if query is not None:
-                for dp in node_datas:
-                    text_units_node = split_string_by_multi_markers(
-                        dp["source_id"], [GRAPH_FIELD_SEP]
-                    )
-                    descriptionlist_node = split_string_by_multi_markers(
-                        dp["description"], [GRAPH_FIELD_SEP]
-                    )
-                    if descriptionlist_node[0] not in already_node.keys():
-                        already_node[descriptionlist_node[0]] = None
-
-                        if len(text_units_node) == len(descriptionlist_node):
-                            if len(text_units_node) > 5:
-                                max_ids = int(max(5, len(text_units_node) / 2))
-                                should_consider_idx = calculate_similarity(
-                                    descriptionlist_node, query, k=max_ids
+                path_chunk_ids = await asyncio.gather(
+                    *[
+                        knowledge_graph_inst.get_node_chunk_ids(ents)
+                        for ents in pathtuple[1:]
+                    ]
+                )
+                for ents, text_units_node in zip(pathtuple[1:], path_chunk_ids):
+                    if ents not in already_node:
+                        already_node[ents] = None
+
+                        # descriptions are only split for nodes worth ranking
+                        if len(text_units_node) > PATH2CHUNK_MIN_DESCRIPTIONS:
+                            dp = await knowledge_graph_inst.get_node(ents)
+                            descriptionlist_node = split_string_by_multi_markers(
+                                dp["description"], [GRAPH_FIELD_SEP]
+                            )
+                            if len(text_units_node) == len(descriptionlist_node):
+                                max_ids = int(
+                                    max(
+                                        PATH2CHUNK_MIN_DESCRIPTIONS,
+                                        len(text_units_node) / 2,
+                                    )
+                                )
+                                should_consider_idx = await scorer.top_k(
+                                    ents, descriptionlist_node, k=max_ids
                                 )
                                 text_units_node = [
                                     text_units_node[i] for i in should_consider_idx
                                 ]
-                                already_node[descriptionlist_node[0]] = text_units_node
+                                already_node[ents] = text_units_node
                     else:
-                        text_units_node = already_node[descriptionlist_node[0]]
+                        text_units_node = already_node[ents]
                     if text_units_node is not None:
                         text_units = text_units + text_units_node
 
@@ -1192,12 +1615,7 @@ async def path2chunk(
                 node_chunk_id = node_chunk_id + count_dict
         v["Path"] = []
         if node_chunk_id is None:
-            node_datas = await asyncio.gather(*[knowledge_graph_inst.get_node(k)])
-            for dp in node_datas:
-                text_units_node = split_string_by_multi_markers(
-                    dp["source_id"], [GRAPH_FIELD_SEP]
-                )
-                count_dict = Counter(text_units_node)
+            count_dict = Counter(await knowledge_graph_inst.get_node_chunk_ids(k))
 
             for id in count_dict.most_common(max_chunks):
                 v["Path"].append(id[0])
@@ -1261,17 +1679,27 @@ async def _build_mini_query_context(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     embedder,
     query_param: QueryParam,
+    prefetched_edges: list[dict] = None,
+    prefetched_chunks: list[dict] = None,
+    chunks_lexical: BaseLexicalStorage = None,
+    rerank_func=None,
+    entity_description_db: BaseKVStorage = None,
+    query_caches: dict = None,
 ):
+    query_caches = query_caches or {}
     imp_ents = []
     nodes_from_query_list = []
     ent_from_query_dict = {}
 
-    for ent in ent_from_query:
-        ent_from_query_dict[ent] = []
-        results_node = await entity_name_vdb.query(ent, top_k=query_param.top_k)
+    with profile_stage("entity_lookup") as stage:
+        for ent in ent_from_query:
+            ent_from_query_dict[ent] = []
+            results_node = await entity_name_vdb.query(ent, top_k=query_param.top_k)
 
-        nodes_from_query_list.append(results_node)
-        ent_from_query_dict[ent] = [e["entity_name"] for e in results_node]
+            nodes_from_query_list.append(results_node)
+            ent_from_query_dict[ent] = [e["entity_name"] for e in results_node]
+        stage["query_entities"] = len(ent_from_query)
+        stage["entities_matched"] = sum(len(r) for r in nodes_from_query_list)
 
     candidate_reasoning_path = {}
 
@@ -1285,11 +1713,16 @@ async def _build_mini_query_context(
             **candidate_reasoning_path,
             **candidate_reasoning_path_new,
         }
-    for key in candidate_reasoning_path.keys():
-        candidate_reasoning_path[key][
-            "Path"
-        ] = await knowledge_graph_inst.get_neighbors_within_k_hops(key, 2)
-        imp_ents.append(key)
+    with profile_stage("khop_expansion") as stage:
+        for key in candidate_reasoning_path.keys():
+            candidate_reasoning_path[key][
+                "Path"
+            ] = await knowledge_graph_inst.get_neighbors_within_k_hops(key, 2)
+            imp_ents.append(key)
+        stage["start_nodes"] = len(candidate_reasoning_path)
+        stage["paths_enumerated"] = sum(
+            len(v["Path"]) for v in candidate_reasoning_path.values()
+        )
 
     short_path_entries = {
         name: entry
@@ -1308,48 +1741,72 @@ async def _build_mini_query_context(
         if len(entry["Path"]) >= 1
     }
     candidate_reasoning_path = {**long_path_entries, **top_short_path_dict}
-    node_datas_from_type = await knowledge_graph_inst.get_node_from_types(
-        type_keywords
-    )  # entity_type, description,...
+    with profile_stage("type_lookup") as stage:
+        node_datas_from_type = await knowledge_graph_inst.get_node_from_types(
+            type_keywords
+        )  # entity_type, description,...
+        stage["typed_nodes"] = len(node_datas_from_type)
 
     maybe_answer_list = [n["entity_name"] for n in node_datas_from_type]
     imp_ents = imp_ents + maybe_answer_list
-    scored_reasoning_path = cal_path_score_list(
-        candidate_reasoning_path, maybe_answer_list
-    )
+    with profile_stage("path_scoring") as stage:
+        scored_reasoning_path = cal_path_score_list(
+            candidate_reasoning_path, maybe_answer_list
+        )
+        stage["paths_scored"] = sum(
+            len(v["Path"]) for v in scored_reasoning_path.values()
+        )
 
-    results_edge = await relationships_vdb.query(
-        originalquery, top_k=len(ent_from_query) * query_param.top_k
-    )
-    goodedge = []
-    badedge = []
-    for item in results_edge:
-        if item["src_id"] in imp_ents or item["tgt_id"] in imp_ents:
-            goodedge.append(item)
-        else:
-            badedge.append(item)
-    scored_edged_reasoning_path, pairs_append = edge_vote_path(
-        scored_reasoning_path, goodedge
-    )
-    scored_edged_reasoning_path = await path2chunk(
-        scored_edged_reasoning_path,
-        knowledge_graph_inst,
-        pairs_append,
-        originalquery,
-        max_chunks=3,
-    )
+    edge_top_k = len(ent_from_query) * query_param.top_k
+    if prefetched_edges is None:
+        with profile_stage("edge_lookup") as stage:
+            results_edge = await relationships_vdb.query(
+                originalquery, top_k=edge_top_k
+            )
+            stage["edges"] = len(results_edge)
+    else:
+        results_edge = prefetched_edges[:edge_top_k]
+    with profile_stage("edge_vote") as stage:
+        goodedge = []
+        badedge = []
+        for item in results_edge:
+            if item["src_id"] in imp_ents or item["tgt_id"] in imp_ents:
+                goodedge.append(item)
+            else:
+                badedge.append(item)
+        scored_edged_reasoning_path, pairs_append = edge_vote_path(
+            scored_reasoning_path, goodedge
+        )
+        stage["edges_considered"] = len(results_edge)
+        stage["edges_voted"] = len(goodedge)
+        stage["paths_with_edges"] = len(pairs_append)
+    with profile_stage("path2chunk") as stage:
+        scored_edged_reasoning_path = await path2chunk(
+            scored_edged_reasoning_path,
+            knowledge_graph_inst,
+            pairs_append,
+            originalquery,
+            max_chunks=3,
+            embedder=embedder,
+            entity_description_db=entity_description_db,
+            description_cache=query_caches.get("description"),
+        )
+        stage["nodes"] = len(scored_edged_reasoning_path)
 
     entites_section_list = []
-    node_datas = await asyncio.gather(
-        *[
-            knowledge_graph_inst.get_node(entity_name)
-            for entity_name in scored_edged_reasoning_path.keys()
-        ]
-    )
+    with profile_stage("entity_fetch") as stage:
+        node_datas = await asyncio.gather(
+            *[
+                knowledge_graph_inst.get_node(entity_name)
+                for entity_name in scored_edged_reasoning_path.keys()
+            ]
+        )
+        stage["entities"] = len(node_datas)
     node_datas = [
         {**n, "entity_name": k, "Score": scored_edged_reasoning_path[k]["Score"]}
         for k, n in zip(scored_edged_reasoning_path.keys(), node_datas)
     ]
+    description_tokens = {}
     for i, n in enumerate(node_datas):
         entites_section_list.append(
             [
@@ -1358,6 +1815,7 @@ async def _build_mini_query_context(
                 n.get("description", "UNKNOWN"),
             ]
         )
+        description_tokens[n["entity_name"]] = n.get("description_tokens")
     entites_section_list = sorted(
         entites_section_list, key=lambda x: x[1], reverse=True
     )
@@ -1365,18 +1823,28 @@ async def _build_mini_query_context(
         entites_section_list,
         key=lambda x: x[2],
         max_token_size=query_param.max_token_for_node_context,
+        token_count=lambda x: description_tokens.get(x[0]),
     )
 
-    entites_section_list.insert(0, ["entity", "score", "description"])
-    entities_context = list_of_list_to_csv(entites_section_list)
 
     scorednode2chunk(ent_from_query_dict, scored_edged_reasoning_path)
 
-    results = await chunks_vdb.query(originalquery, top_k=int(query_param.top_k / 2))
-    chunks_ids = [r["id"] for r in results]
-    final_chunk_id = kwd2chunk(
-        ent_from_query_dict, chunks_ids, chunk_nums=int(query_param.top_k / 2)
+    if prefetched_chunks is None:
+        with profile_stage("chunk_lookup") as stage:
+            results = await chunks_vdb.query(
+                originalquery, top_k=int(query_param.top_k / 2)
+            )
+            stage["chunks"] = len(results)
+    else:
+        results = prefetched_chunks
+    chunks_ids = await _fuse_lexical_chunk_ids(
+        originalquery, results, chunks_lexical, int(query_param.top_k / 2)
     )
+    with profile_stage("chunk_select") as stage:
+        final_chunk_id = kwd2chunk(
+            ent_from_query_dict, chunks_ids, chunk_nums=int(query_param.top_k / 2)
+        )
+        stage["chunks_selected"] = len(final_chunk_id)
 
     if not len(results_node):
         return None
@@ -1384,26 +1852,30 @@ async def _build_mini_query_context(
     if not len(results_edge):
         return None
 
-    use_text_units = await asyncio.gather(
-        *[text_chunks_db.get_by_id(id) for id in final_chunk_id]
+    with profile_stage("chunk_fetch") as stage:
+        use_text_units = (
+            await text_chunks_db.get_by_ids(final_chunk_id, fields=CONTEXT_CHUNK_FIELDS)
+            if final_chunk_id
+            else []
+        ) or []
+        stage["chunks_fetched"] = sum(t is not None for t in use_text_units)
+    if rerank_func is not None:
+        final_chunk_id, use_text_units = await _rerank_chunks(
+            originalquery,
+            final_chunk_id,
+            use_text_units,
+            rerank_func,
+            query_param.rerank_top_n,
+            cache=query_caches.get("rerank"),
+        )
+    use_text_units = _compact_text_units(
+        [t for t in use_text_units if t is not None],
+        _description_lines([row[2] for row in entites_section_list]),
+    )
+    return MiniQueryContext(
+        entities=[tuple(row) for row in entites_section_list],
+        sources=use_text_units,
     )
-    text_units_section_list = [["id", "content"]]
-
-    for i, t in enumerate(use_text_units):
-        if t is not None:
-            text_units_section_list.append([i, t["content"]])
-    text_units_context = list_of_list_to_csv(text_units_section_list)
-
-    return f"""
------Entities-----
-```csv
-{entities_context}
-```
------Sources-----
-```csv
-{text_units_context}
-```
-"""
 
 
 async def minirag_query(  # MiniRAG
@@ -1417,18 +1889,39 @@ async def minirag_query(  # MiniRAG
     embedder,
     query_param: QueryParam,
     global_config: dict,
-) -> str:
+    entity_description_db: BaseKVStorage = None,
+    chunks_lexical: BaseLexicalStorage = None,
+    query_caches: dict = None,
+) -> Union[str, AsyncIterator[str]]:
     use_model_func = global_config["llm_model_func"]
     kw_prompt_temp = PROMPTS["minirag_query2kwd"]
     TYPE_POOL, TYPE_POOL_w_CASE = await knowledge_graph_inst.get_types()
     kw_prompt = kw_prompt_temp.format(query=query, TYPE_POOL=TYPE_POOL)
-    result = await use_model_func(kw_prompt)
+
+    # These retrievals only depend on the raw query, so start them before the
+    # keyword LLM call and reuse the results in _build_mini_query_context.
+    # The edge query is sized for the maximum number of query entities and
+    # sliced down once the real count is known.
+    prefetch = asyncio.gather(
+        relationships_vdb.query(
+            query, top_k=MINI_MAX_QUERY_ENTITIES * query_param.top_k
+        ),
+        chunks_vdb.query(query, top_k=int(query_param.top_k / 2)),
+    )
+    try:
+        with profile_stage("keyword_llm"):
+            result = await use_model_func(kw_prompt)
+    except BaseException:
+        prefetch.cancel()
+        raise
 
     try:
         keywords_data = json_repair.loads(result)
 
         type_keywords = keywords_data.get("answer_type_keywords", [])
-        entities_from_query = keywords_data.get("entities_from_query", [])[:5]
+        entities_from_query = keywords_data.get("entities_from_query", [])[
+            :MINI_MAX_QUERY_ENTITIES
+        ]
 
     except json.JSONDecodeError:
         try:
@@ -1441,13 +1934,20 @@ async def minirag_query(  # MiniRAG
             result = "{" + result.split("{")[1].split("}")[0] + "}"
             keywords_data = json_repair.loads(result)
             type_keywords = keywords_data.get("answer_type_keywords", [])
-            entities_from_query = keywords_data.get("entities_from_query", [])[:5]
+            entities_from_query = keywords_data.get("entities_from_query", [])[
+                :MINI_MAX_QUERY_ENTITIES
+            ]
 
         # Handle parsing error
         except Exception as e:
             print(f"JSON parsing error: {e}")
+            prefetch.cancel()
             return PROMPTS["fail_response"]
 
+    with profile_stage("query_retrieval_wait") as stage:
+        prefetched_edges, prefetched_chunks = await prefetch
+        stage["edges"] = len(prefetched_edges)
+        stage["chunks"] = len(prefetched_chunks)
     context = await _build_mini_query_context(
         entities_from_query,
         type_keywords,
@@ -1460,20 +1960,29 @@ async def minirag_query(  # MiniRAG
         text_chunks_db,
         embedder,
         query_param,
+        prefetched_edges=prefetched_edges,
+        prefetched_chunks=prefetched_chunks,
+        entity_description_db=entity_description_db,
+        chunks_lexical=chunks_lexical,
+        rerank_func=global_config.get("rerank_func"),
+        query_caches=query_caches,
     )
 
     if query_param.only_need_context:
-        return context
+        return _context_result(context, query_param)
     if context is None:
         return PROMPTS["fail_response"]
+    context = context.render()
 
     sys_prompt_temp = PROMPTS["rag_response"]
     sys_prompt = sys_prompt_temp.format(
         context_data=context, response_type=query_param.response_type
     )
-    response = await use_model_func(
-        query,
-        system_prompt=sys_prompt,
-    )
+    with profile_stage("answer_llm"):
+        response = await use_model_func(
+            query,
+            system_prompt=sys_prompt,
+            stream=query_param.stream,
+        )
 
     return response
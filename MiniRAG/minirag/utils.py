@@ -1,4 +1,5 @@
 import asyncio
+import base64
 import html
 import io
 import csv
@@ -6,23 +7,31 @@ import json
 import logging
 import os
 import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dataclasses import dataclass
-from functools import wraps
+from functools import lru_cache, partial, wraps
 from hashlib import md5
 from typing import Any, Union, List
 import xml.etree.ElementTree as ET
 import copy
 import numpy as np
 import tiktoken
+from tqdm.asyncio import tqdm as tqdm_async
 from nltk.metrics import edit_distance
 from rouge import Rouge
 from nltk.translate.bleu_score import sentence_bleu
-from sentence_transformers import SentenceTransformer
 from sklearn.feature_extraction.text import TfidfVectorizer
 from nltk.tokenize import word_tokenize
 from nltk.translate.bleu_score import SmoothingFunction
 
-ENCODER = None
+# tiktoken encodings by model or encoding name, shared across threads
+_TIKTOKEN_ENCODERS: dict[str, "tiktoken.Encoding"] = {}
+_TIKTOKEN_ENCODERS_LOCK = threading.Lock()
 
 logger = logging.getLogger("minirag")
 
@@ -107,15 +116,234 @@ def limit_async_func_call(max_size: int, waitting_time: float = 0.0001):
             while __current_size >= max_size:
                 await asyncio.sleep(waitting_time)
             __current_size += 1
-            result = await func(*args, **kwargs)
-            __current_size -= 1
-            return result
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                __current_size -= 1
 
         return wait_func
 
     return final_decro
 
 
+class LRUCache:
+    """Bounded mapping that evicts the least recently used entry"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self._data:
+            return default
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ClientThreadPools:
+    """Run a blocking client library's calls off the event loop.
+
+    Reads and writes get separate pools, so a long bulk import does not
+    queue the queries issued while it runs. Threads start on first use.
+    """
+
+    def __init__(self, name: str, read_threads: int = 8, write_threads: int = 2):
+        self._read_pool = ThreadPoolExecutor(
+            read_threads, thread_name_prefix=f"{name}-read"
+        )
+        self._write_pool = ThreadPoolExecutor(
+            write_threads, thread_name_prefix=f"{name}-write"
+        )
+
+    async def read(self, func: callable, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._read_pool, partial(func, *args, **kwargs)
+        )
+
+    async def write(self, func: callable, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._write_pool, partial(func, *args, **kwargs)
+        )
+
+
+class EmbeddingBatcher:
+    """Coalesce concurrent embedding calls into shared batches.
+
+    Requests issued while a flush is pending are merged into calls of at most
+    ``max_batch_size`` texts (a single request is never split), and texts that
+    appear in several requests are embedded only once.
+    """
+
+    def __init__(self, func: callable, max_batch_size: int = 32):
+        self.func = func
+        self.max_batch_size = max_batch_size
+        self._pending: list[tuple[list[str], asyncio.Future]] = []
+        self._flush_scheduled = False
+        # running flushes; the loop only keeps weak references to tasks
+        self._flush_tasks: set[asyncio.Task] = set()
+
+    async def __call__(self, texts: list[str]) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((list(texts), future))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            # starts on the next loop iteration, after the requests issued
+            # in this one have been queued
+            task = loop.create_task(self._flush())
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+        return await future
+
+    async def _flush(self):
+        pending, self._pending = self._pending, []
+        self._flush_scheduled = False
+        groups, group, group_size = [], [], 0
+        for texts, future in pending:
+            if group and group_size + len(texts) > self.max_batch_size:
+                groups.append(group)
+                group, group_size = [], 0
+            group.append((texts, future))
+            group_size += len(texts)
+        if group:
+            groups.append(group)
+        await asyncio.gather(*[self._embed_group(g) for g in groups])
+
+    async def _embed_group(self, group: list[tuple[list[str], asyncio.Future]]):
+        unique_texts = list(dict.fromkeys(t for texts, _ in group for t in texts))
+        try:
+            embeddings = np.asarray(await self.func(unique_texts))
+            index = {text: i for i, text in enumerate(unique_texts)}
+            results = [embeddings[[index[t] for t in texts]] for texts, _ in group]
+        except asyncio.CancelledError:
+            for _, future in group:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(group, results):
+            if not future.done():
+                future.set_result(result)
+
+
+# Active EmbeddingBatcher instances for the current task tree, keyed by the
+# wrapped embedding function. None means calls go straight to the function.
+_embedding_batchers: ContextVar[Union[dict, None]] = ContextVar(
+    "minirag_embedding_batchers", default=None
+)
+
+
+def batch_embedding_calls(max_batch_size: int):
+    """Let an embedding function share batches inside ``embedding_batch_scope``"""
+
+    def final_decro(func):
+        @wraps(func)
+        async def wait_func(texts, *args, **kwargs):
+            batchers = _embedding_batchers.get()
+            if batchers is None or args or kwargs:
+                return await func(texts, *args, **kwargs)
+            batcher = batchers.get(id(wait_func))
+            if batcher is None:
+                batcher = batchers[id(wait_func)] = EmbeddingBatcher(
+                    func, max_batch_size
+                )
+            return await batcher(texts)
+
+        return wait_func
+
+    return final_decro
+
+
+@contextmanager
+def embedding_batch_scope():
+    """Share embedding batches between the tasks created inside this block
+
+    Nested scopes reuse the batchers of the outermost one.
+    """
+    if _embedding_batchers.get() is not None:
+        yield
+        return
+    token = _embedding_batchers.set({})
+    try:
+        yield
+    finally:
+        _embedding_batchers.reset(token)
+
+
+class QueryProfiler:
+    """Collect per-stage wall-clock timings and item counts for one query"""
+
+    def __init__(self):
+        self.stages: list[dict[str, Any]] = []
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        counts: dict[str, Any] = {}
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            self.stages.append(
+                {
+                    "stage": name,
+                    "ms": round((time.perf_counter() - start) * 1000, 3),
+                    **counts,
+                }
+            )
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "total_ms": round((time.perf_counter() - self._start) * 1000, 3),
+            "stages": list(self.stages),
+        }
+
+
+_query_profiler: ContextVar[Union[QueryProfiler, None]] = ContextVar(
+    "minirag_query_profiler", default=None
+)
+
+
+@contextmanager
+def query_profile_scope(enabled: bool = True):
+    """Install a QueryProfiler for the current query (yields None if disabled)"""
+    if not enabled:
+        yield None
+        return
+    profiler = QueryProfiler()
+    token = _query_profiler.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _query_profiler.reset(token)
+
+
+@contextmanager
+def profile_stage(name: str):
+    """Time a query stage; yields a dict the caller can fill with item counts.
+
+    This is a no-op unless a profiler is active (see ``query_profile_scope``).
+    """
+    profiler = _query_profiler.get()
+    if profiler is None:
+        yield {}
+        return
+    with profiler.stage(name) as counts:
+        yield counts
+
+
 def wrap_embedding_func_with_attrs(**kwargs):
     """Wrap a function with attributes"""
 
@@ -133,24 +361,141 @@ def load_json(file_name):
         return json.load(f)
 
 
+def plan_embedding_batches(
+    token_counts: list[int],
+    max_batch_size: int,
+    max_batch_tokens: int = None,
+    bucket_by_length: bool = False,
+) -> list[list[int]]:
+    """Group item indices into embedding requests.
+
+    A request holds at most ``max_batch_size`` items and, if set,
+    ``max_batch_tokens`` tokens; an item over the budget goes alone. With
+    ``bucket_by_length`` items are sorted by length first and the budget is
+    charged for padding to the longest item, which is what local HF
+    embedders actually compute.
+    """
+    order = range(len(token_counts))
+    if bucket_by_length:
+        order = sorted(order, key=lambda i: token_counts[i])
+    batches, batch, batch_tokens, batch_longest = [], [], 0, 0
+    for i in order:
+        tokens = batch_tokens + token_counts[i]
+        longest = max(batch_longest, token_counts[i])
+        cost = longest * (len(batch) + 1) if bucket_by_length else tokens
+        if batch and (
+            len(batch) >= max_batch_size
+            or (max_batch_tokens is not None and cost > max_batch_tokens)
+        ):
+            batches.append(batch)
+            batch, tokens, longest = [], token_counts[i], token_counts[i]
+        batch.append(i)
+        batch_tokens, batch_longest = tokens, longest
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+async def embed_in_batches(
+    embedding_func: callable,
+    texts: list[str],
+    max_batch_size: int,
+    global_config: dict,
+    desc: str = "Generating embeddings",
+) -> np.ndarray:
+    """Embed texts for a storage upsert, one row per text.
+
+    Duplicate texts are embedded once. Requests are cut by
+    ``embedding_batch_tokens`` from global_config when set (else only by
+    ``max_batch_size``), and ``embedding_length_bucketing`` groups texts
+    of similar length. Logs the achieved tokens/sec.
+    """
+    unique_texts = list(dict.fromkeys(texts))
+    token_counts = [
+        len(tokens)
+        for tokens in encode_batch_by_tiktoken(
+            unique_texts, global_config.get("tiktoken_model_name", "gpt-4o")
+        )
+    ]
+    batches = plan_embedding_batches(
+        token_counts,
+        max_batch_size,
+        global_config.get("embedding_batch_tokens"),
+        global_config.get("embedding_length_bucketing", False),
+    )
+
+    async def wrapped_task(batch):
+        result = await embedding_func([unique_texts[i] for i in batch])
+        pbar.update(1)
+        return result
+
+    start = time.perf_counter()
+    pbar = tqdm_async(total=len(batches), desc=desc, unit="batch")
+    embeddings_list = await asyncio.gather(*[wrapped_task(b) for b in batches])
+    elapsed = time.perf_counter() - start
+    total_tokens = sum(token_counts)
+    logger.info(
+        f"Embedded {len(unique_texts)} texts ({len(texts) - len(unique_texts)} "
+        f"duplicates skipped, {total_tokens} tokens) in {len(batches)} requests: "
+        f"{total_tokens / max(elapsed, 1e-9):.0f} tokens/s"
+    )
+    if any(len(e) != len(b) for e, b in zip(embeddings_list, batches)):
+        # sometimes the embedding is not returned correctly; let the caller
+        # notice the row count mismatch
+        return np.concatenate(embeddings_list)
+    embeddings = np.empty(
+        (len(unique_texts),) + np.shape(embeddings_list[0])[1:],
+        dtype=np.asarray(embeddings_list[0]).dtype,
+    )
+    for batch, batch_embeddings in zip(batches, embeddings_list):
+        embeddings[batch] = batch_embeddings
+    index = {text: i for i, text in enumerate(unique_texts)}
+    return embeddings[[index[text] for text in texts]]
+
+
 def write_json(json_obj, file_name):
     with open(file_name, "w", encoding="utf-8") as f:
         json.dump(json_obj, f, indent=2, ensure_ascii=False)
 
 
+def get_tiktoken_encoder(model_name: str = "gpt-4o") -> "tiktoken.Encoding":
+    """Return the tiktoken encoding for a model or encoding name, loading it once"""
+    encoder = _TIKTOKEN_ENCODERS.get(model_name)
+    if encoder is None:
+        with _TIKTOKEN_ENCODERS_LOCK:
+            encoder = _TIKTOKEN_ENCODERS.get(model_name)
+            if encoder is None:
+                try:
+                    encoder = tiktoken.encoding_for_model(model_name)
+                except KeyError:
+                    # not a model name, e.g. "cl100k_base"
+                    encoder = tiktoken.get_encoding(model_name)
+                _TIKTOKEN_ENCODERS[model_name] = encoder
+    return encoder
+
+
+def warm_tiktoken_encoders(*model_names: str):
+    """Load encoders up front so the first query does not pay for it"""
+    for model_name in model_names:
+        get_tiktoken_encoder(model_name)
+
+
 def encode_string_by_tiktoken(content: str, model_name: str = "gpt-4o"):
-    global ENCODER
-    if ENCODER is None:
-        ENCODER = tiktoken.encoding_for_model(model_name)
-    tokens = ENCODER.encode(content)
+    tokens = get_tiktoken_encoder(model_name).encode(content)
     return tokens
 
 
+def encode_batch_by_tiktoken(
+    contents: list[str], model_name: str = "gpt-4o", num_threads: int = 8
+) -> list[list[int]]:
+    """Encode many strings with tiktoken's native multithreaded batch encoder"""
+    return get_tiktoken_encoder(model_name).encode_batch(
+        list(contents), num_threads=num_threads
+    )
+
+
 def decode_tokens_by_tiktoken(tokens: list[int], model_name: str = "gpt-4o"):
-    global ENCODER
-    if ENCODER is None:
-        ENCODER = tiktoken.encoding_for_model(model_name)
-    content = ENCODER.decode(tokens)
+    content = get_tiktoken_encoder(model_name).decode(tokens)
     return content
 
 
@@ -186,18 +531,137 @@ def is_float_regex(value):
     return bool(re.match(r"^[-+]?[0-9]*\.?[0-9]+$", value))
 
 
-def truncate_list_by_token_size(list_data: list, key: callable, max_token_size: int):
-    """Truncate a list of data by token size"""
+# the cache holds its keys, so only short strings are memoized: at most
+# 16384 entries of up to 1024 characters each
+_COUNT_TOKENS_CACHE_MAX_CHARS = 1024
+
+
+@lru_cache(maxsize=16384)
+def _count_tokens_cached(content: str, model_name: str) -> int:
+    return len(encode_string_by_tiktoken(content, model_name=model_name))
+
+
+def count_tokens(content: str, model_name: str = "gpt-4o") -> int:
+    """Token count of content; short strings are memoized in a process-wide LRU"""
+    if len(content) > _COUNT_TOKENS_CACHE_MAX_CHARS:
+        return len(encode_string_by_tiktoken(content, model_name=model_name))
+    return _count_tokens_cached(content, model_name)
+
+
+def count_tokens_batch(contents: list[str], model_name: str = "gpt-4o") -> list[int]:
+    """Token counts for many strings from one multithreaded batch encode"""
+    if not contents:
+        return []
+    return [len(tokens) for tokens in encode_batch_by_tiktoken(contents, model_name)]
+
+
+def truncate_list_by_token_size(
+    list_data: list,
+    key: callable,
+    max_token_size: int,
+    token_count: callable = None,
+):
+    """Truncate a list of data by token size
+
+    token_count(data) may return a token count stored at index time (or None
+    to fall back to the cached count of key(data)), so the scan below does not
+    need to call the tokenizer for indexed items.
+    """
     if max_token_size <= 0:
         return []
     tokens = 0
     for i, data in enumerate(list_data):
-        tokens += len(encode_string_by_tiktoken(key(data)))
+        n_tokens = token_count(data) if token_count is not None else None
+        if n_tokens is None:
+            n_tokens = count_tokens(key(data))
+        tokens += n_tokens
         if tokens > max_token_size:
             return list_data[:i]
     return list_data
 
 
+def merge_overlapping_text(
+    left: str, right: str, min_overlap: int = 8
+) -> Union[str, None]:
+    """Append right to left, writing their shared left-suffix/right-prefix once.
+
+    Returns None when they do not overlap by at least min_overlap characters.
+    """
+    probe = right[:min_overlap]
+    if len(probe) < min_overlap:
+        return None
+    # the overlap can be at most len(right) characters long
+    start = left.find(probe, max(0, len(left) - len(right)))
+    while start != -1:
+        if right.startswith(left[start:]):
+            return left + right[len(left) - start :]
+        start = left.find(probe, start + 1)
+    return None
+
+
+def normalize_context_line(line: str) -> str:
+    return " ".join(re.findall(r"\w+", line.casefold()))
+
+
+def compact_text_units(
+    text_units: list[dict], seen_lines: set[str] | None = None
+) -> list[dict]:
+    """Merge adjacent chunks and drop repeated lines before prompt assembly.
+
+    Units of the same ``full_doc_id`` with consecutive ``chunk_order_index``
+    are merged into the best-ranked one, writing their token overlap once.
+    Lines equal to an earlier line (or to one in ``seen_lines``) after
+    case/punctuation/whitespace normalization are then dropped, and units left
+    empty are removed. Returns new dicts in the original rank order.
+    """
+    seen_lines = set() if seen_lines is None else seen_lines
+    # rank of the best-ranked member -> (first unit of the run, merged content)
+    runs: dict[int, tuple[dict, str]] = {}
+    by_doc: dict[str, list[tuple[int, dict]]] = {}
+    for rank, unit in enumerate(text_units):
+        if unit.get("full_doc_id") is None or unit.get("chunk_order_index") is None:
+            runs[rank] = (unit, unit["content"])
+        else:
+            by_doc.setdefault(unit["full_doc_id"], []).append((rank, unit))
+    for units in by_doc.values():
+        units.sort(key=lambda x: x[1]["chunk_order_index"])
+        run_rank, first = units[0]
+        content, last = first["content"], first
+        for rank, unit in units[1:]:
+            if unit["chunk_order_index"] == last["chunk_order_index"]:
+                continue
+            merged = None
+            if unit["chunk_order_index"] == last["chunk_order_index"] + 1:
+                merged = merge_overlapping_text(content, unit["content"])
+            if merged is None:
+                runs[run_rank] = (first, content)
+                run_rank, first, content = rank, unit, unit["content"]
+            else:
+                run_rank, content = min(run_rank, rank), merged
+            last = unit
+        runs[run_rank] = (first, content)
+
+    compacted = []
+    for rank in sorted(runs):
+        first, content = runs[rank]
+        kept_lines = []
+        for line in content.split("\n"):
+            key = normalize_context_line(line)
+            if key:
+                if key in seen_lines:
+                    continue
+                seen_lines.add(key)
+            kept_lines.append(line)
+        content = "\n".join(kept_lines).strip()
+        if content:
+            unit = {**first, "content": content}
+            if content != first["content"]:
+                # the stored count no longer matches the rewritten content
+                unit.pop("tokens", None)
+            compacted.append(unit)
+    return compacted
+
+
 def list_of_list_to_csv(data: List[List[str]]) -> str:
     output = io.StringIO()
     writer = csv.writer(output)
@@ -338,6 +802,15 @@ def process_combine_contexts(hl, ll):
     return combined_sources
 
 
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[str]:
+    """Fuse several best-first id rankings into one with reciprocal rank fusion."""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
 def is_continuous_subsequence(subseq, seq):
     def find_all_indexes(tup, value):
         indexes = []
@@ -447,11 +920,17 @@ def cosine_similarity(v1, v2):
     return dot_product / (norm1 * norm2)
 
 
-def quantize_embedding(embedding: np.ndarray | list[float], bits: int = 8):
+def quantize_embedding(
+    embedding: np.ndarray | list[float], bits: int = 8, axis: int | None = None
+):
+    """Affine-quantize to unsigned ints; ``axis=-1`` gives each row of a matrix
+    its own min/max (returned with kept dims so they broadcast back)."""
     embedding = np.array(embedding)
-    min_val = embedding.min()
-    max_val = embedding.max()
-    scale = (2**bits - 1) / (max_val - min_val)
+    min_val = embedding.min(axis=axis, keepdims=axis is not None)
+    max_val = embedding.max(axis=axis, keepdims=axis is not None)
+    value_range = max_val - min_val
+    # constant vectors quantize to all zeros instead of dividing by zero
+    scale = (2**bits - 1) / np.where(value_range > 0, value_range, 1)
     quantized = np.round((embedding - min_val) * scale).astype(np.uint8)
     return quantized, min_val, max_val
 
@@ -463,6 +942,32 @@ def dequantize_embedding(
     return (quantized * scale + min_val).astype(np.float32)
 
 
+def encode_embedding_matrix(matrix: np.ndarray) -> str:
+    """Serialize a 2D embedding matrix as base64 float32 for JSON-friendly storage"""
+    return base64.b64encode(np.asarray(matrix, dtype=np.float32).tobytes()).decode()
+
+
+def decode_embedding_matrix(data: str, rows: int) -> np.ndarray:
+    """Inverse of ``encode_embedding_matrix``"""
+    flat = np.frombuffer(base64.b64decode(data), dtype=np.float32)
+    return flat.reshape(rows, -1) if rows else flat.reshape(0, 0)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row so dot products are cosine similarities"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+@lru_cache(maxsize=4)
+def _load_sentence_transformer(model_name: str):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name)
+
+
 def calculate_similarity(sentences, target, method="levenshtein", n=1, k=1):
     target_tokens = target.lower().split()
     similarities_with_index = []
@@ -487,7 +992,7 @@ def calculate_similarity(sentences, target, method="levenshtein", n=1, k=1):
             similarities_with_index.append((i, rouge_score))
 
     elif method == "bert":
-        model = SentenceTransformer('all-MiniLM-L6-v2')
+        model = _load_sentence_transformer("all-MiniLM-L6-v2")
         embeddings = model.encode(sentences + [target])
         target_vec = embeddings[-1]
         similarities_with_index = [(i, np.dot(embeddings[i], target_vec) /
@@ -0,0 +1,23 @@
+import pytest
+
+from minirag import utils
+
+
+class ByteEncoder:
+    """Offline stand-in for a tiktoken encoding: one token per UTF-8 byte"""
+
+    def encode(self, content, **kwargs):
+        return list(content.encode("utf-8"))
+
+    def encode_batch(self, contents, **kwargs):
+        return [self.encode(content) for content in contents]
+
+    def decode(self, tokens):
+        return bytes(tokens).decode("utf-8", errors="ignore")
+
+
+@pytest.fixture(autouse=True)
+def offline_tokenizer(monkeypatch):
+    # tiktoken downloads its BPE files on first use; tests must not need that
+    for model_name in ("gpt-4o", "gpt-4o-mini"):
+        monkeypatch.setitem(utils._TIKTOKEN_ENCODERS, model_name, ByteEncoder())
@@ -0,0 +1,145 @@
+import hashlib
+import os
+import re
+
+import numpy as np
+import pytest
+
+from minirag import MiniRAG, QueryParam
+from minirag.base import BaseKVStorage
+from minirag.kg.bm25_impl import JsonBM25Storage, bm25_tokenize
+from minirag.kg.json_kv_impl import JsonKVStorage
+from minirag.utils import EmbeddingFunc, reciprocal_rank_fusion
+
+CHUNKS = {
+    "c1": {"content": "Alice builds rockets at Acme"},
+    "c2": {"content": "Bob plays chess in Berlin"},
+    "c3": {"content": "Rockets need fuel, and Acme buys fuel"},
+}
+
+
+def make_storage(working_dir, **kwargs):
+    return JsonBM25Storage(
+        namespace="chunks", global_config={"working_dir": str(working_dir)}, **kwargs
+    )
+
+
+async def ranked_ids(storage, query, top_k=3):
+    return [r["id"] for r in await storage.query(query, top_k=top_k)]
+
+
+# === SCORING ===
+
+
+def test_cjk_runs_become_bigrams():
+    assert bm25_tokenize("Acme 火箭公司") == ["acme", "火箭", "箭公", "公司"]
+
+
+@pytest.mark.asyncio
+async def test_query_ranks_by_bm25(tmp_path):
+    storage = make_storage(tmp_path)
+    await storage.upsert(CHUNKS)
+    assert await ranked_ids(storage, "fuel") == ["c3"]
+    assert await ranked_ids(storage, "acme rockets", top_k=2) == ["c1", "c3"]
+    await storage.delete(["c1"])
+    assert await ranked_ids(storage, "acme rockets") == ["c3"]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    # b is second in one ranking and first in the other
+    assert reciprocal_rank_fusion([["a", "b"], ["b", "c"]]) == ["b", "a", "c"]
+
+
+# === PERSISTENCE ===
+
+
+@pytest.mark.asyncio
+async def test_saves_append_to_the_log(tmp_path):
+    storage = make_storage(tmp_path)
+    await storage.upsert(CHUNKS)
+    await storage.index_done_callback()
+    await storage.delete(["c2"])
+    await storage.index_done_callback()
+
+    # below the fold threshold only the log is written
+    assert not os.path.exists(tmp_path / "bm25_chunks.json")
+    with open(tmp_path / "bm25_chunks.log.jsonl") as f:
+        assert len(f.readlines()) == 4
+
+    reloaded = make_storage(tmp_path)
+    assert await ranked_ids(reloaded, "acme rockets chess") == ["c1", "c3"]
+
+
+@pytest.mark.asyncio
+async def test_log_is_folded_into_the_snapshot(tmp_path):
+    storage = make_storage(tmp_path, log_fold_min_bytes=0)
+    await storage.upsert(CHUNKS)
+    await storage.index_done_callback()
+    assert os.path.exists(tmp_path / "bm25_chunks.json")
+    assert not os.path.exists(tmp_path / "bm25_chunks.log.jsonl")
+
+    # a log left over from a fold that crashed is replayed harmlessly
+    await storage.delete(["c3"])
+    storage._append_log(['{"id": "c3", "tf": null}\n'])
+    reloaded = make_storage(tmp_path)
+    assert await ranked_ids(reloaded, "fuel rockets") == ["c1"]
+
+
+# === BACKFILL ===
+
+
+async def llm(prompt, system_prompt=None, history_messages=[], **kwargs):
+    return "<|COMPLETE|>" if system_prompt is None else "answer"
+
+
+async def embed(texts):
+    vectors = np.zeros((len(texts), 64))
+    for row, text in enumerate(texts):
+        for word in re.findall(r"\w+", text.lower()):
+            vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % 64] += 1
+    return vectors
+
+
+def make_rag(working_dir, enable_lexical_search):
+    return MiniRAG(
+        working_dir=str(working_dir),
+        llm_model_func=llm,
+        embedding_func=EmbeddingFunc(64, 8192, embed),
+        enable_lexical_search=enable_lexical_search,
+    )
+
+
+@pytest.mark.asyncio
+async def test_existing_chunks_are_backfilled(tmp_path):
+    await make_rag(tmp_path, False).ainsert(
+        ["Alice builds rockets at Acme.", "Bob plays chess in Berlin."]
+    )
+    assert not os.path.exists(tmp_path / "bm25_chunks.json")
+
+    rag = make_rag(tmp_path, True)
+    chunk_ids = await rag.text_chunks.all_keys()
+    await rag.aquery("chess", QueryParam(mode="naive", only_need_context=True))
+    assert sorted(rag.chunks_lexical._data) == sorted(chunk_ids)
+    assert len(await rag.chunks_lexical.query("chess", top_k=5)) == 1
+
+    # the backfill was saved, a new instance does not redo it
+    assert sorted(make_rag(tmp_path, True).chunks_lexical._data) == sorted(chunk_ids)
+
+
+@pytest.mark.asyncio
+async def test_backfill_skips_kv_backends_without_all_keys(
+    tmp_path, monkeypatch, caplog
+):
+    await make_rag(tmp_path, False).ainsert(["Alice builds rockets at Acme."])
+    # a KV backend that does not implement all_keys
+    monkeypatch.setattr(JsonKVStorage, "all_keys", BaseKVStorage.all_keys)
+
+    rag = make_rag(tmp_path, True)
+    param = QueryParam(mode="naive", only_need_context=True)
+    with caplog.at_level("INFO", logger="minirag"):
+        await rag.aquery("rockets", param)
+        await rag.aquery("rockets", param)
+        await rag.ainsert(["Bob plays chess in Berlin."])
+    assert caplog.text.count("cannot list its keys") == 1
+    # only the chunks inserted from now on are indexed
+    assert len(rag.chunks_lexical._data) == 1
@@ -0,0 +1,34 @@
+import pytest
+
+from minirag import operate, utils
+from minirag.operate import _compact_text_units
+from minirag.utils import count_tokens
+
+
+def no_tokenizer(*args, **kwargs):
+    raise AssertionError("the tokenizer must not run")
+
+
+def test_compaction_does_not_tokenize(monkeypatch):
+    monkeypatch.setattr(operate, "count_tokens", no_tokenizer)
+    monkeypatch.setattr(utils, "encode_string_by_tiktoken", no_tokenizer)
+    monkeypatch.setattr(utils, "encode_batch_by_tiktoken", no_tokenizer)
+    doc = {"full_doc_id": "d", "tokens": 5}
+    units = [
+        {"content": "first line\nshared line", "chunk_order_index": 0, **doc},
+        {"content": "shared line\nlast line", "chunk_order_index": 1, **doc},
+        {"content": "Shared line!", "tokens": 3},
+    ]
+    compacted = _compact_text_units(units)
+    assert [u["content"] for u in compacted] == ["first line\nshared line\nlast line"]
+    # the merged unit's stored count is stale, truncation counts it later
+    assert "tokens" not in compacted[0]
+
+
+@pytest.mark.parametrize("length", [10, 5000])
+def test_count_tokens_caches_only_short_strings(length):
+    utils._count_tokens_cached.cache_clear()
+    content = "x" * length
+    assert count_tokens(content) == length
+    cached = utils._count_tokens_cached.cache_info().currsize
+    assert cached == (1 if length <= utils._COUNT_TOKENS_CACHE_MAX_CHARS else 0)
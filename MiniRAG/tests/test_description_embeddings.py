@@ -0,0 +1,103 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+from minirag.kg.json_kv_impl import JsonKVStorage
+from minirag.operate import (
+    _DescriptionScorer,
+    _upsert_description_embeddings,
+    delete_description_embeddings,
+)
+from minirag.prompt import GRAPH_FIELD_SEP
+
+
+class RecordingEmbedder:
+    """Bag-of-words hashing embedder that remembers every text it embedded"""
+
+    def __init__(self, dim=1024):
+        self.dim = dim
+        self.texts = []
+
+    async def __call__(self, texts):
+        self.texts.extend(texts)
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                column = int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim
+                vectors[row, column] += 1
+        return vectors
+
+
+def make_store(tmp_path, embedder):
+    return JsonKVStorage(
+        namespace="entity_description_embeddings",
+        global_config={"working_dir": str(tmp_path), "embedding_batch_num": 4},
+        embedding_func=embedder,
+    )
+
+
+def node(name, descriptions):
+    return {"entity_name": name, "description": GRAPH_FIELD_SEP.join(descriptions)}
+
+
+DESCRIPTIONS = [f"alice fact number {i}" for i in range(6)]
+
+
+@pytest.mark.asyncio
+async def test_only_new_descriptions_are_embedded(tmp_path):
+    embedder = RecordingEmbedder()
+    store = make_store(tmp_path, embedder)
+    config = {"embedding_batch_num": 4}
+
+    await _upsert_description_embeddings([node("ALICE", DESCRIPTIONS)], store, config)
+    assert sorted(embedder.texts) == sorted(DESCRIPTIONS)
+
+    embedder.texts.clear()
+    grown = DESCRIPTIONS + ["alice moved to paris"]
+    await _upsert_description_embeddings([node("ALICE", grown)], store, config)
+    assert embedder.texts == ["alice moved to paris"]
+    # one entry per description plus the node's key list
+    assert len(await store.all_keys()) == len(grown) + 1
+
+
+@pytest.mark.asyncio
+async def test_stale_descriptions_are_deleted(tmp_path):
+    store = make_store(tmp_path, RecordingEmbedder())
+    config = {"embedding_batch_num": 4}
+    await _upsert_description_embeddings([node("ALICE", DESCRIPTIONS)], store, config)
+
+    replaced = DESCRIPTIONS[1:] + ["alice replaced fact"]
+    await _upsert_description_embeddings([node("ALICE", replaced)], store, config)
+    assert len(await store.all_keys()) == len(replaced) + 1
+
+    await delete_description_embeddings(["ALICE"], store)
+    assert await store.all_keys() == []
+
+
+@pytest.mark.asyncio
+async def test_small_nodes_are_not_stored(tmp_path):
+    embedder = RecordingEmbedder()
+    store = make_store(tmp_path, embedder)
+    await _upsert_description_embeddings(
+        [node("BOB", DESCRIPTIONS[:3])], store, {"embedding_batch_num": 4}
+    )
+    assert embedder.texts == []
+    assert await store.all_keys() == []
+
+
+@pytest.mark.asyncio
+async def test_scorer_uses_stored_embeddings(tmp_path):
+    embedder = RecordingEmbedder()
+    store = make_store(tmp_path, embedder)
+    descriptions = DESCRIPTIONS + ["alice builds rockets at acme"]
+    await _upsert_description_embeddings(
+        [node("ALICE", descriptions)], store, {"embedding_batch_num": 4}
+    )
+
+    embedder.texts.clear()
+    scorer = _DescriptionScorer("rockets built at acme", embedder, store)
+    best = await scorer.top_k("ALICE", descriptions, k=1)
+    assert best == [len(descriptions) - 1]
+    # only the query was embedded; descriptions came from the store
+    assert embedder.texts == ["rockets built at acme"]
@@ -0,0 +1,130 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from minirag.utils import (
+    EmbeddingBatcher,
+    batch_embedding_calls,
+    embed_in_batches,
+    embedding_batch_scope,
+    plan_embedding_batches,
+)
+
+
+class RecordingEmbedder:
+    """Embeds "t<n>" as [n, n]; remembers the texts of every call"""
+
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    async def __call__(self, texts):
+        self.calls.append(list(texts))
+        if self.error is not None:
+            raise self.error
+        return np.array([[int(t[1:])] * 2 for t in texts], dtype=np.float32)
+
+
+def rows(embeddings):
+    return [int(row[0]) for row in embeddings]
+
+
+# === EMBEDDING BATCHER ===
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_call():
+    embedder = RecordingEmbedder()
+    batcher = EmbeddingBatcher(embedder, max_batch_size=8)
+    results = await asyncio.gather(
+        batcher(["t1", "t2"]), batcher(["t2", "t3"]), batcher(["t4"])
+    )
+    # t2 is embedded once and handed to both requests
+    assert embedder.calls == [["t1", "t2", "t3", "t4"]]
+    assert [rows(r) for r in results] == [[1, 2], [2, 3], [4]]
+
+
+@pytest.mark.asyncio
+async def test_batches_respect_max_size_without_splitting_requests():
+    embedder = RecordingEmbedder()
+    batcher = EmbeddingBatcher(embedder, max_batch_size=3)
+    results = await asyncio.gather(
+        batcher(["t1", "t2"]), batcher(["t3", "t4"]), batcher(["t5", "t6", "t7", "t8"])
+    )
+    assert embedder.calls == [["t1", "t2"], ["t3", "t4"], ["t5", "t6", "t7", "t8"]]
+    assert rows(results[2]) == [5, 6, 7, 8]
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_request_of_the_batch():
+    batcher = EmbeddingBatcher(RecordingEmbedder(error=RuntimeError("down")), 8)
+    results = await asyncio.gather(
+        batcher(["t1"]), batcher(["t2"]), return_exceptions=True
+    )
+    assert [str(r) for r in results] == ["down", "down"]
+
+
+@pytest.mark.asyncio
+async def test_flush_task_is_kept_until_done():
+    async def short_embedder(texts):
+        # one row too few: the error reaches the request instead of the loop
+        await asyncio.sleep(0)
+        return np.zeros((len(texts) - 1, 2))
+
+    batcher = EmbeddingBatcher(short_embedder, 8)
+    request = asyncio.ensure_future(batcher(["t1", "t2"]))
+    await asyncio.sleep(0)
+    (flush,) = batcher._flush_tasks
+    with pytest.raises(IndexError):
+        await request
+    await flush
+    await asyncio.sleep(0)
+    assert not batcher._flush_tasks
+
+
+@pytest.mark.asyncio
+async def test_calls_are_batched_only_inside_a_scope():
+    embedder = RecordingEmbedder()
+    embed = batch_embedding_calls(8)(embedder)
+
+    await asyncio.gather(embed(["t1"]), embed(["t2"]))
+    assert embedder.calls == [["t1"], ["t2"]]
+
+    embedder.calls.clear()
+    with embedding_batch_scope():
+        with embedding_batch_scope():
+            results = await asyncio.gather(embed(["t1"]), embed(["t2"]))
+    assert embedder.calls == [["t1", "t2"]]
+    assert [rows(r) for r in results] == [[1], [2]]
+
+
+# === BATCH PLANNING ===
+
+
+def test_batches_are_cut_by_size_and_token_budget():
+    assert plan_embedding_batches([1] * 5, max_batch_size=2) == [[0, 1], [2, 3], [4]]
+    assert plan_embedding_batches([3, 3, 3, 9, 1], 8, max_batch_tokens=6) == [
+        [0, 1],
+        [2],
+        [3],
+        [4],
+    ]
+
+
+def test_length_bucketing_charges_for_padding():
+    # sorted by length; four short texts fit where a long one pads the batch
+    batches = plan_embedding_batches(
+        [10, 2, 2, 10, 2, 2], 8, max_batch_tokens=20, bucket_by_length=True
+    )
+    assert batches == [[1, 2, 4, 5], [0, 3]]
+
+
+@pytest.mark.asyncio
+async def test_embed_in_batches_keeps_input_order_and_skips_duplicates():
+    embedder = RecordingEmbedder()
+    texts = ["t3", "t1", "t3", "t2", "t1"]
+    embeddings = await embed_in_batches(embedder, texts, 2, {})
+    assert rows(embeddings) == [3, 1, 3, 2, 1]
+    assert sorted(t for call in embedder.calls for t in call) == ["t1", "t2", "t3"]
+    assert all(len(call) <= 2 for call in embedder.calls)
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import re
+
+import numpy as np
+import pytest
+
+from minirag import MiniRAG, QueryParam
+from minirag.kg.nano_vector_db_impl import NanoVectorDBStorage
+from minirag.kg.numpy_vector_impl import NumpyVectorDBStorage
+from minirag.utils import EmbeddingFunc, compute_mdhash_id
+
+EXTRACTION = (
+    '("entity"<|>"ALICE"<|>"PERSON"<|>"Alice is a person")##'
+    '("entity"<|>"ACME CORP"<|>"ORGANIZATION"<|>"Acme builds rockets")##'
+    '("entity"<|>"PARIS"<|>"LOCATION"<|>"Paris is a city")##'
+    '("relationship"<|>"ALICE"<|>"ACME CORP"<|>"Alice works at Acme"<|>"work"<|>2)##'
+    '("relationship"<|>"ACME CORP"<|>"PARIS"<|>"Acme is in Paris"<|>"location"<|>1)'
+    "<|COMPLETE|>"
+)
+
+ALICE_ENTITY_ID = compute_mdhash_id('"ALICE"', prefix="ent-")
+ALICE_NAME_ID = compute_mdhash_id('"ALICE"', prefix="Ename-")
+
+
+async def llm(prompt, system_prompt=None, history_messages=[], **kwargs):
+    if prompt.startswith("-Goal-"):
+        return EXTRACTION
+    if "Answer type pool" in prompt:
+        return json.dumps(
+            {"answer_type_keywords": ["ORGANIZATION"], "entities_from_query": ["Alice"]}
+        )
+    return "no"
+
+
+async def embed(texts):
+    vectors = np.zeros((len(texts), 64))
+    for row, text in enumerate(texts):
+        for word in re.findall(r"\w+", text.lower()):
+            vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % 64] += 1
+    return vectors
+
+
+def make_rag(working_dir):
+    return MiniRAG(
+        working_dir=str(working_dir),
+        llm_model_func=llm,
+        embedding_func=EmbeddingFunc(64, 8192, embed),
+        vector_db_storage_cls_kwargs={"cosine_better_than_threshold": 0.01},
+        enable_lexical_search=False,
+    )
+
+
+def stored_ids(vdb):
+    return {row["__id__"] for row in vdb.client_storage["data"]}
+
+
+@pytest.mark.asyncio
+async def test_delete_entity_removes_every_trace(tmp_path):
+    rag = make_rag(tmp_path)
+    await rag.ainsert("Alice works at Acme Corp in Paris. Acme Corp builds rockets.")
+    assert ALICE_NAME_ID in stored_ids(rag.entity_name_vdb)
+
+    await rag.adelete_by_entity("alice")
+
+    assert ALICE_ENTITY_ID not in stored_ids(rag.entities_vdb)
+    assert ALICE_NAME_ID not in stored_ids(rag.entity_name_vdb)
+    assert all(
+        '"ALICE"' not in (row["src_id"], row["tgt_id"])
+        for row in rag.relationships_vdb.client_storage["data"]
+    )
+    assert not await rag.chunk_entity_relation_graph.has_node('"ALICE"')
+    # mini queries no longer resolve the deleted name to a missing node
+    param = QueryParam(mode="mini", only_need_context=True)
+    await rag.aquery("Where does Alice work?", param)
+
+
+@pytest.mark.asyncio
+async def test_unsupported_backend_deletes_nothing(tmp_path, monkeypatch):
+    rag = make_rag(tmp_path)
+    await rag.ainsert("Alice works at Acme Corp in Paris. Acme Corp builds rockets.")
+    # a vector backend without relation cascade support
+    monkeypatch.delattr(NanoVectorDBStorage, "delete_entities_cascade")
+    assert rag._entity_deletion_unsupported() == [
+        "NanoVectorDBStorage.delete_entities_cascade"
+    ]
+
+    await rag.adelete_by_entity("alice")
+
+    assert ALICE_ENTITY_ID in stored_ids(rag.entities_vdb)
+    assert await rag.chunk_entity_relation_graph.has_node('"ALICE"')
+
+
+# === RELATION CASCADE ===
+
+
+def make_relations_vdb(storage_cls, working_dir):
+    return storage_cls(
+        namespace="relationships",
+        global_config={
+            "working_dir": str(working_dir),
+            "embedding_batch_num": 8,
+            "vector_db_storage_cls_kwargs": {"cosine_better_than_threshold": -1.0},
+        },
+        embedding_func=EmbeddingFunc(64, 8192, embed),
+        meta_fields={"src_id", "tgt_id"},
+    )
+
+
+async def relation_ids(vdb):
+    results = await vdb.query("works", top_k=10)
+    return sorted(r["id"] for r in results)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("storage_cls", [NanoVectorDBStorage, NumpyVectorDBStorage])
+async def test_cascade_deletes_relations_by_endpoint(tmp_path, storage_cls):
+    vdb = make_relations_vdb(storage_cls, tmp_path)
+    await vdb.upsert(
+        {
+            "r1": {"content": "works", "src_id": "A", "tgt_id": "B"},
+            "r2": {"content": "works", "src_id": "B", "tgt_id": "C"},
+            "r3": {"content": "works", "src_id": "C", "tgt_id": "A"},
+        }
+    )
+    # r3 no longer touches A once its endpoints change
+    await vdb.upsert({"r3": {"content": "works", "src_id": "C", "tgt_id": "D"}})
+
+    await vdb.delete_entities_cascade(["A"])
+    assert await relation_ids(vdb) == ["r2", "r3"]
+
+    # the index is rebuilt on load
+    reloaded = make_relations_vdb(storage_cls, tmp_path)
+    await reloaded.delete_entities_cascade(["D", "missing"])
+    assert await relation_ids(reloaded) == ["r2"]
@@ -0,0 +1,199 @@
+import os
+
+import numpy as np
+import pytest
+
+from minirag.kg.nano_vector_db_impl import NanoVectorDBStorage
+from minirag.utils import EmbeddingFunc
+
+DIM = 16
+_rng = np.random.default_rng(0)
+# clustered, so that IVF lists are meaningful
+VECTORS = (
+    _rng.standard_normal((8, DIM))[_rng.integers(0, 8, 256)]
+    + 0.3 * _rng.standard_normal((256, DIM))
+).astype(np.float32)
+
+
+async def embed(texts):
+    # contents are "v<row>": the row of VECTORS to return
+    return np.stack([VECTORS[int(text[1:])] for text in texts])
+
+
+def make_storage(working_dir, meta_fields=frozenset(), **kwargs):
+    return NanoVectorDBStorage(
+        namespace="test",
+        global_config={
+            "working_dir": str(working_dir),
+            "embedding_batch_num": 32,
+            "vector_db_storage_cls_kwargs": {
+                "cosine_better_than_threshold": -1.0,
+                **kwargs,
+            },
+        },
+        embedding_func=EmbeddingFunc(DIM, 8192, embed),
+        meta_fields=set(meta_fields),
+    )
+
+
+async def insert(storage, rows, vector_rows=None):
+    vector_rows = rows if vector_rows is None else vector_rows
+    await storage.upsert(
+        {f"id{row}": {"content": f"v{v}"} for row, v in zip(rows, vector_rows)}
+    )
+
+
+async def nearest(storage, row, top_k=5):
+    return [r["id"] for r in await storage.query(f"v{row}", top_k=top_k)]
+
+
+# === IVF ===
+
+IVF = {"ann_index": "ivf", "ann_min_rows": 0, "ann_nlist": 8}
+
+
+@pytest.mark.asyncio
+async def test_ivf_matches_exact_search_when_probing_every_list(tmp_path, monkeypatch):
+    (tmp_path / "exact").mkdir()
+    (tmp_path / "ivf").mkdir()
+    exact = make_storage(tmp_path / "exact")
+    ivf = make_storage(tmp_path / "ivf", ann_nprobe=8, **IVF)
+    for storage in (exact, ivf):
+        await insert(storage, range(200))
+        await storage.index_done_callback()
+    assert ivf._ivf is not None and len(ivf._ivf.centroids) == 8
+
+    def no_exact_search(*args, **kwargs):
+        raise AssertionError("query fell back to exact search")
+
+    monkeypatch.setattr(ivf._client, "query", no_exact_search)
+    for row in range(0, 200, 20):
+        assert await nearest(ivf, row) == await nearest(exact, row)
+
+
+@pytest.mark.asyncio
+async def test_ivf_follows_updates_and_deletes(tmp_path):
+    storage = make_storage(tmp_path, ann_nprobe=1, **IVF)
+    await insert(storage, range(200))
+    await storage.index_done_callback()
+
+    # move rows to other vectors, delete some, append new ones
+    await insert(storage, range(10), vector_rows=range(200, 210))
+    await storage.delete([f"id{row}" for row in range(10, 30)])
+    await insert(storage, range(210, 230))
+
+    assert len(storage._ivf.assignments) == len(storage._client)
+    assert await nearest(storage, 205, top_k=1) == ["id5"]
+    assert await nearest(storage, 220, top_k=1) == ["id220"]
+    assert "id15" not in await nearest(storage, 15)
+
+
+@pytest.mark.asyncio
+async def test_ivf_is_saved_with_the_snapshot(tmp_path):
+    storage = make_storage(tmp_path, ann_nprobe=2, **IVF)
+    await insert(storage, range(200))
+    await storage.index_done_callback()
+    await storage._fold_task
+    # logged after the snapshot, replayed on load
+    await storage.delete(["id0", "id1"])
+    await insert(storage, range(200, 210))
+
+    reloaded = make_storage(tmp_path, ann_nprobe=2, **IVF)
+    np.testing.assert_array_equal(reloaded._ivf.centroids, storage._ivf.centroids)
+    np.testing.assert_array_equal(reloaded._ivf.assignments, storage._ivf.assignments)
+    for row in (5, 150, 205):
+        assert await nearest(reloaded, row) == await nearest(storage, row)
+
+    # without the option the saved index is ignored
+    assert make_storage(tmp_path)._ivf is None
+
+
+@pytest.mark.asyncio
+async def test_small_namespaces_are_searched_exactly(tmp_path):
+    storage = make_storage(tmp_path, ann_index="ivf", ann_min_rows=1000)
+    await insert(storage, range(200))
+    await storage.index_done_callback()
+    assert storage._ivf is None
+
+
+# === WRITE-AHEAD LOG ===
+
+
+@pytest.mark.asyncio
+async def test_writes_are_logged_and_replayed(tmp_path):
+    storage = make_storage(tmp_path)
+    await insert(storage, range(20))
+    await storage.delete(["id3"])
+    await insert(storage, [4], vector_rows=[40])
+    await storage.index_done_callback()
+
+    # below the fold threshold only the log is written: an entry per
+    # upserted row and per delete call
+    assert not os.path.exists(tmp_path / "vdb_test.json")
+    with open(tmp_path / "vdb_test.wal.jsonl") as f:
+        assert len(f.readlines()) == 22
+
+    reloaded = make_storage(tmp_path)
+    assert len(reloaded._client) == 19
+    assert await nearest(reloaded, 40, top_k=1) == ["id4"]
+    assert "id3" not in await nearest(reloaded, 3)
+
+
+@pytest.mark.asyncio
+async def test_log_is_folded_into_the_snapshot(tmp_path):
+    storage = make_storage(tmp_path, wal_fold_min_bytes=0)
+    await insert(storage, range(20))
+    await storage.index_done_callback()
+    # logged while the fold runs; kept in the fresh log
+    await storage.delete(["id0"])
+    await storage._fold_task
+
+    assert os.path.exists(tmp_path / "vdb_test.json")
+    assert not os.path.exists(tmp_path / "vdb_test.wal.jsonl.folding")
+    with open(tmp_path / "vdb_test.wal.jsonl") as f:
+        assert len(f.readlines()) == 1
+    reloaded = make_storage(tmp_path)
+    assert len(reloaded._client) == 19
+    assert await nearest(reloaded, 5, top_k=1) == ["id5"]
+
+
+@pytest.mark.asyncio
+async def test_failed_fold_keeps_the_log(tmp_path, monkeypatch):
+    storage = make_storage(tmp_path, wal_fold_min_bytes=0)
+    await insert(storage, range(20))
+
+    def crash(snapshot):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(storage, "_write_snapshot", crash)
+    await storage.index_done_callback()
+    await storage._fold_task
+    # a torn entry at the tail of the live log is skipped
+    await storage.delete(["id1"])
+    with open(tmp_path / "vdb_test.wal.jsonl", "a") as f:
+        f.write('{"op": "delete", "ids": ["id2"')
+
+    reloaded = make_storage(tmp_path)
+    assert len(reloaded._client) == 19
+    assert await nearest(reloaded, 2, top_k=1) == ["id2"]
+
+
+# === FILTERS ===
+
+
+@pytest.mark.asyncio
+async def test_filter_is_applied_before_the_top_k_cut(tmp_path):
+    storage = make_storage(tmp_path, meta_fields={"parity"})
+    await storage.upsert(
+        {
+            f"id{row}": {"content": f"v{row}", "parity": "odd" if row % 2 else "even"}
+            for row in range(20)
+        }
+    )
+    results = await storage.query("v3", top_k=4, filter={"parity": "odd"})
+    assert len(results) == 4
+    assert {r["parity"] for r in results} == {"odd"}
+    assert results[0]["id"] == "id3"
+    assert await storage.query("v3", filter={"parity": "none"}) == []
+    with pytest.raises(ValueError, match="color"):
+        await storage.query("v0", filter={"color": "red"})
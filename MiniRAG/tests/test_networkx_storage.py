@@ -0,0 +1,78 @@
+import networkx as nx
+import pytest
+
+from minirag.kg.networkx_impl import NetworkXStorage
+from minirag.prompt import GRAPH_FIELD_SEP
+
+
+def make_storage(working_dir):
+    return NetworkXStorage(
+        namespace="test",
+        global_config={"working_dir": str(working_dir)},
+        embedding_func=None,
+    )
+
+
+def joined(*chunk_ids):
+    return GRAPH_FIELD_SEP.join(chunk_ids)
+
+
+@pytest.mark.asyncio
+async def test_source_ids_live_only_in_the_chunk_index(tmp_path):
+    storage = make_storage(tmp_path)
+    await storage.upsert_node(
+        "A", {"entity_type": "PERSON", "source_id": joined("c1", "c2")}
+    )
+    await storage.upsert_node("B", {"entity_type": "PERSON", "source_id": "c2"})
+    await storage.upsert_edge(
+        "B", "A", {"weight": 1.0, "source_id": joined("c2", "c3")}
+    )
+
+    assert "source_id" not in storage._graph.nodes["A"]
+    assert "source_id" not in storage._graph.edges["A", "B"]
+    # each chunk id string is kept once
+    assert storage._chunk_id_table == ["c1", "c2", "c3"]
+
+    assert await storage.get_node_chunk_ids("A") == ["c1", "c2"]
+    assert await storage.get_edge_chunk_ids("A", "B") == ["c2", "c3"]
+    # reads return the stored attributes without rebuilding source_id
+    assert await storage.get_node("A") == {"entity_type": "PERSON"}
+    assert await storage.get_edge("A", "B") == {"weight": 1.0}
+
+    # an upsert without source_id keeps the indexed chunks
+    await storage.upsert_node("A", {"entity_type": "ORGANIZATION"})
+    assert await storage.get_node_chunk_ids("A") == ["c1", "c2"]
+
+
+@pytest.mark.asyncio
+async def test_source_ids_are_persisted_and_reloaded(tmp_path):
+    storage = make_storage(tmp_path)
+    await storage.upsert_node("A", {"source_id": joined("c1", "c2")})
+    await storage.upsert_node("B", {"source_id": joined("c3")})
+    await storage.upsert_edge("A", "B", {"source_id": joined("c1")})
+    await storage.index_done_callback()
+
+    # the file has plain strings, the live graph still does not
+    on_disk = nx.read_graphml(tmp_path / "graph_test.graphml")
+    assert on_disk.nodes["A"]["source_id"] == joined("c1", "c2")
+    assert on_disk.edges["A", "B"]["source_id"] == "c1"
+    assert "source_id" not in storage._graph.nodes["A"]
+
+    reloaded = make_storage(tmp_path)
+    assert await reloaded.get_node_chunk_ids("A") == ["c1", "c2"]
+    assert await reloaded.get_edge_chunk_ids("B", "A") == ["c1"]
+    assert await reloaded.get_node_chunk_ids("B") == ["c3"]
+    assert "source_id" not in await reloaded.get_node("B")
+
+
+@pytest.mark.asyncio
+async def test_deleted_node_drops_its_chunk_ids(tmp_path):
+    storage = make_storage(tmp_path)
+    await storage.upsert_node("A", {"source_id": "c1"})
+    await storage.upsert_node("B", {"source_id": "c2"})
+    await storage.upsert_edge("A", "B", {"source_id": "c1"})
+
+    await storage.delete_node("A")
+    assert await storage.get_node_chunk_ids("A") == []
+    assert await storage.get_edge_chunk_ids("A", "B") == []
+    assert await storage.get_node_chunk_ids("B") == ["c2"]
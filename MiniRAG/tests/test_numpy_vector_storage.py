@@ -0,0 +1,274 @@
+import asyncio
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from minirag.kg.numpy_vector_impl import IVFIndex, NumpyVectorDBStorage
+from minirag.utils import EmbeddingFunc
+
+DIM = 16
+VECTORS = np.random.default_rng(0).standard_normal((64, DIM)).astype(np.float32)
+
+
+async def embed(texts):
+    # contents are "v<row>": the row of VECTORS to return
+    return np.stack([VECTORS[int(text[1:])] for text in texts])
+
+
+def make_storage(working_dir, meta_fields=frozenset(), **kwargs):
+    return NumpyVectorDBStorage(
+        namespace="test",
+        global_config={
+            "working_dir": str(working_dir),
+            "embedding_batch_num": 8,
+            "vector_db_storage_cls_kwargs": {
+                "cosine_better_than_threshold": -1.0,
+                **kwargs,
+            },
+        },
+        embedding_func=EmbeddingFunc(DIM, 8192, embed),
+        meta_fields=set(meta_fields),
+    )
+
+
+async def insert(storage, rows):
+    await storage.upsert({f"id{row}": {"content": f"v{row}"} for row in rows})
+
+
+async def nearest(storage, row, top_k=1):
+    return [r["id"] for r in await storage.query(f"v{row}", top_k=top_k)]
+
+
+# === COMPACTION ===
+
+
+@pytest.mark.asyncio
+async def test_compaction_drops_dead_rows_and_survives_reload(tmp_path):
+    storage = make_storage(tmp_path)
+    await insert(storage, range(8))
+    await storage.delete([f"id{row}" for row in range(4)])
+    await storage.index_done_callback()
+
+    assert storage._matrix.shape[0] == 4
+    for row in range(4, 8):
+        assert await nearest(storage, row) == [f"id{row}"]
+
+    reloaded = make_storage(tmp_path)
+    assert reloaded._matrix.shape[0] == 4
+    for row in range(4, 8):
+        assert await nearest(reloaded, row) == [f"id{row}"]
+    # only the current generation's matrix is left
+    assert sorted(f for f in os.listdir(tmp_path) if f.endswith(".npy")) == [
+        "vdb_test.gen1.npy"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_crash_before_commit_keeps_previous_generation(tmp_path, monkeypatch):
+    storage = make_storage(tmp_path)
+    await insert(storage, range(8))
+    await storage.delete([f"id{row}" for row in range(4)])
+
+    real_replace = os.replace
+
+    def crash_on_meta(src, dst):
+        if dst.endswith(".meta.jsonl"):
+            raise OSError("simulated crash")
+        real_replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", crash_on_meta)
+    with pytest.raises(OSError):
+        await storage.compact()
+    monkeypatch.setattr(os, "replace", real_replace)
+
+    reloaded = make_storage(tmp_path)
+    assert reloaded._generation == 0
+    for row in range(4, 8):
+        assert await nearest(reloaded, row) == [f"id{row}"]
+    # the uncommitted generation is cleaned up
+    assert not os.path.exists(tmp_path / "vdb_test.gen1.npy")
+
+
+@pytest.mark.asyncio
+async def test_writes_during_compaction_are_kept(tmp_path):
+    storage = make_storage(tmp_path)
+    await insert(storage, range(8))
+    await storage.delete([f"id{row}" for row in range(4)])
+    # compaction writes in a thread; the upsert and delete run meanwhile
+    await asyncio.gather(
+        storage.compact(), insert(storage, [8]), storage.delete(["id4"])
+    )
+
+    reloaded = make_storage(tmp_path)
+    assert sorted(reloaded._rows) == ["id5", "id6", "id7", "id8"]
+    assert await nearest(reloaded, 8) == ["id8"]
+
+
+# === IVF ===
+
+IVF = {"ann_index": "ivf", "ann_min_rows": 0, "ann_nlist": 4}
+
+
+@pytest.mark.asyncio
+async def test_ivf_matches_exact_search_when_probing_every_list(tmp_path):
+    (tmp_path / "exact").mkdir()
+    (tmp_path / "ivf").mkdir()
+    exact = make_storage(tmp_path / "exact")
+    ivf = make_storage(tmp_path / "ivf", ann_nprobe=4, **IVF)
+    for storage in (exact, ivf):
+        await insert(storage, range(48))
+        await storage.index_done_callback()
+    assert ivf._ivf is not None and len(ivf._ivf.centroids) == 4
+    for row in range(0, 48, 6):
+        assert await nearest(ivf, row, top_k=5) == await nearest(exact, row, top_k=5)
+
+
+@pytest.mark.asyncio
+async def test_ivf_is_reloaded_and_extended_with_later_rows(tmp_path):
+    storage = make_storage(tmp_path, ann_nprobe=1, **IVF)
+    await insert(storage, range(48))
+    await storage.index_done_callback()
+    # appended after training; assigned to their nearest list
+    await insert(storage, range(48, 56))
+
+    reloaded = make_storage(tmp_path, ann_nprobe=1, **IVF)
+    np.testing.assert_array_equal(reloaded._ivf.centroids, storage._ivf.centroids)
+    np.testing.assert_array_equal(reloaded._ivf.assignments, storage._ivf.assignments)
+    for row in (0, 30, 50):
+        assert await nearest(reloaded, row) == [f"id{row}"]
+
+
+@pytest.mark.asyncio
+async def test_ivf_trained_across_a_compaction_is_discarded(tmp_path, monkeypatch):
+    storage = make_storage(tmp_path, ann_nprobe=4, **IVF)
+    await insert(storage, range(48))
+    await storage.delete([f"id{row}" for row in range(24)])
+
+    started, release = threading.Event(), threading.Event()
+    train = IVFIndex.train
+
+    def slow_train(*args, **kwargs):
+        started.set()
+        release.wait()
+        return train(*args, **kwargs)
+
+    monkeypatch.setattr(IVFIndex, "train", slow_train)
+    training = asyncio.ensure_future(storage._train_ivf(4))
+    await asyncio.to_thread(started.wait)
+    # renumbers the rows while the lists are being trained
+    await storage.compact()
+    release.set()
+    await training
+    assert storage._ivf is None
+
+    await storage.index_done_callback()
+    assert len(storage._ivf.assignments) == storage._matrix.shape[0] == 24
+    assert await nearest(storage, 30) == ["id30"]
+
+
+# === COARSE VECTORS ===
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("coarse", [{"quantization": "int8"}, {"prefilter_dim": 8}])
+async def test_coarse_search_rescores_the_shortlist(tmp_path, coarse):
+    (tmp_path / "exact").mkdir()
+    (tmp_path / "coarse").mkdir()
+    exact = make_storage(tmp_path / "exact")
+    storage = make_storage(tmp_path / "coarse", **coarse)
+    await insert(exact, range(64))
+    await insert(storage, range(64))
+    # a shortlist as large as the namespace returns the exact results
+    full = make_storage(tmp_path / "coarse", rerank_factor=64, **coarse)
+    for row in range(0, 64, 8):
+        assert await nearest(full, row, top_k=3) == await nearest(exact, row, top_k=3)
+        results = await storage.query(f"v{row}", top_k=3)
+        assert results[0]["id"] == f"id{row}"
+        # returned distances are full-precision scores, not coarse ones
+        for result in results:
+            vector = VECTORS[int(result["id"][2:])]
+            assert result["distance"] == pytest.approx(
+                float(vector @ VECTORS[row])
+                / np.linalg.norm(vector)
+                / np.linalg.norm(VECTORS[row]),
+                abs=1e-5,
+            )
+
+
+@pytest.mark.asyncio
+async def test_coarse_copy_is_rebuilt_when_missing(tmp_path):
+    storage = make_storage(tmp_path, quantization="int8")
+    await insert(storage, range(16))
+    assert storage._coarse[0].dtype == np.uint8
+    os.remove(tmp_path / "vdb_test.int8.npy")
+
+    reloaded = make_storage(tmp_path, quantization="int8")
+    assert len(reloaded._coarse[0]) == reloaded._matrix.shape[0]
+    assert await nearest(reloaded, 5) == ["id5"]
+
+
+def test_invalid_coarse_options_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        make_storage(tmp_path, quantization="int4")
+    with pytest.raises(ValueError):
+        make_storage(tmp_path, prefilter_dim=DIM)
+    with pytest.raises(ValueError):
+        make_storage(tmp_path, quantization="int8", prefilter_dim=8)
+
+
+# === FILTERS ===
+
+
+async def insert_with_parity(storage, rows):
+    await storage.upsert(
+        {
+            f"id{row}": {"content": f"v{row}", "parity": "odd" if row % 2 else "even"}
+            for row in rows
+        }
+    )
+
+
+async def matching(storage, row, filter):
+    return [r["id"] for r in await storage.query(f"v{row}", top_k=64, filter=filter)]
+
+
+@pytest.mark.asyncio
+async def test_filter_is_applied_before_the_top_k_cut(tmp_path):
+    storage = make_storage(tmp_path, meta_fields={"parity"})
+    await insert_with_parity(storage, range(16))
+    results = await storage.query("v3", top_k=4, filter={"parity": "odd"})
+    assert len(results) == 4
+    assert {r["parity"] for r in results} == {"odd"}
+    assert results[0]["id"] == "id3"
+
+    # a list accepts any of its values
+    assert len(await matching(storage, 0, {"parity": ["odd", "even"]})) == 16
+    # updates and deletes move rows out of the filter bitmaps
+    await storage.upsert({"id5": {"content": "v5", "parity": "even"}})
+    await storage.delete(["id3"])
+    assert sorted(await matching(storage, 0, {"parity": "odd"})) == sorted(
+        f"id{row}" for row in (1, 7, 9, 11, 13, 15)
+    )
+
+
+@pytest.mark.asyncio
+async def test_filter_survives_reload_and_compaction(tmp_path):
+    storage = make_storage(tmp_path, meta_fields={"parity"})
+    await insert_with_parity(storage, range(16))
+    await storage.delete([f"id{row}" for row in range(8)])
+    await storage.index_done_callback()
+
+    reloaded = make_storage(tmp_path, meta_fields={"parity"})
+    assert sorted(await matching(reloaded, 0, {"parity": "even"})) == sorted(
+        f"id{row}" for row in (8, 10, 12, 14)
+    )
+
+
+@pytest.mark.asyncio
+async def test_filter_on_unknown_field_is_an_error(tmp_path):
+    storage = make_storage(tmp_path, meta_fields={"parity"})
+    await insert_with_parity(storage, range(4))
+    with pytest.raises(ValueError, match="color"):
+        await storage.query("v0", filter={"color": "red"})
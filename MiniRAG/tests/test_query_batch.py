@@ -0,0 +1,64 @@
+import asyncio
+import hashlib
+import re
+
+import numpy as np
+import pytest
+
+from minirag import MiniRAG, QueryParam
+from minirag.utils import EmbeddingFunc
+
+
+class AnsweringLLM:
+    """Answers naive queries, recording how many answers run at once"""
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+
+    async def __call__(self, prompt, system_prompt=None, history_messages=[], **kwargs):
+        if system_prompt is None:
+            # entity extraction during insert
+            return "<|COMPLETE|>"
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(0.01)
+            if "fail" in prompt:
+                raise RuntimeError("llm unavailable")
+            return f"answer: {prompt}"
+        finally:
+            self.running -= 1
+
+
+async def embed(texts):
+    vectors = np.zeros((len(texts), 64))
+    for row, text in enumerate(texts):
+        for word in re.findall(r"\w+", text.lower()):
+            vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % 64] += 1
+    return vectors
+
+
+@pytest.mark.asyncio
+async def test_batch_limits_concurrency_and_keeps_order(tmp_path):
+    llm = AnsweringLLM()
+    rag = MiniRAG(
+        working_dir=str(tmp_path),
+        llm_model_func=llm,
+        embedding_func=EmbeddingFunc(64, 8192, embed),
+        vector_db_storage_cls_kwargs={"cosine_better_than_threshold": 0.01},
+        enable_lexical_search=False,
+    )
+    await rag.ainsert("Alice works at Acme Corp. Acme Corp builds rockets in Paris.")
+
+    queries = [f"what does acme build {i}" for i in range(6)]
+    queries[2] = "acme fail"
+    results = await rag.aquery_batch(queries, QueryParam(mode="naive"), concurrency=2)
+
+    assert [r["query"] for r in results] == queries
+    assert llm.peak == 2
+    assert results[2]["response"] is None
+    assert results[2]["error"] == "llm unavailable"
+    for i in (0, 1, 3, 4, 5):
+        assert results[i]["error"] is None
+        assert results[i]["response"] == f"answer: {queries[i]}"
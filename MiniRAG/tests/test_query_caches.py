@@ -0,0 +1,48 @@
+import pytest
+
+from minirag.operate import _rerank_chunks
+from minirag.utils import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert len(cache) == 2
+
+
+def make_reranker(score_of):
+    calls = []
+
+    async def rerank(query, documents):
+        calls.append(list(documents))
+        return [score_of(document) for document in documents]
+
+    return rerank, calls
+
+
+CHUNKS = [{"content": "short"}, {"content": "a much longer chunk"}]
+
+
+@pytest.mark.asyncio
+async def test_rerank_scores_are_cached_per_owner():
+    by_length, length_calls = make_reranker(len)
+    by_shortness, shortness_calls = make_reranker(lambda d: -len(d))
+    first_cache, second_cache = LRUCache(16), LRUCache(16)
+
+    ids, _ = await _rerank_chunks("q", ["c1", "c2"], CHUNKS, by_length, 1, first_cache)
+    assert ids == ["c2"]
+    ids, _ = await _rerank_chunks("q", ["c1", "c2"], CHUNKS, by_length, 1, first_cache)
+    assert ids == ["c2"]
+    assert len(length_calls) == 1
+
+    # another instance with another model does not see the first one's scores
+    ids, _ = await _rerank_chunks(
+        "q", ["c1", "c2"], CHUNKS, by_shortness, 1, second_cache
+    )
+    assert ids == ["c1"]
+    assert len(shortness_calls) == 1
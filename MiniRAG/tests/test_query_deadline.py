@@ -0,0 +1,127 @@
+import asyncio
+import gc
+import hashlib
+import json
+import re
+
+import numpy as np
+import pytest
+
+from minirag import MiniRAG, QueryParam
+from minirag import minirag as minirag_module
+from minirag.utils import EmbeddingFunc
+
+EXTRACTION = (
+    '("entity"<|>"ALICE"<|>"PERSON"<|>"Alice is a person")##'
+    '("entity"<|>"ACME CORP"<|>"ORGANIZATION"<|>"Acme builds rockets")##'
+    '("relationship"<|>"ALICE"<|>"ACME CORP"<|>"Alice works at Acme"<|>"work"<|>2)'
+    "<|COMPLETE|>"
+)
+
+
+class SlowKeywordLLM:
+    """Answers with the kind of context it was given; keyword extraction
+    takes keyword_delay seconds"""
+
+    def __init__(self):
+        self.keyword_delay = 0
+
+    async def __call__(self, prompt, system_prompt=None, history_messages=[], **kwargs):
+        if prompt.startswith("-Goal-"):
+            return EXTRACTION
+        if "Answer type pool" in prompt:
+            await asyncio.sleep(self.keyword_delay)
+            return json.dumps(
+                {
+                    "answer_type_keywords": ["ORGANIZATION"],
+                    "entities_from_query": ["Alice"],
+                }
+            )
+        if system_prompt is None:
+            return "no"
+        if "documents provided" in system_prompt:
+            return "naive answer"
+        return "graph answer"
+
+
+async def embed(texts):
+    vectors = np.zeros((len(texts), 64))
+    for row, text in enumerate(texts):
+        for word in re.findall(r"\w+", text.lower()):
+            vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % 64] += 1
+    return vectors
+
+
+async def make_rag(working_dir):
+    llm = SlowKeywordLLM()
+    rag = MiniRAG(
+        working_dir=str(working_dir),
+        llm_model_func=llm,
+        embedding_func=EmbeddingFunc(64, 8192, embed),
+        vector_db_storage_cls_kwargs={"cosine_better_than_threshold": 0.01},
+        enable_lexical_search=False,
+    )
+    await rag.ainsert("Alice works at Acme Corp. Acme Corp builds rockets.")
+    return rag, llm
+
+
+@pytest.mark.asyncio
+async def test_graph_answer_within_the_deadline(tmp_path):
+    rag, _ = await make_rag(tmp_path)
+    result = await rag.aquery(
+        "Where does Alice work?", QueryParam(mode="mini", deadline_ms=10000)
+    )
+    assert result == {"response": "graph answer", "degraded": False}
+
+
+@pytest.mark.asyncio
+async def test_slow_graph_stages_fall_back_to_naive_retrieval(tmp_path):
+    rag, llm = await make_rag(tmp_path)
+    llm.keyword_delay = 5
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    result = await rag.aquery(
+        "Where does Alice work?", QueryParam(mode="mini", deadline_ms=200)
+    )
+    assert result == {"response": "naive answer", "degraded": True}
+    # the graph stages were cancelled, not awaited
+    assert loop.time() - start < 2
+
+    # context-only queries return the naive context
+    context = await rag.aquery(
+        "Where does Alice work?",
+        QueryParam(mode="mini", deadline_ms=200, only_need_context=True),
+    )
+    assert context["degraded"] is True
+    assert "Alice works at Acme Corp" in context["response"]
+
+
+@pytest.mark.asyncio
+async def test_naive_queries_are_never_degraded(tmp_path):
+    rag, llm = await make_rag(tmp_path)
+    llm.keyword_delay = 5
+    result = await rag.aquery(
+        "Where does Alice work?", QueryParam(mode="naive", deadline_ms=1)
+    )
+    assert result == {"response": "naive answer", "degraded": False}
+
+
+@pytest.mark.asyncio
+async def test_failed_naive_retrieval_is_observed_when_unused(tmp_path, monkeypatch):
+    rag, _ = await make_rag(tmp_path)
+
+    async def failing_naive_query(*args, **kwargs):
+        raise RuntimeError("chunk store unavailable")
+
+    monkeypatch.setattr(minirag_module, "naive_query", failing_naive_query)
+    unhandled = []
+    asyncio.get_running_loop().set_exception_handler(
+        lambda loop, context: unhandled.append(context["message"])
+    )
+    result = await rag.aquery(
+        "Where does Alice work?", QueryParam(mode="mini", deadline_ms=10000)
+    )
+    assert result == {"response": "graph answer", "degraded": False}
+    await asyncio.sleep(0)
+    gc.collect()
+    assert unhandled == []
@@ -2,6 +2,7 @@ import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 from weaviate.exceptions import WeaviateQueryException
 from minirag.kg.weaviate_impl import (
+    _client_pools,
     run_sync,
     WeaviateVectorStorage,
     WeaviateKVStorage,
@@ -91,7 +92,8 @@ async def test_vector_storage_methods(mock_client_class):
 
     # Test upsert
     await vec.upsert({"doc1": {"content": "hello"}})
-    mock_client.data_object.create.assert_called_with({"content": "hello"}, "Document", "doc1")
+    batch = mock_client.batch.__enter__.return_value
+    batch.add_data_object.assert_called_with({"content": "hello"}, "Document", uuid="doc1")
 
     # Test query
     results = await vec.query("hello", top_k=1)
@@ -113,6 +115,30 @@ async def test_vector_storage_methods(mock_client_class):
     mock_client.schema.contains.assert_called_with({"class": "Document"})
     mock_client.schema.create_class.assert_called()
 
+@pytest.mark.asyncio
+@patch("minirag.kg.weaviate_impl.weaviate.Client")
+async def test_vector_upsert_reports_batch_errors(mock_client_class):
+    mock_client = mock_weaviate_client()
+    mock_client_class.return_value = mock_client
+
+    vec = WeaviateVectorStorage(
+        namespace="dummy",
+        global_config=MagicMock(),
+        embedding_func=MagicMock()
+    )
+    mock_client.batch.configure.assert_called_with(
+        batch_size=100, dynamic=True, callback=vec._record_batch_errors
+    )
+
+    # the client hands each flushed batch's results to the callback
+    failure = [{"id": "doc1", "result": {"errors": {"error": [{"message": "invalid"}]}}}]
+    mock_client.batch.__exit__.side_effect = lambda *args: vec._record_batch_errors(failure)
+    assert vec._import_objects([("doc1", {"content": "hello"})]) == [("doc1", ["invalid"])]
+    await vec.upsert({"doc1": {"content": "hello"}})
+
+    # the shared batch object is only ever used from one thread
+    assert _client_pools._write_pool._max_workers == 1
+
 # === KV STORAGE ===
 
 @pytest.mark.asyncio